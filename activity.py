@@ -0,0 +1,75 @@
+import datetime
+from collections import defaultdict
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, UserActivity
+
+# 種類ごとの (最終日時の列, 件数の列)
+ACTIVITY_COLUMNS = {
+    'request': ('last_request_at', 'request_count'),
+    'sos': ('last_sos_at', 'sos_count'),
+    'message': ('last_message_at', 'message_count'),
+    'post': ('last_post_at', 'post_count'),
+}
+
+
+def _upsert_statement(kind):
+    last_col, count_col = ACTIVITY_COLUMNS[kind]
+    stmt = sqlite_insert(UserActivity)
+    current_last = getattr(UserActivity, last_col)
+    new_last = getattr(stmt.excluded, last_col)
+    return stmt.on_conflict_do_update(
+        index_elements=[UserActivity.user_id],
+        set_={
+            last_col: db.func.max(db.func.coalesce(current_last, new_last), new_last),
+            count_col: getattr(UserActivity, count_col) + getattr(stmt.excluded, count_col),
+        },
+    )
+
+
+def record_activity(kind, user_id, when=None):
+    """ 書き込みと同じトランザクション内で、ユーザーの活動集計を1件分更新する (コミットは呼び出し側) """
+    last_col, count_col = ACTIVITY_COLUMNS[kind]
+    db.session.execute(_upsert_statement(kind), {
+        'user_id': user_id, last_col: when or datetime.datetime.now(), count_col: 1,
+    })
+
+
+def record_activity_batch(connection, kind, items):
+    """ グループコミット用: items ({'user_id', 'timestamp'}) をユーザーごとにまとめて更新する """
+    last_col, count_col = ACTIVITY_COLUMNS[kind]
+    per_user = defaultdict(lambda: [None, 0])
+    for item in items:
+        entry = per_user[item['user_id']]
+        entry[0] = max(entry[0], item['timestamp']) if entry[0] else item['timestamp']
+        entry[1] += 1
+    connection.execute(_upsert_statement(kind), [
+        {'user_id': user_id, last_col: last, count_col: count} for user_id, (last, count) in per_user.items()
+    ])
+
+
+# 既存データからの再集計 (種類ごとに GROUP BY を1回ずつ)
+_REBUILD_SOURCES = {
+    'request': 'SELECT user_id, MAX(timestamp), COUNT(*) FROM support_request GROUP BY user_id',
+    'sos': 'SELECT user_id, MAX(timestamp), COUNT(*) FROM sos_signal GROUP BY user_id',
+    'message': 'SELECT user_id, MAX(timestamp), COUNT(*) FROM ('
+               'SELECT user_id, timestamp FROM chat_message '
+               'UNION ALL SELECT user_id, timestamp FROM group_chat_message) GROUP BY user_id',
+    'post': 'SELECT user_id, MAX(timestamp), COUNT(*) FROM community_post GROUP BY user_id',
+}
+
+
+def rebuild_activity():
+    """ user_activity を全件作り直す。戻り値は集計したユーザー数 """
+    db.session.execute(db.delete(UserActivity))
+    for kind, source in _REBUILD_SOURCES.items():
+        last_col, count_col = ACTIVITY_COLUMNS[kind]
+        # SELECT からの UPSERT は構文の曖昧さを避けるため WHERE true が必要
+        db.session.execute(db.text(
+            f'INSERT INTO user_activity (user_id, {last_col}, {count_col}) '
+            f'SELECT * FROM ({source}) WHERE true '
+            f'ON CONFLICT(user_id) DO UPDATE SET {last_col} = excluded.{last_col}, {count_col} = excluded.{count_col}'
+        ))
+    db.session.commit()
+    return db.session.execute(db.select(db.func.count()).select_from(UserActivity)).scalar()
@@ -0,0 +1,301 @@
+import datetime
+from functools import wraps
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, jsonify, stream_with_context, current_app
+from flask_login import login_required, current_user
+
+from extensions import login_manager
+from models import db, PRIORITY_RANKS, REQUEST_STATUSES, User, UserActivity, SupportRequest, Group, Shelter, ShelterLog
+from forms import CATEGORY_CHOICES, PRIORITY_CHOICES
+from pagination import keyset_page
+from streaming import csv_chunks, gzip_chunks
+from page_cache import page_cache
+from replica import replica
+from metrics import metrics
+from situation import situation
+from triage import triage_page
+from shelters import checkin_code
+from shelter_data import EXPORT_COLUMNS, ShelterImportError, import_shelters as import_shelter_file, export_rows, json_lines
+import groups as group_service
+
+# 管理者用の画面・API (/admin/...)
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+
+def admin_required(f):
+    """ 管理者(is_admin=True)のみアクセスを許可するデコレータ """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        if not current_user.is_admin:
+            flash('このページにアクセスする権限がありません。', 'danger')
+            return redirect(url_for('auth.home'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@bp.route('')
+@login_required
+@admin_required
+def menu():
+    """ 管理者メニュー画面 """
+    return render_template('admin/menu.html', title='管理者メニュー')
+
+@bp.route('/dashboard')
+@login_required
+@admin_required
+def dashboard():
+    """ 状況ダッシュボード (支援要請・SOS の集計。開いている間は SSE で更新される) """
+    snapshot = None
+    try:
+        snapshot = situation.snapshot()
+    except Exception as e:
+        current_app.logger.error(f"Situation board error: {e}"); flash('集計の取得に失敗しました。', 'danger')
+    return render_template('admin/dashboard.html', title='状況ダッシュボード', snapshot=snapshot,
+                           categories=CATEGORY_CHOICES, priorities=PRIORITY_CHOICES)
+
+@bp.route('/dashboard/stream')
+@login_required
+@admin_required
+def dashboard_stream():
+    """ ダッシュボードの集計を SSE で配信 """
+    stream = situation.stream(current_app.config['SSE_KEEPALIVE_SECONDS'], current_app.config['SSE_MAX_STREAM_SECONDS'])
+    return Response(stream_with_context(stream), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/users')
+@login_required
+@admin_required
+@replica.read_only
+def user_management():
+    """ 登録ユーザー管理画面 (活動集計テーブルとの結合 / ユーザーID順のページ送り) """
+    after_id = request.args.get('after', 0, type=int)
+    limit = current_app.config['FEED_PAGE_SIZE']
+    users_with_activity, next_after = [], None
+    try:
+        users_with_activity = db.session.query(User, UserActivity).outerjoin(UserActivity, User.id == UserActivity.user_id) \
+            .filter(User.id > after_id).order_by(User.id).limit(limit + 1).all()
+        if len(users_with_activity) > limit:
+            users_with_activity = users_with_activity[:limit]; next_after = users_with_activity[-1][0].id
+    except Exception as e:
+        current_app.logger.error(f"User management fetch error: {e}"); flash('ユーザー情報取得失敗', 'danger')
+    return render_template('admin/user_management.html', title='登録ユーザー管理', users=users_with_activity, next_after=next_after, is_first_page=after_id == 0)
+
+@bp.route('/sos_reports')
+@login_required
+@admin_required
+@replica.read_only
+def sos_reports():
+    """ SOSレポート確認画面 (優先度順のトリアージキュー / 絞り込み・ページ送り) """
+    filters = {
+        'status': request.args.get('status', 'open'),
+        'category': request.args.get('category') or None,
+        'priority': request.args.get('priority') or None,
+    }
+    if filters['status'] not in REQUEST_STATUSES: filters['status'] = None  # 'all'
+    if filters['priority'] not in PRIORITY_RANKS: filters['priority'] = None
+    reports, next_cursor = [], None
+    try:
+        reports, next_cursor = triage_page(cursor=request.args.get('cursor'), limit=current_app.config['FEED_PAGE_SIZE'], **filters)
+    except Exception as e:
+        current_app.logger.error(f"SOS reports fetch error: {e}"); flash('SOSレポート取得失敗', 'danger')
+    return render_template('admin/sos_reports.html', title='SOSレポート確認', reports=reports, next_cursor=next_cursor,
+                           filters=filters, categories=CATEGORY_CHOICES)
+
+@bp.route('/sos_reports/<int:report_id>/status', methods=['POST'])
+@login_required
+@admin_required
+def update_report_status(report_id):
+    """ 支援要請を対応済み/未対応に切り替える """
+    status = request.form.get('status')
+    if status not in REQUEST_STATUSES:
+        flash('ステータスの指定が不正です。', 'danger')
+    else:
+        try:
+            db.session.execute(db.update(SupportRequest).where(SupportRequest.id == report_id).values(status=status)); db.session.commit()
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Report status update error: {e}"); flash('ステータス更新エラー', 'danger')
+    next_page = request.form.get('next', '')
+    if not next_page.startswith('/') or next_page.startswith('//'): next_page = url_for('admin.sos_reports')
+    return redirect(next_page)
+
+@bp.route('/export_csv')
+@login_required
+@admin_required
+@replica.read_only
+def export_csv():
+    """ SOSレポートをCSVエクスポート (ストリーミング / 期間・優先度で絞り込み / gzip 任意) """
+    try:
+        start = request.args.get('start') or None
+        end = request.args.get('end') or None
+        start = datetime.datetime.strptime(start, '%Y-%m-%d') if start else None
+        end = datetime.datetime.strptime(end, '%Y-%m-%d') + datetime.timedelta(days=1) if end else None
+    except ValueError:
+        flash('日付は YYYY-MM-DD 形式で指定してください。', 'danger'); return redirect(url_for('admin.sos_reports'))
+    priority = request.args.get('priority') or None
+    if priority not in (None, 'high', 'medium', 'low'):
+        flash('優先度の指定が不正です。', 'danger'); return redirect(url_for('admin.sos_reports'))
+    use_gzip = request.args.get('gzip') == '1'
+
+    stmt = db.select(SupportRequest.id, User.username, SupportRequest.category, SupportRequest.priority, SupportRequest.details, SupportRequest.timestamp) \
+        .outerjoin(User, SupportRequest.user_id == User.id).order_by(SupportRequest.id.asc())
+    if start: stmt = stmt.where(SupportRequest.timestamp >= start)
+    if end: stmt = stmt.where(SupportRequest.timestamp < end)
+    if priority: stmt = stmt.where(SupportRequest.priority == priority)
+    stmt = stmt.execution_options(yield_per=current_app.config['CSV_EXPORT_BATCH_SIZE'])
+
+    def batches():
+        # yield_per によりサーバー側でバッチ単位に取得し、全件をメモリに載せない
+        try:
+            for partition in db.session.execute(stmt).partitions():
+                yield [[r.id, r.username or 'N/A', r.category, r.priority, r.details, r.timestamp.strftime('%Y-%m-%d %H:%M:%S') if r.timestamp else ''] for r in partition]
+        except Exception as e:
+            current_app.logger.error(f"CSV Export error: {e}"); raise
+        finally:
+            db.session.close()
+
+    body = csv_chunks(['ID', 'ユーザー名', 'カテゴリ', '優先度', '詳細', 'タイムスタンプ'], batches())
+    if use_gzip:
+        return Response(stream_with_context(gzip_chunks(body)), mimetype="application/gzip", headers={"Content-disposition": "attachment; filename=sos_reports.csv.gz"})
+    return Response(stream_with_context(body), mimetype="text/csv", headers={"Content-disposition": "attachment; filename=sos_reports.csv"})
+
+
+@bp.route('/api/groups/<int:group_id>/members', methods=['POST'])
+@login_required
+@admin_required
+def group_members_api(group_id):
+    """ グループメンバーの一括追加・削除 API。JSON: {"add": [user_id, ...], "remove": [user_id, ...]} """
+    group = db.session.get(Group, group_id)
+    if not group: return jsonify(error='グループが見つかりません'), 404
+    data = request.get_json(silent=True) or {}
+    add_ids, remove_ids = data.get('add', []), data.get('remove', [])
+    if not all(isinstance(i, int) for i in [*add_ids, *remove_ids]):
+        return jsonify(error='add / remove にはユーザーIDの配列を指定してください'), 400
+    try:
+        added = group_service.add_members(group_id, add_ids) if add_ids else 0
+        removed = group_service.remove_members(group_id, remove_ids) if remove_ids else 0
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback(); current_app.logger.error(f"Group member update error: {e}")
+        return jsonify(error='メンバー更新エラー'), 500
+    member_count = db.session.execute(db.select(Group.member_count).where(Group.id == group_id)).scalar()
+    return jsonify(added=added, removed=removed, member_count=member_count)
+
+
+@bp.route('/shelters', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def shelter_management():
+    """ 避難所を登録・管理する画面 (シンプル版) """
+    if request.method == 'POST':
+        name = request.form.get('name')
+        capacity = request.form.get('capacity', type=int)
+        latitude = request.form.get('latitude', type=float); longitude = request.form.get('longitude', type=float)
+        if not name or not capacity or capacity <= 0:
+            flash('避難所名と有効な収容可能人数は必須です。', 'danger')
+            return redirect(url_for('admin.shelter_management'))
+        if (latitude is None) != (longitude is None) or (latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180)):
+            flash('緯度と経度は両方とも有効な値を入力してください。', 'danger')
+            return redirect(url_for('admin.shelter_management'))
+        if Shelter.query.filter_by(name=name).first():
+            flash(f'避難所「{name}」は既に登録されています。', 'danger')
+            return redirect(url_for('admin.shelter_management'))
+        try:
+            new_shelter = Shelter(name=name, capacity=capacity, latitude=latitude, longitude=longitude)
+            db.session.add(new_shelter)
+            db.session.commit()
+            page_cache.bump('shelters')
+            flash(f'避難所「{name}」を登録しました。', 'success')
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Shelter registration error: {e}")
+            flash('避難所の登録中にエラーが発生しました。', 'danger')
+        return redirect(url_for('admin.shelter_management'))
+    # GETリクエスト時
+    return shelter_management_page()
+
+def shelter_management_page(import_report=None):
+    try:
+        shelters = Shelter.query.order_by(Shelter.id.asc()).all()
+    except Exception as e:
+        current_app.logger.error(f"Error fetching shelters: {e}")
+        shelters = []
+        flash('避難所情報の取得に失敗しました。', 'danger')
+    # テンプレート名を修正 (元の shelter_management.html を使う)
+    return render_template('admin/shelter_management.html', title='避難所管理', shelters=shelters, checkin_code=checkin_code,
+                           import_report=import_report)
+
+@bp.route('/shelters/import', methods=['POST'])
+@login_required
+@admin_required
+def import_shelters():
+    """ 避難所一覧の CSV / JSON を一括で取り込む (避難所名で登録・更新し、不正な行は一覧で表示) """
+    # ファイルの最大サイズ (SHELTER_IMPORT_MAX_BYTES) は app.py の limit_request_size で設定している
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('取り込むファイルを選択してください。', 'danger'); return redirect(url_for('admin.shelter_management'))
+    file_format = request.form.get('format') or ('json' if upload.filename.lower().endswith(('.json', '.jsonl', '.geojson')) else 'csv')
+    encoding = request.form.get('encoding', 'auto')
+    if file_format not in ('csv', 'json') or encoding not in ('auto', 'utf-8-sig', 'cp932'):
+        flash('ファイル形式・文字コードの指定が不正です。', 'danger'); return redirect(url_for('admin.shelter_management'))
+    dry_run = request.form.get('dry_run') == '1'
+    try:
+        report = import_shelter_file(upload.stream, file_format, encoding, dry_run)
+    except ShelterImportError as e:
+        flash(str(e), 'danger'); return redirect(url_for('admin.shelter_management'))
+    except Exception as e:
+        current_app.logger.error(f"Shelter import error: {e}"); flash('避難所の取り込み中にエラーが発生しました。', 'danger')
+        return redirect(url_for('admin.shelter_management'))
+    if not dry_run and (report.inserted or report.updated):
+        page_cache.bump('shelters')
+    flash(report.summary, 'danger' if report.error_count else 'success')
+    return shelter_management_page(report)
+
+@bp.route('/shelters/export')
+@login_required
+@admin_required
+@replica.read_only
+def export_shelters():
+    """ 避難所一覧を取り込みと同じ列で出力 (ストリーミング / ?format=csv または jsonl) """
+    file_format = request.args.get('format', 'csv')
+    if file_format not in ('csv', 'jsonl'):
+        flash('ファイル形式の指定が不正です。', 'danger'); return redirect(url_for('admin.shelter_management'))
+
+    def batches():
+        try:
+            yield from export_rows(current_app.config['CSV_EXPORT_BATCH_SIZE'])
+        except Exception as e:
+            current_app.logger.error(f"Shelter export error: {e}"); raise
+        finally:
+            db.session.close()
+
+    if file_format == 'jsonl':
+        return Response(stream_with_context(json_lines(batches())), mimetype="application/x-ndjson", headers={"Content-disposition": "attachment; filename=shelters.jsonl"})
+    return Response(stream_with_context(csv_chunks(EXPORT_COLUMNS, batches())), mimetype="text/csv", headers={"Content-disposition": "attachment; filename=shelters.csv"})
+
+@bp.route('/shelter_reports')
+@login_required
+@admin_required
+@replica.read_only
+def shelter_reports():
+    """ 避難所の受付ログ (新しい順、?before= で古いページへ) """
+    page = None
+    try:
+        query = ShelterLog.query.options(db.joinedload(ShelterLog.shelter), db.joinedload(ShelterLog.author))
+        page = keyset_page(query, ShelterLog, request.args.get('before'), current_app.config['FEED_PAGE_SIZE'])
+        logs = page.items
+    except Exception as e:
+        current_app.logger.error(f"Error fetching shelter logs: {e}")
+        logs = []
+        flash('受付ログの取得に失敗しました。', 'danger')
+    return render_template('admin/shelter_reports.html', title='避難所受付データ', logs=logs, page=page)
+
+@bp.route('/metrics', endpoint='metrics')
+@login_required
+@admin_required
+def prometheus_metrics():
+    """ ルートごとの処理時間・SQL・テンプレート描画時間 (Prometheus のテキスト形式) """
+    if not current_app.config['METRICS_ENABLED']:
+        return Response('メトリクスは無効です\n', status=404, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
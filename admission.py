@@ -0,0 +1,167 @@
+import math
+import threading
+import time
+
+from flask import g, request, jsonify, make_response
+from flask_login import current_user
+
+from cache import TTLCache
+from metrics import metrics, Counter, Gauge
+
+# 優先度クラス。critical は同時処理数・回数とも制限しない
+CRITICAL, NORMAL, LOW, STREAM = 'critical', 'normal', 'low', 'stream'
+PRIORITY_CLASSES = (CRITICAL, NORMAL, LOW, STREAM)
+
+# エンドポイントごとの優先度 (ここに無いものは normal)
+ENDPOINT_PRIORITY = {
+    # SOS・避難所の受付と、SOS を送るための画面
+    'disaster.send_sos': CRITICAL,
+    'disaster.emergency_sos': CRITICAL,
+    'disaster.shelter_checkin': CRITICAL,
+    'admin.metrics': CRITICAL,  # 過負荷の最中でも監視できるように
+    # 再読み込み・投稿が集中しやすいもの
+    'communication.chat': LOW,
+    'communication.community': LOW,
+    'communication.search': LOW,
+    'communication.group_chat': LOW,
+    'communication.api_sync': LOW,
+    'communication.api_chat': LOW,
+    'communication.api_posts': LOW,
+    'communication.api_group_chat': LOW,
+    'communication.api_requests': LOW,
+    'communication.api_shelters': LOW,
+    'admin.export_csv': LOW,
+    'admin.export_shelters': LOW,
+    # SSE は接続中ずっとスレッドを使うため、同時接続数を別に数える
+    'communication.chat_stream': STREAM,
+    'communication.group_chat_stream': STREAM,
+    'admin.dashboard_stream': STREAM,
+}
+# メソッドによって優先度が変わるもの
+METHOD_PRIORITY = {
+    ('disaster.safety_check', 'POST'): CRITICAL,  # 支援要請の送信 (一覧の表示は normal)
+}
+
+
+def classify(endpoint, method):
+    return METHOD_PRIORITY.get((endpoint, method)) or ENDPOINT_PRIORITY.get(endpoint, NORMAL)
+
+
+class AdmissionControl:
+    """
+    リクエストを処理する前に受け付けるかを決め、過負荷時は低い優先度のものをすぐに断る。
+
+      - 同時処理数: 優先度クラスごとに上限 (ADMISSION_CONCURRENCY) を設け、超えたら 503。
+        critical 以外の上限の合計をワーカーのスレッド数より小さくしておくことで、
+        SOS・支援要請の送信には常に空いたスレッドが残る (待ち行列に並ばない)
+      - 回数: トークンバケットで、ログインユーザー × エンドポイント (ADMISSION_USER_RATES) と
+        エンドポイント全体 (ADMISSION_ROUTE_RATES) の回数を制限し、超えたら 429
+
+    断る場合は待たせずに Retry-After をつけて返す。状態はプロセスごとに持ち、/admin/metrics で参照できる。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.concurrency = {}
+        self.user_rates = {}
+        self.route_rates = {}
+        self.busy_retry_after = 1
+        self.in_flight = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self._buckets = TTLCache()
+        self._lock = threading.Lock()
+        self.admitted = Counter('admission_admitted_total', '受け付けたリクエストの数', ('class',))
+        self.rejected = Counter('admission_rejected_total', '断ったリクエストの数', ('class', 'reason'))
+        self.gauges = [
+            Gauge('admission_in_flight', '処理中のリクエストの数', ('class',),
+                  lambda: {(name,): count for name, count in self.in_flight.items()}),
+            Gauge('admission_concurrency_limit', '同時処理数の上限 (0 = 上限なし)', ('class',),
+                  lambda: {(name,): self.concurrency.get(name, 0) for name in PRIORITY_CLASSES}),
+            Gauge('admission_rate_buckets', '保持しているトークンバケットの数', (),
+                  lambda: {(): len(self._buckets)}),
+        ]
+
+    def init_app(self, app):
+        self.enabled = app.config['ADMISSION_ENABLED']
+        self.concurrency = dict(app.config['ADMISSION_CONCURRENCY'])
+        self.user_rates = dict(app.config['ADMISSION_USER_RATES'])
+        self.route_rates = dict(app.config['ADMISSION_ROUTE_RATES'])
+        self.busy_retry_after = app.config['ADMISSION_BUSY_RETRY_AFTER']
+        # 満杯まで回復したバケットは捨てても同じなので、回復にかかる最長の時間だけ保持する
+        refill = [burst / rate for rate, burst in (*self.user_rates.values(), *self.route_rates.values())]
+        self._buckets.configure(app.config['ADMISSION_MAX_BUCKETS'], max(refill, default=60))
+        for collector in (self.admitted, self.rejected, *self.gauges):
+            metrics.register(collector)
+        if self.enabled:
+            app.before_request(self._admit)
+            app.teardown_request(self._release)
+
+    def _admit(self):
+        endpoint = request.endpoint
+        if endpoint is None:  # 404 等
+            return None
+        priority = classify(endpoint, request.method)
+        if priority != CRITICAL:
+            # 避難所の Wi-Fi 等で多くの人が同じ IP になるため、未ログインのリクエストはユーザーごとには数えない
+            if current_user.is_authenticated:
+                wait = self._take(('user', current_user.id, endpoint), self._rate(self.user_rates, endpoint, priority))
+                if wait:
+                    return self._reject(priority, 'user_rate', 429, wait)
+            wait = self._take(('route', endpoint), self._rate(self.route_rates, endpoint, priority))
+            if wait:
+                return self._reject(priority, 'route_rate', 429, wait)
+        limit = self.concurrency.get(priority, 0)
+        with self._lock:
+            if limit and self.in_flight[priority] >= limit:
+                busy = True
+            else:
+                busy = False
+                self.in_flight[priority] += 1
+        if busy:
+            return self._reject(priority, 'concurrency', 503, self.busy_retry_after)
+        g._admission_class = priority
+        self.admitted.inc((priority,))
+        return None
+
+    def _release(self, exc):
+        # SSE 等のストリームでは配信が終わったときに呼ばれる
+        priority = g.pop('_admission_class', None)
+        if priority is not None:
+            with self._lock:
+                self.in_flight[priority] -= 1
+
+    @staticmethod
+    def _rate(rates, endpoint, priority):
+        return rates.get(endpoint) or rates.get(priority)
+
+    def _take(self, key, rate):
+        """ トークンを1つ使う。足りなければ次のトークンが貯まるまでの秒数を返す (使えたら 0) """
+        if rate is None:
+            return 0
+        per_second, burst = rate
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * per_second)
+            wait = 0 if tokens >= 1 else (1 - tokens) / per_second
+            self._buckets.set(key, (tokens if wait else tokens - 1, now))
+        return wait
+
+    def _reject(self, priority, reason, status, retry_after):
+        self.rejected.inc((priority, reason))
+        retry_after = max(1, math.ceil(retry_after))
+        if status == 429:
+            message = f'リクエストが多すぎます。{retry_after}秒後にもう一度お試しください。'
+        else:
+            message = f'アクセスが集中しています。{retry_after}秒後にもう一度お試しください。'
+        if request.path.startswith('/api/') or request.headers.get('X-Requested-With') == 'fetch' \
+                or request.accept_mimetypes.best == 'application/json':
+            response = jsonify(error=message, retry_after=retry_after)
+        else:
+            response = make_response(message)
+            response.mimetype = 'text/plain'
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+
+admission = AdmissionControl()
@@ -0,0 +1,146 @@
+"""
+古いチャット・グループチャット・コミュニティ投稿をアーカイブ用の別 DB に移す。
+
+  - flask archive-history --days N で N 日より前の行を移し、本体のテーブルからは削除する
+  - 行は ARCHIVE_SEGMENT_ROWS 件ずつ (グループチャットはグループごとに) 1つのセグメントにまとめて圧縮する
+  - 履歴の表示で本体のテーブルに残っている分を読み終えたら、続きをアーカイブから読む (keyset_page の older)
+
+本体から削除する際に全文検索のトリガーも動くため、アーカイブ済みの行は検索の対象外になる。
+また flask rebuild-activity は本体のテーブルだけを数える。
+"""
+import datetime
+import json
+import zlib
+from collections import defaultdict
+
+from models import db, User, ChatMessage, GroupChatMessage, CommunityPost, ArchiveSegment
+
+ARCHIVE_SOURCES = {
+    'chat': ChatMessage,
+    'group_chat': GroupChatMessage,
+    'posts': CommunityPost,
+}
+
+DEFAULT_SEGMENT_ROWS = 500
+
+
+class ArchivedMessage:
+    """ アーカイブから読み出した1行。テンプレートからは元のモデルと同じように扱える """
+
+    __slots__ = ('id', 'user_id', 'group_id', 'timestamp', 'text', 'author')
+
+    def __init__(self, id, user_id, group_id, timestamp, text):
+        self.id = id
+        self.user_id = user_id
+        self.group_id = group_id
+        self.timestamp = timestamp
+        self.text = text
+        self.author = None
+
+
+def _pack(rows):
+    raw = json.dumps([[r.id, r.user_id, r.timestamp.isoformat(), r.text] for r in rows],
+                     ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return zlib.compress(raw, 9)
+
+
+def _unpack(segment):
+    """ セグメントの行を (timestamp, id) の昇順で返す """
+    group_id = segment.group_id or None
+    return [ArchivedMessage(row_id, user_id, group_id, datetime.datetime.fromisoformat(ts), text)
+            for row_id, user_id, ts, text in json.loads(zlib.decompress(segment.payload).decode('utf-8'))]
+
+
+def _segment(kind, group_id, rows):
+    rows = sorted(rows, key=lambda r: (r.timestamp, r.id))
+    return {
+        'kind': kind, 'group_id': group_id, 'row_count': len(rows),
+        'min_id': min(r.id for r in rows), 'max_id': max(r.id for r in rows),
+        'oldest_timestamp': rows[0].timestamp, 'oldest_id': rows[0].id,
+        'newest_timestamp': rows[-1].timestamp, 'newest_id': rows[-1].id,
+        'payload': _pack(rows), 'created_at': datetime.datetime.now(),
+    }
+
+
+def _archived_ids(kind, low, high):
+    """ id が low..high の範囲で既にアーカイブ済みの id (前回の実行が途中で止まった場合の再実行用) """
+    segments = db.session.execute(db.select(ArchiveSegment).where(
+        ArchiveSegment.kind == kind, ArchiveSegment.min_id <= high, ArchiveSegment.max_id >= low)).scalars()
+    return {row.id for segment in segments for row in _unpack(segment)}
+
+
+def _archive_batch(kind, model, rows):
+    """
+    1バッチ分をアーカイブ DB に書き込んでコミットしてから、本体のテーブルから削除する。
+    削除の前に止まっても、次回の実行で既にアーカイブ済みの行は書き込まずに削除だけ行う。
+    """
+    ids = [r.id for r in rows]
+    done = _archived_ids(kind, min(ids), max(ids))
+    by_group = defaultdict(list)
+    for r in rows:
+        if r.id not in done:
+            by_group[getattr(r, 'group_id', None) or 0].append(r)
+    if by_group:
+        with db.engines['archive'].begin() as connection:
+            connection.execute(db.insert(ArchiveSegment),
+                               [_segment(kind, group_id, group_rows) for group_id, group_rows in by_group.items()])
+    db.session.execute(db.delete(model).where(model.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def ensure_archive_db():
+    """ アーカイブ用 DB のテーブルが無ければ作る (履歴の表示で参照するため起動時に呼ぶ) """
+    db.create_all(bind_key='archive')
+
+
+def archive_history(cutoff, segment_rows=DEFAULT_SEGMENT_ROWS, log=print):
+    """ timestamp が cutoff より前の行をアーカイブに移す。戻り値は {種類: 移した件数} """
+    ensure_archive_db()
+    moved = {}
+    for kind, model in ARCHIVE_SOURCES.items():
+        columns = [model.id, model.user_id, model.timestamp, model.text]
+        if model is GroupChatMessage:
+            columns.append(model.group_id)
+        # 古い行ほど id が小さいので、主キー順に先頭から読めばすぐに見つかる
+        query = db.select(*columns).where(model.timestamp < cutoff).order_by(model.id).limit(segment_rows)
+        moved[kind] = 0
+        while True:
+            rows = db.session.execute(query).all()
+            if not rows:
+                break
+            moved[kind] += _archive_batch(kind, model, rows)
+        log(f'{kind}: {moved[kind]}件をアーカイブしました')
+    return moved
+
+
+def archived_before(kind, position, limit, group_id=None):
+    """
+    position ((timestamp, id)。None なら最新) より古いアーカイブ済みの行を新しい順に最大 limit 件返す。
+    keyset_page(..., older=...) から本体のテーブルを読み終えたときに呼ばれる。
+    """
+    query = db.select(ArchiveSegment).where(ArchiveSegment.kind == kind, ArchiveSegment.group_id == (group_id or 0))
+    if position is not None:
+        query = query.where(db.tuple_(ArchiveSegment.oldest_timestamp, ArchiveSegment.oldest_id) < position)
+    query = query.order_by(ArchiveSegment.newest_timestamp.desc(), ArchiveSegment.newest_id.desc())
+
+    rows = []
+    for segment in db.session.execute(query).scalars():
+        # 必要な件数が揃い、残りのセグメントがすべてそれより古ければ終わり
+        if len(rows) >= limit and (segment.newest_timestamp, segment.newest_id) < (rows[limit - 1].timestamp, rows[limit - 1].id):
+            break
+        rows.extend(r for r in _unpack(segment) if position is None or (r.timestamp, r.id) < position)
+        rows.sort(key=lambda r: (r.timestamp, r.id), reverse=True)
+    rows = rows[:limit]
+
+    user_ids = {r.user_id for r in rows}
+    if user_ids:
+        users = {u.id: u for u in db.session.execute(db.select(User).where(User.id.in_(user_ids))).scalars()}
+        for r in rows:
+            r.author = users.get(r.user_id)
+    return rows
+
+
+def archive_reader(kind, group_id=None):
+    """ keyset_page の older に渡す関数 """
+    return lambda position, limit: archived_before(kind, position, limit, group_id)
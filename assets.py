@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import shutil
+import shlex
+import subprocess
+import tempfile
+import urllib.request
+
+from flask import request, url_for
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+SOURCE_DIR = os.path.join(basedir, 'assets')
+VENDOR_DIR = os.path.join(SOURCE_DIR, 'vendor')
+DIST_DIR = os.path.join(basedir, 'static', 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# 外部ライブラリ (バージョン固定)。assets/vendor/ に無ければビルド時に一度だけ取得して保存する
+VENDOR_FILES = {
+    'html5-qrcode.min.js': 'https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js',
+}
+
+# 画面に必要なファイル (論理名)
+REQUIRED_ASSETS = ('app.css', *VENDOR_FILES)
+
+# 未ビルドの開発環境で ASSET_CDN_FALLBACK が有効な場合だけ使う CDN 上のファイル
+CDN_FALLBACKS = {
+    'html5-qrcode.min.js': VENDOR_FILES['html5-qrcode.min.js'],
+}
+
+IMMUTABLE_MAX_AGE = 31536000  # 1年。ファイル名に内容のハッシュが入るため変更されることはない
+
+
+class AssetManifest:
+    """
+    ビルド済みの静的ファイル (static/dist) の論理名 → ハッシュ付きファイル名の対応表。
+    テンプレートからは asset_url('app.css') のように論理名で参照する。
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.cdn_fallback = False
+
+    def init_app(self, app):
+        self.load()
+        self.cdn_fallback = app.config['ASSET_CDN_FALLBACK']
+        missing = [name for name in REQUIRED_ASSETS if name not in self.files]
+        if missing:
+            message = f"静的ファイルがビルドされていません ({', '.join(missing)})。flask build-assets を実行してください"
+            if app.config['ASSETS_REQUIRED']:
+                raise RuntimeError(message)
+            app.logger.warning(message)
+        app.context_processor(lambda: {'asset_url': self.url, 'asset_cdn_fallback': self.cdn_fallback})
+        app.after_request(self._cache_headers)
+
+    def load(self):
+        try:
+            with open(MANIFEST_PATH, encoding='utf-8') as f:
+                self.files = json.load(f)
+        except (OSError, ValueError):
+            self.files = {}
+
+    def url(self, name, fallback=None):
+        """ ビルド済みなら static/dist のハッシュ付き URL、未ビルドなら fallback (CDN を許可していれば CDN、無ければ None) """
+        hashed = self.files.get(name)
+        if hashed is None:
+            if fallback is not None:
+                return fallback
+            return CDN_FALLBACKS.get(name) if self.cdn_fallback else None
+        return url_for('static', filename=f'dist/{hashed}')
+
+    @staticmethod
+    def _cache_headers(response):
+        # ハッシュ付きファイルは内容が変わらないため、ブラウザに再検証させずに使わせる
+        filename = (request.view_args or {}).get('filename', '')
+        if request.endpoint == 'static' and filename.startswith('dist/') and filename != 'dist/manifest.json' \
+                and response.status_code in (200, 304):
+            response.cache_control.no_cache = None  # send_file が付ける既定の no-cache を外す
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+
+def _fingerprint(name, path):
+    """ 内容のハッシュを含むファイル名で dist にコピーし、そのファイル名を返す """
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    stem, ext = os.path.splitext(name)
+    if stem.endswith('.min'):
+        stem, ext = stem[:-4], '.min' + ext
+    hashed = f'{stem}.{digest}{ext}'
+    shutil.copyfile(path, os.path.join(DIST_DIR, hashed))
+    return hashed
+
+
+def _vendor_file(name, url, log):
+    path = os.path.join(VENDOR_DIR, name)
+    if not os.path.exists(path):
+        log(f'{name} を取得しています: {url}')
+        os.makedirs(VENDOR_DIR, exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response, open(path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+    return path
+
+
+def build_assets(tailwind_cli, log=print):
+    """
+    Tailwind CLI でテンプレートが使っているクラスだけの CSS を生成し、外部 JS と合わせて
+    ハッシュ付きのファイル名で static/dist に出力する。戻り値は manifest (論理名 → ファイル名)。
+    """
+    # 古いファイルは消さない (キャッシュ済みのページや入れ替え中の別プロセスがまだ参照している可能性がある)
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        css_path = os.path.join(tmp, 'app.css')
+        command = shlex.split(tailwind_cli) + [
+            '-c', os.path.join(SOURCE_DIR, 'tailwind.config.js'),
+            '-i', os.path.join(SOURCE_DIR, 'app.css'),
+            '-o', css_path, '--minify',
+        ]
+        log('CSS をビルドしています: ' + ' '.join(command))
+        subprocess.run(command, cwd=basedir, check=True)
+        manifest['app.css'] = _fingerprint('app.css', css_path)
+    for name, url in VENDOR_FILES.items():
+        manifest[name] = _fingerprint(name, _vendor_file(name, url, log))
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+asset_manifest = AssetManifest()
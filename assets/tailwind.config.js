@@ -0,0 +1,9 @@
+/** flask build-assets から使う Tailwind CSS (v3) の設定 */
+module.exports = {
+  // テンプレートと、クラス名を組み立てている Python コード (例: shelter_status_rows) を走査する
+  content: ['./templates/**/*.html', './*.py'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
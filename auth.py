@@ -0,0 +1,120 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask_login import login_user, logout_user, login_required, current_user
+
+from models import db, User
+from forms import LoginForm, RegistrationForm, ChangeUsernameForm, ChangePasswordForm
+from hashing import password_hasher, HasherBusy
+from identity import identity_cache
+from page_cache import page_cache
+
+# ログイン / 登録 / ホーム / 設定・メニュー
+bp = Blueprint('auth', __name__)
+
+
+@bp.route('/')
+@bp.route('/home')
+@login_required
+@page_cache.cached(vary_user=True)
+def home():
+    return render_template('home.html', title='ホーム')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('auth.home'))
+    login_form = LoginForm()
+    reg_form = RegistrationForm()
+    if 'submit' in request.form:
+        if request.form['submit'] == 'ログイン' and login_form.validate_on_submit():
+            user = User.query.filter_by(username=login_form.username.data).first()
+            try:
+                if user is None or not password_hasher.verify(user.password_hash, login_form.password.data):
+                    flash('ユーザー名またはパスワードが無効です', 'danger')
+                    return redirect(url_for('auth.login'))
+                if password_hasher.needs_rehash(user.password_hash):
+                    # コスト設定が変わっていれば、平文が手元にあるこのタイミングで再ハッシュする
+                    user.password_hash = password_hasher.hash(login_form.password.data)
+                    db.session.commit()
+            except HasherBusy:
+                db.session.rollback()
+                flash('ただいまログインが集中しています。少し時間をおいて再度お試しください。', 'warning')
+                return redirect(url_for('auth.login'))
+            login_user(identity_cache.remember(user), remember=True)
+            next_page = request.args.get('next')
+            return redirect(next_page or url_for('auth.home'))
+        elif request.form['submit'] == 'ログイン':
+             for field, errors in login_form.errors.items():
+                for error in errors:
+                    flash(f"{getattr(login_form, field).label.text}: {error}", 'danger')
+    return render_template('login.html', title='ログイン', login_form=login_form, reg_form=reg_form)
+
+@bp.route('/register', methods=['POST'])
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for('auth.home'))
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        existing_user = User.query.filter_by(username=form.username.data).first()
+        if existing_user:
+            flash('そのユーザー名は既に使用されています。', 'danger')
+            return redirect(url_for('auth.login'))
+        user = User(username=form.username.data, is_admin=False)
+        try:
+            user.password_hash = password_hasher.hash(form.password.data)
+        except HasherBusy:
+            flash('ただいま登録が集中しています。少し時間をおいて再度お試しください。', 'warning')
+            return redirect(url_for('auth.login'))
+        try:
+            db.session.add(user)
+            db.session.commit()
+            flash('登録が完了しました。ログインしてください。', 'success')
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Registration error: {e}")
+            flash('登録中にエラーが発生しました。', 'danger')
+        return redirect(url_for('auth.login'))
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f"{getattr(form, field).label.text}: {error}", 'danger')
+        login_form = LoginForm()
+        return render_template('login.html', title='ログイン・ユーザー登録', login_form=login_form, reg_form=form)
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    flash('ログアウトしました。', 'success')
+    return redirect(url_for('auth.login'))
+
+
+
+@bp.route('/settings', methods=['GET', 'POST'])
+@login_required
+def settings():
+    username_form = ChangeUsernameForm()
+    password_form = ChangePasswordForm()
+    if request.method == 'POST':
+        if 'submit_username' in request.form and username_form.validate_on_submit():
+            new_username = username_form.username.data
+            existing_user = User.query.filter(User.id != current_user.id, User.username == new_username).first()
+            if existing_user: flash('そのユーザー名は既に使用されています', 'danger')
+            else:
+                try: db.session.get(User, current_user.id).username = new_username; db.session.commit(); identity_cache.invalidate(current_user.id); flash('ユーザー名を変更しました', 'success')
+                except Exception as e: db.session.rollback(); current_app.logger.error(f"Username change error: {e}"); flash('ユーザー名変更エラー', 'danger')
+            return redirect(url_for('auth.settings'))
+        elif 'submit_password' in request.form and password_form.validate_on_submit():
+            try:
+                user = db.session.get(User, current_user.id)
+                if not password_hasher.verify(user.password_hash, password_form.old_password.data): flash('現在のパスワードが違います', 'danger')
+                else: user.password_hash = password_hasher.hash(password_form.new_password.data); db.session.commit(); identity_cache.invalidate(user.id); flash('パスワードを変更しました', 'success')
+            except HasherBusy: db.session.rollback(); flash('ただいま混雑しています。少し時間をおいて再度お試しください。', 'warning')
+            except Exception as e: db.session.rollback(); current_app.logger.error(f"Password change error: {e}"); flash('パスワード変更エラー', 'danger')
+            return redirect(url_for('auth.settings'))
+    return render_template('settings.html', title='設定', username_form=username_form, password_form=password_form)
+
+@bp.route('/menu')
+@login_required
+@page_cache.cached()
+def menu():
+    return render_template('menu.html', title='メニュー')
@@ -0,0 +1,77 @@
+"""
+パスワード照合スループットのベンチマーク
+
+    python benchmarks/bench_password_hashing.py --seconds 3
+    python benchmarks/bench_password_hashing.py --methods scrypt:16384:8:1 pbkdf2:sha256:600000
+
+ハッシュ方式 (コスト) ごとに、PasswordHasher のプロセスプールで
+ログイン (check_password_hash) を連続実行したときの照合件数/秒と
+1コアあたりの件数を計測する。併せて、待ち行列が満杯の時に
+HasherBusy で即座に断られた件数も表示する。
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from config import ProductionConfig  # noqa: E402
+from hashing import PasswordHasher, HasherBusy  # noqa: E402
+
+
+def run(method, workers, clients, seconds):
+    app = Flask(__name__)
+    app.config.from_object(ProductionConfig)
+    app.config['PASSWORD_HASH_METHOD'] = method
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+    pwhash = generate_password_hash('correct horse', method)
+    hasher.verify(pwhash, 'warm up')  # プールのプロセス起動を計測から除外
+
+    stats = {'ok': 0, 'busy': 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < stop:
+            try:
+                hasher.verify(pwhash, 'correct horse')
+                key = 'ok'
+            except HasherBusy:
+                key = 'busy'
+                time.sleep(0.01)
+            with lock:
+                stats[key] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    return stats['ok'] / elapsed, stats['busy']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', nargs='+', default=['scrypt', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--clients', type=int, default=32, help='同時にログインを試みるクライアント数')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    for method in args.methods:
+        rate, busy = run(method, args.workers, args.clients, args.seconds)
+        print(f"{method:24s} workers={args.workers:2d}  logins/s={rate:8.1f}  per-core={rate / args.workers:7.1f}  "
+              f"rejected(busy)={busy}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+SOS 信号の取り込みベンチマーク (1件ごとのコミット vs グループコミット)
+
+    python benchmarks/bench_sos_ingest.py --clients 64 --seconds 5
+
+多数の住民が同時に SOS ボタンを押す状況を、クライアントスレッドが
+それぞれ SOS を送り続けることで再現し、受付件数/秒と応答時間を比較する。
+どちらも本番用 SQLite プロファイル (WAL, synchronous=NORMAL) で計測する。
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask  # noqa: E402
+
+from config import ProductionConfig  # noqa: E402
+from ingest import GroupCommitQueue, write_sos_batch, sos_item  # noqa: E402
+from models import db, configure_sqlite, write_gate, User, SOSSignal  # noqa: E402
+
+
+def make_app(path, synchronous):
+    app = Flask(__name__)
+    app.config.from_object(ProductionConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config['SQLITE_PRAGMAS'] = dict(app.config['SQLITE_PRAGMAS'], synchronous=synchronous)
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+        db.create_all()
+        db.session.add(User(username='bench', password_hash='x'))
+        db.session.commit()
+    return app
+
+
+def per_request_commit(app):
+    def send():
+        db.session.add(SOSSignal(user_id=1))
+        db.session.commit()
+        db.session.remove()
+    return send
+
+
+def group_commit(app):
+    ingest = GroupCommitQueue('bench', write_sos_batch)
+    ingest.init_app(app)
+
+    def send():
+        ingest.submit(sos_item(1))
+    send.ingest = ingest
+    return send
+
+
+def run(app, send, clients, seconds):
+    latencies = []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client():
+        local = []
+        with app.app_context():
+            while time.monotonic() < stop:
+                started = time.perf_counter()
+                send()
+                local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    with app.app_context():
+        stored = db.session.query(SOSSignal).count()
+        db.session.remove()
+    return len(latencies), stored, elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--synchronous', default='FULL', help='PRAGMA synchronous (FULL で fsync のコストも比較)')
+    args = parser.parse_args()
+
+    write_gate_installed = False
+    for name, factory in (('per-request commit', per_request_commit), ('group commit', group_commit)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(os.path.join(tmp, 'bench.db'), args.synchronous)
+            if not write_gate_installed:
+                write_gate.install(db.session, timeout=app.config['SQLITE_WRITE_LOCK_TIMEOUT'])
+                write_gate_installed = True
+            send = factory(app)
+            acked, stored, elapsed, latencies = run(app, send, args.clients, args.seconds)
+            if hasattr(send, 'ingest'):
+                send.ingest.shutdown()
+            with app.app_context():
+                db.engine.dispose()
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f"{name:20s} acked/s={acked / elapsed:9.1f}  stored={stored:7d}  p50={p50:7.2f}ms  p99={p99:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+SQLite プロファイル比較ベンチマーク
+
+    python benchmarks/bench_sqlite_profile.py --writers 16 --readers 4 --seconds 5
+
+開発用 (SQLite 既定値) と本番用 (WAL + busy_timeout + 書き込み直列化) のそれぞれで、
+複数スレッドから SOS 送信・支援要請・チャット投稿と一覧の読み込みを同時に行い、
+書き込み/読み込みのスループットと "database is locked" 等のエラー数を比較する。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask  # noqa: E402
+
+from config import Config, ProductionConfig  # noqa: E402
+from models import db, configure_sqlite, write_gate, User, SOSSignal, SupportRequest, ChatMessage  # noqa: E402
+
+
+def make_app(config_class, path):
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+        db.create_all()
+        user = User(username='bench', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+    if app.config['SQLITE_SERIALIZE_WRITES']:
+        write_gate.install(db.session, timeout=app.config['SQLITE_WRITE_LOCK_TIMEOUT'])
+    return app
+
+
+def run(app, writers, readers, seconds):
+    stats = {'writes': 0, 'reads': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def bump(key):
+        with lock:
+            stats[key] += 1
+
+    def writer(n):
+        with app.app_context():
+            i = 0
+            while time.monotonic() < stop:
+                i += 1
+                kind = (n + i) % 3
+                if kind == 0:
+                    row = SOSSignal(user_id=1)
+                elif kind == 1:
+                    row = SupportRequest(category='water', priority='high', details='bench', user_id=1)
+                else:
+                    row = ChatMessage(text='bench', user_id=1)
+                try:
+                    db.session.add(row)
+                    db.session.commit()
+                    bump('writes')
+                except Exception:
+                    db.session.rollback()
+                    bump('errors')
+                db.session.remove()
+
+    def reader():
+        with app.app_context():
+            while time.monotonic() < stop:
+                try:
+                    ChatMessage.query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(50).all()
+                    bump('reads')
+                except Exception:
+                    bump('errors')
+                db.session.remove()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    with app.app_context():
+        db.engine.dispose()
+    return stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    # write_gate は db.session 全体に登録されるため、直列化しない開発用プロファイルを先に計測する
+    for name, config_class in (('development', Config), ('production', ProductionConfig)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(config_class, os.path.join(tmp, 'bench.db'))
+            stats, elapsed = run(app, args.writers, args.readers, args.seconds)
+        print(f"{name:12s} writes/s={stats['writes'] / elapsed:9.1f}  reads/s={stats['reads'] / elapsed:9.1f}  "
+              f"errors={stats['errors']}")
+
+
+if __name__ == '__main__':
+    main()
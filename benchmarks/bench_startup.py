@@ -0,0 +1,199 @@
+"""
+ワーカーの起動時間と、ワーカー数 (コア数) に対するスループットの伸びを測る
+
+    python benchmarks/bench_startup.py startup --runs 5
+    python benchmarks/bench_startup.py scaling --workers 1,2,4 --duration 10
+
+startup  新しいプロセスで create_app() し、最初のリクエストまでの時間を条件ごとに測る
+           cold      バイトコードキャッシュなし・プリウォームなし (従来の起動)
+           prewarm   起動時にテンプレートを読み込む
+           cached    バイトコードキャッシュ作成済み + プリウォーム (ワーカーの入れ替え時)
+scaling  gunicorn (gunicorn.conf.py) をワーカー数を変えて起動し、GET /login のスループットを測る
+         (テンプレートの描画のみで DB を使わないため、CPU の並列度がそのまま表れる)
+
+DB は一時ディレクトリに作るため、既存の app.db には触れない。
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子プロセスで実行する計測用のコード (結果を JSON で標準出力に書く)
+STARTUP_PROBE = '''
+import json, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app('production')
+t2 = time.perf_counter()
+client = app.test_client()
+client.get('/login')
+t3 = time.perf_counter()
+client.get('/login')
+t4 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000,
+                  'first_request_ms': (t3 - t2) * 1000, 'second_request_ms': (t4 - t3) * 1000}))
+'''
+
+
+def base_env(tmp):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': ROOT,
+        'DATABASE_URL': 'sqlite:///' + os.path.join(tmp, 'bench.db'),
+        'ARCHIVE_DATABASE_URL': 'sqlite:///' + os.path.join(tmp, 'bench_archive.db'),
+    })
+    return env
+
+
+def run_probe(env):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def bench_startup(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, 'jinja_cache')
+        conditions = {
+            'cold': {'JINJA_BYTECODE_CACHE_DIR': '', 'TEMPLATE_PREWARM': '0'},
+            'prewarm': {'JINJA_BYTECODE_CACHE_DIR': '', 'TEMPLATE_PREWARM': '1'},
+            'cached': {'JINJA_BYTECODE_CACHE_DIR': cache_dir, 'TEMPLATE_PREWARM': '1'},
+        }
+        run_probe({**base_env(tmp), **conditions['cached']})  # バイトコードキャッシュを作る
+        keys = ['import_ms', 'create_app_ms', 'first_request_ms', 'second_request_ms', 'process_ms']
+        print(f"{'condition':10s}" + ''.join(f'{k:>20s}' for k in keys))
+        results = {}
+        for name, overrides in conditions.items():
+            runs = [run_probe({**base_env(tmp), **overrides}) for _ in range(args.runs)]
+            results[name] = {k: round(statistics.median(r[k] for r in runs), 1) for k in keys}
+            print(f'{name:10s}' + ''.join(f'{results[name][k]:20.1f}' for k in keys))
+    print(f'(中央値、{args.runs} 回。create_app_ms にはプリウォームの時間を含む)')
+    return results
+
+
+# --- スループット ---
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/login')
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _client_process(port, threads, duration, queue):
+    """ 負荷をかける側も GIL で頭打ちにならないよう、プロセスごとにスレッドを立てて Keep-Alive で送り続ける """
+    counts = [0] * threads
+    stop = time.monotonic() + duration
+
+    def worker(index):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.monotonic() < stop:
+            try:
+                connection.request('GET', '/login')
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts[index] += 1
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        connection.close()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    queue.put(sum(counts))
+
+
+def measure_throughput(port, args):
+    queue = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=_client_process, args=(port, args.client_threads, args.duration, queue))
+               for _ in range(args.client_processes)]
+    started = time.monotonic()
+    for p in clients:
+        p.start()
+    total = sum(queue.get() for _ in clients)
+    for p in clients:
+        p.join()
+    return total / (time.monotonic() - started)
+
+
+def bench_scaling(args):
+    if shutil.which('gunicorn') is None:
+        sys.exit('gunicorn が見つかりません (pip install -r requirements.txt)')
+    worker_counts = [int(n) for n in args.workers.split(',')]
+    print(f'CPU コア数: {os.cpu_count()}  (コア数を超えるワーカー数ではスループットは伸びない)')
+    print(f"{'workers':>8s} {'req/s':>10s} {'speedup':>9s} {'efficiency':>11s}")
+    results, base = {}, None
+    with tempfile.TemporaryDirectory() as tmp:
+        env = base_env(tmp)
+        env['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(tmp, 'jinja_cache')
+        for n in worker_counts:
+            port = _free_port()
+            server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '-w', str(n), '-b', f'127.0.0.1:{port}'],
+                                      cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if not _wait_ready(port):
+                    sys.exit(f'gunicorn (workers={n}) が起動しませんでした')
+                measure_throughput(port, argparse.Namespace(**{**vars(args), 'duration': 1.0}))  # ウォームアップ
+                rps = measure_throughput(port, args)
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+            base = base or rps
+            results[n] = round(rps, 1)
+            print(f'{n:8d} {rps:10.1f} {rps / base:8.2f}x {rps / base / (n / worker_counts[0]) * 100:10.0f}%')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', metavar='PATH', help='結果を JSON で保存する')
+    startup = sub.add_parser('startup', parents=[common])
+    startup.add_argument('--runs', type=int, default=5)
+    scaling = sub.add_parser('scaling', parents=[common])
+    scaling.add_argument('--workers', default=','.join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    scaling.add_argument('--duration', type=float, default=10.0, help='ワーカー数ごとの計測秒数')
+    scaling.add_argument('--client-processes', type=int, default=max(2, (os.cpu_count() or 1) // 2))
+    scaling.add_argument('--client-threads', type=int, default=8)
+    args = parser.parse_args()
+
+    results = bench_startup(args) if args.command == 'startup' else bench_scaling(args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'command': args.command, 'cpu_count': os.cpu_count(), 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
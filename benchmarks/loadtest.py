@@ -0,0 +1,296 @@
+"""
+災害発生直後のアクセス集中を再現する負荷試験 (起動済みのローカルサーバーに対して実行する)
+
+    gunicorn -c gunicorn.conf.py                                  # 別端末でサーバーを起動 (本番設定)
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000 --duration 30 --save-baseline before
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000 --duration 30 --compare before
+
+シナリオ (すべて同時に実行し、--<シナリオ名> で仮想ユーザー数を指定、0 で無効):
+  login     ログアウト → /login の表示 → ログインを繰り返す (ログイン集中)
+  sos       /send-sos を送り続ける (SOS の集中)
+  requests  /safety-check から支援要請を送信する
+  chat      /chat に投稿する。--listeners 人が /chat/stream (SSE) で配信を受け取る
+  browse    /community を待たずに再読み込みし続ける (優先度の低い画面への集中)
+  admins    管理者が /admin/sos_reports を開き続ける
+
+ログインには seed-db で作成したユーザー (--user-format / --password) を使う。
+結果はルートごとの件数・エラー数・受付制御で断られた数 (429/503、admission.py)・スループット・p50/p95/p99 で表示し、
+--save-baseline で benchmarks/baselines/<名前>.json に保存、--compare で比較する。
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+CATEGORIES = ['food', 'water', 'medical', 'shelter', 'other']
+PRIORITIES = ['high', 'medium', 'low']
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """ リダイレクト先の表示時間を含めないよう、3xx はそのまま結果として扱う """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """ ルートごとの応答時間を集める """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.shed = {}
+        self.delivered = 0  # SSE で受け取ったメッセージ数
+
+    def add(self, route, seconds, ok, shed=False):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if shed:
+                self.shed[route] = self.shed.get(route, 0) + 1
+            elif not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def add_delivered(self):
+        with self._lock:
+            self.delivered += 1
+
+    def summary(self, elapsed):
+        result = {}
+        for route, values in sorted(self.samples.items()):
+            values = sorted(values)
+            result[route] = {
+                'count': len(values),
+                'errors': self.errors.get(route, 0),
+                'shed': self.shed.get(route, 0),
+                'rps': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            }
+        return result
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Client:
+    """ Cookie を保持する1人分の仮想ユーザー """
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        self.csrf_token = None
+
+    def request(self, route, path, data=None, headers=None, expect=(200, 204, 302, 303), to_login_ok=False):
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers or {})
+        started = time.perf_counter()
+        status, text, location = None, '', ''
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                status = response.status
+                text = response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            status = e.code
+            location = e.headers.get('Location', '')
+            e.close()
+        except (urllib.error.URLError, OSError):
+            status = None
+        # ログイン画面へのリダイレクトは未ログイン・ログイン失敗なのでエラーとして数える
+        ok = status in expect and (to_login_ok or '/login' not in location)
+        self.recorder.add(route, time.perf_counter() - started, ok, shed=status in (429, 503))
+        match = CSRF_PATTERN.search(text)
+        if match:
+            self.csrf_token = match.group(1)
+        return status, text
+
+    def login(self, username, password):
+        self.request('GET /login', '/login')
+        status, _ = self.request('POST /login', '/login', {
+            'csrf_token': self.csrf_token or '', 'username': username, 'password': password, 'submit': 'ログイン',
+        }, expect=(302, 303))
+        return status in (302, 303)
+
+    def ensure_csrf(self):
+        if self.csrf_token is None:
+            self.request('GET /emergency-sos', '/emergency-sos')
+
+
+# --- シナリオ (stop までループする) ---
+def login_storm(client, user, args, stop):
+    while time.monotonic() < stop:
+        client.request('GET /logout', '/logout', to_login_ok=True)
+        client.csrf_token = None
+        client.login(user, args.password)
+
+
+def sos_burst(client, user, args, stop):
+    client.login(user, args.password)
+    client.ensure_csrf()
+    while time.monotonic() < stop:
+        client.request('POST /send-sos', '/send-sos', {'csrf_token': client.csrf_token})
+
+
+def support_requests(client, user, args, stop):
+    rnd = random.Random(user)
+    client.login(user, args.password)
+    client.ensure_csrf()
+    while time.monotonic() < stop:
+        client.request('POST /safety-check', '/safety-check', {
+            'csrf_token': client.csrf_token,
+            'category': rnd.choice(CATEGORIES),
+            'priority': rnd.choice(PRIORITIES),
+            'details': f'負荷試験 {rnd.randint(1, 10 ** 6)}',
+        })
+
+
+def chat_posts(client, user, args, stop):
+    client.login(user, args.password)
+    client.ensure_csrf()
+    n = 0
+    while time.monotonic() < stop:
+        n += 1
+        client.request('POST /chat', '/chat', {'csrf_token': client.csrf_token, 'message': f'{user} {n}'},
+                       headers={'X-Requested-With': 'fetch'})
+
+
+def community_browse(client, user, args, stop):
+    client.login(user, args.password)
+    while time.monotonic() < stop:
+        client.request('GET /community', '/community')
+
+
+def admin_reports(client, user, args, stop):
+    client.login(args.admin_user, args.admin_password)
+    while time.monotonic() < stop:
+        client.request('GET /admin/sos_reports', '/admin/sos_reports')
+
+
+def chat_listener(client, user, args, stop):
+    """ SSE で配信を受け取り続け、受け取ったメッセージ数を数える (最初の応答までを遅延として記録) """
+    client.login(user, args.password)
+    while time.monotonic() < stop:
+        req = urllib.request.Request(client.base_url + '/chat/stream')
+        started = time.perf_counter()
+        try:
+            with client.opener.open(req, timeout=max(1.0, stop - time.monotonic())) as response:
+                client.recorder.add('GET /chat/stream (connect)', time.perf_counter() - started, response.status == 200)
+                for line in response:
+                    if line.startswith(b'data:'):
+                        client.recorder.add_delivered()
+                    if time.monotonic() >= stop:
+                        break
+        except (urllib.error.URLError, OSError):
+            if time.monotonic() < stop:
+                client.recorder.add('GET /chat/stream (connect)', time.perf_counter() - started, False)
+                time.sleep(0.5)
+
+
+SCENARIOS = {
+    'login': login_storm,
+    'sos': sos_burst,
+    'requests': support_requests,
+    'chat': chat_posts,
+    'browse': community_browse,
+    'admins': admin_reports,
+}
+
+
+def run(args):
+    recorder = Recorder()
+    stop = time.monotonic() + args.duration
+    threads = []
+    user_index = 0
+    for name, scenario in SCENARIOS.items():
+        for _ in range(getattr(args, name)):
+            user_index += 1
+            user = args.user_format.format(user_index)
+            client = Client(args.base_url, recorder, args.timeout)
+            threads.append(threading.Thread(target=scenario, args=(client, user, args, stop), daemon=True))
+    for _ in range(args.listeners):
+        user_index += 1
+        client = Client(args.base_url, recorder, args.timeout)
+        threads.append(threading.Thread(target=chat_listener, daemon=True,
+                                        args=(client, args.user_format.format(user_index), args, stop)))
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(args.duration + args.timeout + 5)
+    elapsed = time.monotonic() - started
+    return recorder.summary(elapsed), recorder.delivered, elapsed
+
+
+def print_summary(summary, baseline=None):
+    print(f"{'route':32s} {'count':>7s} {'err':>5s} {'shed':>6s} {'req/s':>8s} {'p50ms':>8s} {'p95ms':>8s} {'p99ms':>8s}")
+    for route, s in summary.items():
+        line = (f"{route:32s} {s['count']:7d} {s['errors']:5d} {s.get('shed', 0):6d} {s['rps']:8.1f} "
+                f"{s['p50_ms']:8.1f} {s['p95_ms']:8.1f} {s['p99_ms']:8.1f}")
+        base = (baseline or {}).get(route)
+        if base:
+            def delta(key):
+                return (s[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            line += f"   (req/s {delta('rps'):+.0f}%, p95 {delta('p95_ms'):+.0f}%, p99 {delta('p99_ms'):+.0f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--duration', type=float, default=30.0, help='秒')
+    parser.add_argument('--timeout', type=float, default=30.0, help='1リクエストのタイムアウト (秒)')
+    parser.add_argument('--login', type=int, default=20)
+    parser.add_argument('--sos', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--chat', type=int, default=10)
+    parser.add_argument('--browse', type=int, default=0)
+    parser.add_argument('--listeners', type=int, default=50)
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--user-format', default='user{:06d}', help='仮想ユーザーのユーザー名 (seed-db の形式)')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--admin-user', default='admin')
+    parser.add_argument('--admin-password', default='password')
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json'), encoding='utf-8') as f:
+            baseline = json.load(f)['routes']
+
+    counts = {name: getattr(args, name) for name in SCENARIOS}
+    print(f"{args.base_url} に {args.duration:.0f} 秒間負荷をかけます: {counts}, listeners={args.listeners}")
+    summary, delivered, elapsed = run(args)
+    print_summary(summary, baseline)
+    print(f"SSE で配信されたメッセージ: {delivered} 件 ({delivered / elapsed:.1f} 件/秒)")
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.save_baseline}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'duration': args.duration,
+                       'scenarios': counts, 'listeners': args.listeners, 'sse_delivered': delivered,
+                       'routes': summary}, f, ensure_ascii=False, indent=2)
+        print(f"ベースラインを保存しました: {path}")
+
+
+if __name__ == '__main__':
+    main()
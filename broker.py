@@ -0,0 +1,78 @@
+import queue
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    """ 1クライアント分の購読。publish されたイベントをキューで受け取る """
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False  # 取りこぼしが発生した場合 True (クライアントは再接続して追いつく)
+
+    def get(self, timeout):
+        """ 次のイベント (event_id, data) を返す。timeout 秒以内に無ければ None """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class MessageBroker:
+    """
+    プロセス内の軽量 pub/sub ブローカー。
+    チャンネル (例: 'chat', 'group:3') ごとに購読者のキューへイベントを配る。
+    遅い購読者はキューが溢れた時点で overflowed となり、以降のイベントは捨てられる。
+    """
+
+    def __init__(self, subscriber_queue_size=256):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._queue_size = subscriber_queue_size
+
+    def subscribe(self, channel):
+        sub = Subscription(self, channel, self._queue_size)
+        with self._lock:
+            self._subscribers[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.channel]
+
+    def publish(self, channel, event_id, data):
+        """ コミット済みのイベントを購読者へ配信する (ブロックしない) """
+        with self._lock:
+            subs = list(self._subscribers.get(channel, ()))
+        for sub in subs:
+            if sub.overflowed:
+                continue
+            try:
+                sub.queue.put_nowait((event_id, data))
+            except queue.Full:
+                sub.overflowed = True
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+
+# アプリ全体で共有するブローカー
+broker = MessageBroker()
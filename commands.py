@@ -0,0 +1,157 @@
+import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db, User
+from hashing import password_hasher
+from assets import build_assets
+from seed import DEFAULT_COUNTS, SEED_PASSWORD, seed_database, reset_database
+from activity import rebuild_activity
+from search import ensure_search_index, rebuild_search_index
+from shelters import ensure_shelter_index
+from sync import ensure_sync_versions
+from shelter_data import ShelterImportError, import_shelters
+from archive import archive_history
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """データベーステーブルを初期化（作成）するコマンド"""
+    try:
+        db.create_all()
+        ensure_search_index()
+        ensure_shelter_index()
+        ensure_sync_versions()
+        print('データベースを初期化しました。')
+    except Exception as e:
+        print(f"データベースの初期化中にエラーが発生しました: {e}")
+
+
+@click.command('seed-db')
+@click.option('--seed', default=42, show_default=True, help='乱数の種。同じ値なら同じデータになる')
+@click.option('--scale', default=1.0, show_default=True, help='すべての件数に掛ける倍率')
+@click.option('--users', type=int, help=f"既定 {DEFAULT_COUNTS['users']}")
+@click.option('--groups', type=int, help=f"既定 {DEFAULT_COUNTS['groups']}")
+@click.option('--members-per-group', type=int, help=f"既定 {DEFAULT_COUNTS['members_per_group']}")
+@click.option('--messages', type=int, help=f"既定 {DEFAULT_COUNTS['messages']}")
+@click.option('--group-messages', type=int, help=f"既定 {DEFAULT_COUNTS['group_messages']}")
+@click.option('--posts', type=int, help=f"既定 {DEFAULT_COUNTS['posts']}")
+@click.option('--requests', type=int, help=f"既定 {DEFAULT_COUNTS['requests']}")
+@click.option('--sos', type=int, help=f"既定 {DEFAULT_COUNTS['sos']}")
+@click.option('--shelters', type=int, help=f"既定 {DEFAULT_COUNTS['shelters']}")
+@click.option('--reset', is_flag=True, help='既存のテーブルを削除してから投入する')
+@with_appcontext
+def seed_db_command(seed, scale, reset, **overrides):
+    """ベンチマーク用の合成データを投入するコマンド (全ユーザーのパスワードは 'password')"""
+    counts = {name: overrides[name] if overrides[name] is not None else int(default * scale)
+              for name, default in DEFAULT_COUNTS.items()}
+    counts['members_per_group'] = (overrides['members_per_group'] if overrides['members_per_group'] is not None
+                                   else DEFAULT_COUNTS['members_per_group'])
+    try:
+        if reset:
+            reset_database()
+        elif db.session.execute(db.select(db.func.count()).select_from(User)).scalar():
+            print('データが既に存在します。空の DB に投入するか --reset を指定してください。')
+            return
+        # 全ユーザーで同じハッシュを使う (1件ずつ計算すると数百万件では終わらない)
+        seed_database(counts, seed, password_hasher.hash(SEED_PASSWORD))
+        print('合成データを投入しました。')
+    except Exception as e:
+        db.session.rollback()
+        print(f"合成データの投入中にエラーが発生しました: {e}")
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """CSS をビルドし、静的ファイルをハッシュ付きのファイル名で static/dist に出力するコマンド"""
+    try:
+        manifest = build_assets(current_app.config['TAILWIND_CLI'])
+        for name, hashed in sorted(manifest.items()):
+            print(f'{name} -> dist/{hashed}')
+    except Exception as e:
+        # デプロイの手順で失敗に気づけるよう、終了コードを 0 以外にする
+        raise click.ClickException(f"静的ファイルのビルド中にエラーが発生しました: {e}")
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """全文検索インデックス (search_index) を作り直すコマンド"""
+    try:
+        count = rebuild_search_index()
+        print(f'{count}件を検索インデックスに登録しました。')
+    except Exception as e:
+        db.session.rollback()
+        print(f"検索インデックスの再構築中にエラーが発生しました: {e}")
+
+
+@click.command('rebuild-activity')
+@with_appcontext
+def rebuild_activity_command():
+    """ユーザー活動集計 (user_activity) を既存データから作り直すコマンド"""
+    try:
+        count = rebuild_activity()
+        print(f'{count}人分の活動集計を再構築しました。')
+    except Exception as e:
+        db.session.rollback()
+        print(f"活動集計の再構築中にエラーが発生しました: {e}")
+
+
+@click.command('archive-history')
+@click.option('--days', type=int, help='この日数より前のチャット・投稿を移す (既定は ARCHIVE_AFTER_DAYS)')
+@click.option('--vacuum', is_flag=True, help='移した後に VACUUM して DB ファイルを縮める (実行中は書き込みが止まる)')
+@with_appcontext
+def archive_history_command(days, vacuum):
+    """古いチャット・グループチャット・コミュニティ投稿をアーカイブ用 DB に移すコマンド"""
+    days = days if days is not None else current_app.config['ARCHIVE_AFTER_DAYS']
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    try:
+        moved = archive_history(cutoff, current_app.config['ARCHIVE_SEGMENT_ROWS'])
+        print(f'{cutoff:%Y-%m-%d %H:%M} より前の {sum(moved.values())}件をアーカイブしました。')
+        if vacuum:
+            db.session.close()
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.exec_driver_sql('VACUUM')
+            print('VACUUM しました。')
+    except Exception as e:
+        db.session.rollback()
+        print(f"アーカイブ中にエラーが発生しました: {e}")
+
+
+@click.command('import-shelters')
+@click.argument('path', type=click.File('rb'))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'json']), help='既定は拡張子から判断')
+@click.option('--encoding', type=click.Choice(['auto', 'utf-8-sig', 'cp932']), default='auto', show_default=True)
+@click.option('--dry-run', is_flag=True, help='検証と件数の確認だけ行い、書き込まない')
+@with_appcontext
+def import_shelters_command(path, file_format, encoding, dry_run):
+    """避難所一覧の CSV / JSON を取り込み、避難所名で登録・更新するコマンド"""
+    file_format = file_format or ('json' if path.name.lower().endswith(('.json', '.jsonl', '.geojson')) else 'csv')
+    try:
+        report = import_shelters(path, file_format, encoding, dry_run)
+    except ShelterImportError as e:
+        print(e)
+        return
+    except Exception as e:
+        print(f"避難所の取り込み中にエラーが発生しました: {e}")
+        return
+    # 起動中のサーバーの避難所情報は PAGE_CACHE_TTL 秒以内に反映される
+    for line, name, message in report.errors:
+        print(f'{line}行目 {name}: {message}')
+    if report.error_count > len(report.errors):
+        print(f'(ほか {report.error_count - len(report.errors)}件のエラーは省略)')
+    print(report.summary)
+
+
+COMMANDS = [init_db_command, seed_db_command, build_assets_command, rebuild_search_index_command,
+            rebuild_activity_command, archive_history_command, import_shelters_command]
+
+
+def register_commands(app):
+    """ flask <コマンド> として使えるように登録する """
+    for command in COMMANDS:
+        app.cli.add_command(command)
@@ -0,0 +1,316 @@
+import datetime
+import gzip
+import hashlib
+import json
+import time
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, jsonify, stream_with_context, current_app
+from flask_login import login_required, current_user
+
+from models import db, ChatMessage, CommunityPost, Group, GroupChatMessage
+from forms import ChatForm, CommunityPostForm, CreateGroupForm, GroupChatForm
+from pagination import keyset_page
+from broker import broker
+from replica import replica
+from archive import archive_reader
+from activity import record_activity
+from search import search as search_posts, is_recent_only, SEARCH_SOURCES
+import sync
+import groups as group_service
+
+# チャット・コミュニティ・グループ・検索と、モバイル向けの差分同期 API
+bp = Blueprint('communication', __name__)
+
+SSE_CATCH_UP_BATCH = 200  # SSE の配信で DB から一度に読むメッセージの数
+
+
+def wants_json():
+    """ fetch() からの送信 (ページ遷移なし) かどうか """
+    return request.headers.get('X-Requested-With') == 'fetch'
+
+
+# --- リアルタイム配信 (Server-Sent Events) ---
+def message_payload(msg, username):
+    """ チャットメッセージを SSE で配信する JSON 用の dict に変換 """
+    return {
+        'id': msg.id,
+        'text': msg.text,
+        'user_id': msg.user_id,
+        'username': username,
+        'timestamp': msg.timestamp.isoformat() if msg.timestamp else None,
+    }
+
+
+def last_event_id():
+    """ 再接続時の Last-Event-ID ヘッダ、または初回接続時の ?after= を取得 """
+    value = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def event_stream(channel, after_id, fetch_since):
+    """
+    channel のイベントを SSE で配信するレスポンスを返す。
+    fetch_since(after_id, limit) は after_id より新しいメッセージの payload を id 昇順で最大 limit 件返す関数。
+    購読を開始してから DB の差分を読むため、その間に投稿されたメッセージも取りこぼさない。
+
+    ブローカーのイベントはすぐに送るが、別のワーカーで書き込まれたメッセージはブローカーに届かず、
+    グループチャットのようにチャンネル内の id が連番でない場合もある。そのため「ここまでは DB で
+    確認して送った」位置 (last) を別に持ち、飛びのあるイベントは送った id を覚えておくだけにする。
+    last より後は定期的に DB から読み、まだ送っていないものを送る。SSE の id には last を入れ、
+    再接続時に確認前のメッセージを飛ばさないようにする (クライアントは id で重複を除く)。
+    """
+    keepalive = current_app.config['SSE_KEEPALIVE_SECONDS']
+    deadline = time.monotonic() + current_app.config['SSE_MAX_STREAM_SECONDS']
+    subscription = broker.subscribe(channel)
+
+    def generate():
+        last = after_id
+        sent = set()  # last より後で、ブローカーから受けて送った id
+        checked_at = time.monotonic()
+
+        def format_event(payload):
+            event_id = payload['id'] if last is None else last
+            return f"id: {event_id}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        def catch_up():
+            nonlocal last, sent, checked_at
+            checked_at = time.monotonic()
+            if last is None:
+                return
+            while True:
+                try:
+                    payloads = fetch_since(last, SSE_CATCH_UP_BATCH)
+                finally:
+                    db.session.close()  # 長時間の接続中に DB コネクションを握り続けない
+                for payload in payloads:
+                    last = payload['id']
+                    if last not in sent:
+                        yield format_event(payload)
+                sent = {i for i in sent if i > last}
+                if len(payloads) < SSE_CATCH_UP_BATCH:
+                    return
+
+        with subscription:
+            db.session.close()  # 権限確認等で使ったコネクションを返却してから配信を始める
+            yield 'retry: 3000\n\n'
+            yield from catch_up()
+            while time.monotonic() < deadline and not subscription.overflowed:
+                item = subscription.get(timeout=keepalive)
+                if item is None:
+                    # 別プロセスで書き込まれたメッセージはブローカーに届かないため、待機中は DB を確認する
+                    yield from catch_up()
+                    yield ': keepalive\n\n'
+                    continue
+                event_id, payload = item
+                if last is not None and (event_id <= last or event_id in sent):
+                    continue
+                if last is None or event_id == last + 1:
+                    last = event_id
+                    while last + 1 in sent:  # 先に送っていた続きの id まで進める
+                        last += 1
+                        sent.discard(last)
+                    yield format_event(payload)
+                else:
+                    # 間に別プロセスの (ブローカーに届かない) メッセージがあるかもしれないため、last は進めない
+                    sent.add(event_id)
+                    yield format_event(payload)
+                    if time.monotonic() - checked_at >= keepalive:
+                        yield from catch_up()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# --- チャット・コミュニティ・グループ ---
+@bp.route('/chat', methods=['GET', 'POST'])
+@login_required
+@replica.read_only
+def chat():
+    form = ChatForm()
+    if form.validate_on_submit():
+        try:
+            new_msg = ChatMessage(text=form.message.data, user_id=current_user.id, timestamp=datetime.datetime.now())
+            db.session.add(new_msg)
+            record_activity('message', current_user.id, new_msg.timestamp)
+            db.session.commit()
+            broker.publish('chat', new_msg.id, message_payload(new_msg, current_user.username))
+            if wants_json(): return '', 204
+            return redirect(url_for('communication.chat'))
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Chat message error: {e}"); flash('メッセージ送信エラー', 'danger')
+    if wants_json() and request.method == 'POST': return jsonify(errors=form.errors), 400
+    page = None
+    try:
+        page = keyset_page(ChatMessage.query.options(db.joinedload(ChatMessage.author)), ChatMessage,
+                           cursor=request.args.get('before'), limit=current_app.config['FEED_PAGE_SIZE'], oldest_first=True,
+                           older=archive_reader('chat'))
+    except Exception as e:
+        current_app.logger.error(f"Error fetching chat: {e}"); flash('メッセージ読込エラー', 'danger')
+    return render_template('chat.html', title='チャット', form=form, messages=page.items if page else [], page=page)
+
+@bp.route('/chat/stream')
+@login_required
+def chat_stream():
+    """ 全体チャットの新着メッセージを SSE で配信 """
+    def fetch_since(after_id, limit):
+        msgs = ChatMessage.query.options(db.joinedload(ChatMessage.author)).filter(ChatMessage.id > after_id).order_by(ChatMessage.id.asc()).limit(limit).all()
+        return [message_payload(m, m.author.username) for m in msgs]
+    return event_stream('chat', last_event_id(), fetch_since)
+
+@bp.route('/community', methods=['GET', 'POST'])
+@login_required
+@replica.read_only
+def community():
+    form = CommunityPostForm()
+    if form.validate_on_submit():
+        try:
+            new_post = CommunityPost(text=form.text.data, user_id=current_user.id, timestamp=datetime.datetime.now())
+            db.session.add(new_post); record_activity('post', current_user.id, new_post.timestamp); db.session.commit(); flash('投稿しました', 'success')
+            return redirect(url_for('communication.community'))
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Community post error: {e}"); flash('投稿エラー', 'danger')
+    page = None
+    try:
+        page = keyset_page(CommunityPost.query.options(db.joinedload(CommunityPost.author)), CommunityPost,
+                           cursor=request.args.get('before'), limit=current_app.config['FEED_PAGE_SIZE'], older=archive_reader('posts'))
+    except Exception as e:
+        current_app.logger.error(f"Error fetching community: {e}"); flash('投稿読込エラー', 'danger')
+    return render_template('community.html', title='コミュニティ', form=form, posts=page.items if page else [], page=page)
+
+@bp.route('/search')
+@login_required
+@replica.read_only
+def search():
+    """ コミュニティ投稿・チャット・支援要請の全文検索 """
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') or None
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, has_next = [], False
+    if query:
+        try:
+            results, has_next = search_posts(query, kind=kind, page=page, per_page=current_app.config['SEARCH_PAGE_SIZE'],
+                                             short_term_scan_rows=current_app.config['SEARCH_SHORT_TERM_SCAN_ROWS'])
+        except Exception as e:
+            current_app.logger.error(f"Search error: {e}"); flash('検索中にエラーが発生しました', 'danger')
+    return render_template('search.html', title='検索', query=query, kind=kind, page=page, results=results, has_next=has_next, sources=SEARCH_SOURCES,
+                           recent_only=is_recent_only(query), scan_rows=current_app.config['SEARCH_SHORT_TERM_SCAN_ROWS'])
+
+@bp.route('/group', methods=['GET', 'POST'])
+@login_required
+def group_management():
+    form = CreateGroupForm()
+    if form.validate_on_submit():
+        try:
+            new_group = group_service.create_group(form.name.data, current_user.id); db.session.commit()
+            flash(f'グループ「{new_group.name}」を作成', 'success'); return redirect(url_for('communication.group_management'))
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Group creation error: {e}"); flash('グループ作成エラー', 'danger')
+    user_groups = group_service.groups_for_user(current_user.id)
+    return render_template('group_management.html', title='グループ管理', form=form, groups=user_groups)
+
+@bp.route('/group/<int:group_id>/chat', methods=['GET', 'POST'])
+@login_required
+@replica.read_only
+def group_chat(group_id):
+    group = db.session.get(Group, group_id)
+    if not group: flash('グループが見つかりません', 'danger'); return redirect(url_for('communication.group_management'))
+    if not group_service.is_member(group.id, current_user.id): flash('アクセス権がありません', 'danger'); return redirect(url_for('communication.group_management'))
+    form = GroupChatForm()
+    if form.validate_on_submit():
+        try:
+            new_msg = GroupChatMessage(text=form.message.data, user_id=current_user.id, group_id=group.id, timestamp=datetime.datetime.now())
+            db.session.add(new_msg); group_service.count_message(group.id); record_activity('message', current_user.id, new_msg.timestamp); db.session.commit()
+            broker.publish(f'group:{group_id}', new_msg.id, message_payload(new_msg, current_user.username))
+            if wants_json(): return '', 204
+            return redirect(url_for('communication.group_chat', group_id=group.id))
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Group chat msg error: {e}"); flash('メッセージ送信エラー', 'danger')
+    if wants_json() and request.method == 'POST': return jsonify(errors=form.errors), 400
+    page = None
+    try:
+        page = keyset_page(GroupChatMessage.query.filter_by(group_id=group.id).options(db.joinedload(GroupChatMessage.author)), GroupChatMessage,
+                           cursor=request.args.get('before'), limit=current_app.config['FEED_PAGE_SIZE'], oldest_first=True,
+                           older=archive_reader('group_chat', group.id))
+    except Exception as e:
+        current_app.logger.error(f"Error fetching group chat: {e}"); flash('メッセージ読込エラー', 'danger')
+    return render_template('group_chat.html', title=f'{group.name} - チャット', form=form, group=group, messages=page.items if page else [], page=page)
+
+@bp.route('/group/<int:group_id>/chat/stream')
+@login_required
+def group_chat_stream(group_id):
+    """ グループチャットの新着メッセージを SSE で配信 """
+    if not group_service.is_member(group_id, current_user.id): return '', 403
+    def fetch_since(after_id, limit):
+        msgs = GroupChatMessage.query.filter(GroupChatMessage.group_id == group_id, GroupChatMessage.id > after_id).options(db.joinedload(GroupChatMessage.author)).order_by(GroupChatMessage.id.asc()).limit(limit).all()
+        return [message_payload(m, m.author.username) for m in msgs]
+    return event_stream(f'group:{group_id}', last_event_id(), fetch_since)
+
+
+# --- モバイル向け差分同期 API (sync.py)。応答はコンパクトな JSON + ETag + gzip ---
+def compact_json(payload):
+    """ 空白なしの JSON を返す。内容が同じなら 304、クライアントが対応していれば gzip 圧縮 """
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha1(body).hexdigest()
+    use_gzip = len(body) >= current_app.config['SYNC_GZIP_MIN_BYTES'] and 'gzip' in request.accept_encodings
+    response = Response(mimetype='application/json')
+    if use_gzip:
+        body = gzip.compress(body, compresslevel=6); etag += '-gz'  # 圧縮の有無で ETag を分ける
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_data(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+def sync_limit():
+    return min(max(request.args.get('limit', current_app.config['SYNC_MAX_ROWS'], type=int), 1), current_app.config['SYNC_MAX_ROWS'])
+
+@bp.route('/api/v1/sync')
+@login_required
+@replica.read_only
+def api_sync():
+    """ 全フィード (chat / posts / groups / requests / shelters) の差分を1回で返す。次回は応答の cursor を渡す """
+    try:
+        return compact_json(sync.sync_payload(current_user.id, request.args.get('cursor'), sync_limit()))
+    except sync.InvalidCursor:
+        return jsonify(error='cursor が不正です'), 400
+
+@bp.route('/api/v1/chat')
+@login_required
+@replica.read_only
+def api_chat():
+    return compact_json(sync.feed_payload('chat', lambda: sync.chat_feed(request.args.get('since', type=int), sync_limit())))
+
+@bp.route('/api/v1/posts')
+@login_required
+@replica.read_only
+def api_posts():
+    return compact_json(sync.feed_payload('posts', lambda: sync.post_feed(request.args.get('since', type=int), sync_limit())))
+
+@bp.route('/api/v1/groups/<int:group_id>/chat')
+@login_required
+@replica.read_only
+def api_group_chat(group_id):
+    if not group_service.is_member(group_id, current_user.id): return jsonify(error='このグループのメンバーではありません'), 403
+    return compact_json(sync.feed_payload('groups', lambda: sync.group_feed(current_user.id, request.args.get('since', type=int), sync_limit(), group_id)))
+
+@bp.route('/api/v1/requests')
+@login_required
+@replica.read_only
+def api_requests():
+    try:
+        return compact_json(sync.feed_payload('requests', lambda: sync.request_feed(request.args.get('since'), sync_limit())))
+    except sync.InvalidCursor:
+        return jsonify(error='since が不正です'), 400
+
+@bp.route('/api/v1/shelters')
+@login_required
+@replica.read_only
+def api_shelters():
+    try:
+        return compact_json(sync.feed_payload('shelters', lambda: sync.shelter_feed(request.args.get('since'), sync_limit())))
+    except sync.InvalidCursor:
+        return jsonify(error='since が不正です'), 400
@@ -0,0 +1,162 @@
+import os
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def pool_options(prefix, pool_size, max_overflow, pool_recycle=-1, pool_pre_ping=False):
+    """
+    接続プールの設定。環境変数 <prefix>_POOL_SIZE / <prefix>_MAX_OVERFLOW / <prefix>_POOL_RECYCLE (秒、-1 で無効) /
+    <prefix>_POOL_PRE_PING (1 で有効) があればそちらを使う
+    """
+    return {
+        'pool_size': int(os.environ.get(f'{prefix}_POOL_SIZE', pool_size)),
+        'max_overflow': int(os.environ.get(f'{prefix}_MAX_OVERFLOW', max_overflow)),
+        'pool_recycle': int(os.environ.get(f'{prefix}_POOL_RECYCLE', pool_recycle)),
+        'pool_pre_ping': os.environ.get(f'{prefix}_POOL_PRE_PING', '1' if pool_pre_ping else '0') == '1',
+    }
+
+
+def database_binds(replica_options):
+    """
+    primary 以外の DB。REPLICA_DATABASE_URL を設定すると、読み込み中心の画面の SELECT をそちらに送る (replica.py)。
+    手元で試す場合は別の SQLite ファイル (primary のコピー) か、同じファイルの読み取り専用接続を指定する:
+        REPLICA_DATABASE_URL='sqlite:///file:/path/to/app.db?mode=ro&uri=true'
+    """
+    binds = {
+        # 古いチャット・投稿の移動先 (archive.py)
+        'archive': os.environ.get('ARCHIVE_DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'archive.db')),
+    }
+    replica_url = os.environ.get('REPLICA_DATABASE_URL')
+    if replica_url:
+        options = dict(replica_options)
+        if replica_url.startswith('sqlite'):
+            options['connect_args'] = {'timeout': 30, 'check_same_thread': False}
+        binds['replica'] = {'url': replica_url, **options}
+    return binds
+
+
+class Config:
+    """ 開発用の既定設定 """
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'your_secret_key_here_please_change')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'app.db'))
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_BINDS = database_binds(pool_options('REPLICA', pool_size=5, max_overflow=10))
+    REPLICA_STICKY_SECONDS = 5     # 書き込んだユーザーの読み込みを primary に固定する秒数 (複製の遅れ対策)
+
+    FEED_PAGE_SIZE = 50            # チャット・掲示板等の1ページあたりの件数
+    SSE_KEEPALIVE_SECONDS = 15     # SSE のキープアライブ間隔 (この間隔で DB の差分も確認)
+    SSE_MAX_STREAM_SECONDS = 300   # 1接続の最大時間。超えたらクライアントが Last-Event-ID で再接続する
+    CSV_EXPORT_BATCH_SIZE = 1000   # CSV エクスポート時に DB から一度に取得する行数
+    SHELTER_IMPORT_MAX_BYTES = 50 * 1024 * 1024  # 避難所一覧の一括取り込みで受け付ける最大ファイルサイズ
+    SEARCH_PAGE_SIZE = 20          # 検索結果の1ページあたりの件数
+    SEARCH_SHORT_TERM_SCAN_ROWS = 5000  # 2文字以下の語だけの検索で、種類ごとに調べる新しい投稿の数
+    SYNC_MAX_ROWS = 200            # 差分同期 API で1フィードあたりに返す最大件数 (超えたら more=true)
+    SYNC_GZIP_MIN_BYTES = 512      # これより大きい応答は gzip で圧縮する (クライアントが対応している場合)
+
+    # 接続ごとに実行する SQLite の PRAGMA (開発時は SQLite の既定値のまま)
+    SQLITE_PRAGMAS = {}
+    # 読み取り用の DB の PRAGMA。query_only で誤って書き込まないようにする
+    SQLITE_REPLICA_PRAGMAS = {'query_only': 'ON'}
+    # True の場合、プロセス内の書き込みトランザクションを1つずつ順番に実行する
+    SQLITE_SERIALIZE_WRITES = False
+    SQLITE_WRITE_LOCK_TIMEOUT = 30  # 書き込み順番待ちの最大秒数
+
+    # SOS 信号のグループコミット (ingest.py)
+    INGEST_MAX_BATCH = 500        # 1トランザクションにまとめる最大件数
+    INGEST_MAX_DELAY_MS = 5       # 最初の1件を受け取ってからコミットまで待つ最大時間
+    INGEST_QUEUE_SIZE = 10000     # これを超えたら受付を拒否する (バックプレッシャー)
+    INGEST_ACK_TIMEOUT = 5.0      # コミット完了を待つ最大秒数
+
+    # パスワードハッシュ (hashing.py)。method を変えるとログイン時に自動で再ハッシュされる
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')  # 例: 'scrypt:16384:8:1', 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_WORKERS = 0       # 0 = リクエスト処理スレッドで計算 (開発用)
+    PASSWORD_HASH_MAX_PENDING = 0   # 同時に受け付ける件数 (0 = workers * 4)
+    PASSWORD_HASH_TIMEOUT = 10.0    # 1件の計算を待つ最大秒数
+
+    # ログインユーザー情報のキャッシュ (identity.py)
+    IDENTITY_CACHE_SIZE = 10000   # 保持する最大ユーザー数 (超えたら LRU で破棄)
+    IDENTITY_CACHE_TTL = 60       # 秒。別プロセスでの変更はこの時間内に反映される
+
+    # 描画済みページのキャッシュ (page_cache.py)
+    PAGE_CACHE_ENABLED = True
+    PAGE_CACHE_SIZE = 2000        # 保持する最大エントリ数 (ページ × 権限/ユーザー)
+    PAGE_CACHE_TTL = 30           # 秒。別プロセスでのデータ変更はこの時間内に反映される
+
+    # 履歴のアーカイブ (archive.py、flask archive-history)
+    ARCHIVE_AFTER_DAYS = 30       # これより古いチャット・投稿をアーカイブ用 DB に移す
+    ARCHIVE_SEGMENT_ROWS = 500    # 1つの圧縮セグメントにまとめる最大件数
+
+    # ルートごとの処理時間・SQL 計測 (metrics.py、/admin/metrics で参照)
+    METRICS_ENABLED = True
+    METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', 0))  # これ以上かかったリクエストを SQL 付きでログに出す (0 = 無効)
+
+    # 管理者の状況ダッシュボード (situation.py、/admin/dashboard)
+    SITUATION_REQUEST_WINDOW_MINUTES = 24 * 60  # 支援要請を数える期間 (分)
+    SITUATION_SOS_WINDOW_MINUTES = 60           # SOS の1分ごとの件数を表示する期間 (分)
+    SITUATION_SOS_ROLLUPS = (5, 15, 60)         # SOS の合計を表示する期間 (分、SITUATION_SOS_WINDOW_MINUTES 以下)
+    SITUATION_POLL_SECONDS = 2                  # 他のワーカーでの書き込みを確認する間隔 (画面を開いている人がいる間のみ)
+
+    # 受付制御 (admission.py)。過負荷時も SOS・支援要請の送信を先に受け付け、混雑しやすい画面はすぐに断る
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+    # 優先度クラスごとの同時処理数の上限 (プロセスごと、critical は上限なし)。
+    # 合計を gunicorn のスレッド数 (GUNICORN_THREADS、既定 32) より小さくして、残りを critical 用に空けておく
+    ADMISSION_CONCURRENCY = {'normal': 12, 'low': 6, 'stream': 10}
+    # トークンバケット (1秒あたりの回数, まとめて使える回数)。キーは優先度クラスかエンドポイント名 (こちらが優先)
+    ADMISSION_USER_RATES = {                  # ログインユーザー × エンドポイントごと
+        'normal': (5, 30), 'low': (1, 10), 'stream': (0.2, 5),
+        'communication.search': (0.5, 5),     # 全文検索は重いため
+    }
+    ADMISSION_ROUTE_RATES = {'low': (200, 400)}  # エンドポイントごと (プロセス内の全ユーザーの合計)
+    ADMISSION_BUSY_RETRY_AFTER = 2            # 同時処理数の上限で断ったときの Retry-After (秒)
+    ADMISSION_MAX_BUCKETS = 50000             # 保持するトークンバケットの最大数 (超えたら LRU で破棄)
+
+    # テンプレート (app.py)。コンパイル結果を保存して、新しいワーカーが最初のリクエストで構文解析しないようにする
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR', os.path.join(basedir, 'instance', 'jinja_cache'))  # '' で無効
+    TEMPLATE_PREWARM = False       # True の場合、起動時にすべてのテンプレートを読み込む
+
+    # flask build-assets で使う Tailwind CSS の CLI (assets.py)
+    TAILWIND_CLI = os.environ.get('TAILWIND_CLI', 'npx tailwindcss@3')
+    # 静的ファイルは static/dist のビルド済みのものだけを使う (ネットワークが無くても画面が表示できるように)。
+    # 未ビルドの開発環境で CDN から読み込む場合のみ ASSET_CDN_FALLBACK=1 とする
+    ASSET_CDN_FALLBACK = os.environ.get('ASSET_CDN_FALLBACK') == '1'
+    ASSETS_REQUIRED = False        # True の場合、未ビルドなら起動しない
+
+
+class ProductionConfig(Config):
+    """ 本番用: WAL + busy_timeout + 書き込み直列化で "database is locked" を防ぐ """
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        # pysqlite 側のロック待ち (秒)。PRAGMA busy_timeout と揃える
+        'connect_args': {'timeout': 30, 'check_same_thread': False},
+        **pool_options('DB', pool_size=10, max_overflow=10),
+    }
+    SQLALCHEMY_BINDS = database_binds(pool_options('REPLICA', pool_size=20, max_overflow=10))
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',       # 読み込みが書き込みをブロックしない
+        'synchronous': 'NORMAL',     # WAL では NORMAL でもクラッシュ時に DB は壊れない
+        'busy_timeout': 30000,       # ロック中は最大 30 秒待つ (ミリ秒)
+        'cache_size': -64000,        # 約 64MB のページキャッシュ (負値は KiB 指定)
+        'mmap_size': 268435456,      # 256MB をメモリマップで読む
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    }
+    SQLITE_REPLICA_PRAGMAS = {
+        'busy_timeout': 30000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'query_only': 'ON',
+    }
+    SQLITE_SERIALIZE_WRITES = True
+
+    # ハッシュ計算のプールは gunicorn のワーカーごとに作られるため、全体でコア数になるようにワーカー数で割る
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or max(
+        1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY') or os.cpu_count() or 1)))
+    METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', 1000))
+    TEMPLATE_PREWARM = os.environ.get('TEMPLATE_PREWARM', '1') == '1'
+    ASSETS_REQUIRED = True         # デプロイ時に flask build-assets が必要
+
+
+config_by_name = {
+    'development': Config,
+    'production': ProductionConfig,
+}
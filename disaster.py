@@ -0,0 +1,193 @@
+import datetime
+import os
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask_login import login_required, current_user
+
+from models import db, SupportRequest, Shelter, SHELTER_LOG_TYPES
+from forms import SupportRequestForm
+from pagination import keyset_page
+from ingest import sos_ingest, sos_item, shelter_ingest, shelter_item, IngestQueueFull, IngestTimeout
+from page_cache import page_cache
+from replica import replica
+from activity import record_activity
+from situation import situation
+from shelters import nearest_shelters, parse_checkin_code
+
+# 安否確認・SOS・避難所など災害時の機能
+bp = Blueprint('disaster', __name__)
+
+
+@bp.route('/safety-check', methods=['GET', 'POST'])
+@login_required
+@replica.read_only
+def safety_check():
+    form = SupportRequestForm()
+    if form.validate_on_submit():
+        try:
+            new_request = SupportRequest(
+                category=form.category.data,
+                priority=form.priority.data,
+                details=form.details.data,
+                user_id=current_user.id,
+                timestamp=datetime.datetime.now()
+            )
+            db.session.add(new_request)
+            record_activity('request', current_user.id, new_request.timestamp)
+            db.session.commit()
+            situation.notify()
+            flash('支援要請を送信しました。', 'success')
+            return redirect(url_for('disaster.safety_check'))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Support request error: {e}")
+            flash('支援要請の送信中にエラーが発生しました。', 'danger')
+    page = None
+    try:
+        page = keyset_page(
+            SupportRequest.query.options(db.joinedload(SupportRequest.author)),
+            SupportRequest, cursor=request.args.get('before'), limit=current_app.config['FEED_PAGE_SIZE']
+        )
+    except Exception as e:
+        current_app.logger.error(f"Error fetching support requests: {e}")
+        flash('支援要請の読み込み中にエラーが発生しました。', 'danger')
+    return render_template(
+        'safety_check.html',
+        title='安否確認・支援要請',
+        form=form,
+        requests=page.items if page else [],
+        page=page
+    )
+
+@bp.route('/emergency-sos')
+@login_required
+def emergency_sos():
+    return render_template('emergency_sos.html', title='緊急SOS発信')
+
+@bp.route('/send-sos', methods=['POST'])
+@login_required
+def send_sos():
+    try:
+        # グループコミットで書き込み、永続化が完了してから応答する
+        sos_ingest.submit(sos_item(current_user.id))
+        flash(f'SOS信号を送信しました。救助隊が確認します。', 'danger')
+    except IngestQueueFull:
+        flash('SOS信号が集中しています。数秒後にもう一度送信してください。', 'danger')
+    except IngestTimeout:
+        current_app.logger.warning("SOS signal ack timeout")
+        flash('SOS信号の受付確認に時間がかかっています。しばらくしてから再度お試しください。', 'danger')
+    except Exception as e:
+        current_app.logger.error(f"SOS signal error: {e}")
+        flash('SOS信号の送信中にエラーが発生しました。', 'danger')
+    return redirect(url_for('disaster.emergency_sos'))
+
+@bp.route('/emergency-info')
+@login_required
+@page_cache.cached()
+def emergency_info():
+    gov_alert = "[速報] 〇〇市全域に避難指示が発令されました。"
+    return render_template('emergency_info.html', title='緊急情報', gov_alert=gov_alert)
+
+def shelter_status_rows():
+    """ 避難所情報ページの各行。避難者数は受付時に加算済みの列を読むだけ (ログの集計はしない) """
+    rows = []
+    shelters = Shelter.query.with_entities(Shelter.name, Shelter.capacity, Shelter.current_occupancy).order_by(Shelter.name).all()
+    for shelter in shelters:
+        remaining = max(shelter.capacity - shelter.current_occupancy, 0)
+        if remaining == 0: status_color = "text-red-600"
+        elif remaining <= shelter.capacity * 0.2: status_color = "text-yellow-600"
+        else: status_color = "text-green-600"
+        rows.append({
+            "name": shelter.name,
+            "status": f"避難者 {shelter.current_occupancy}/{shelter.capacity}人 (空き {remaining}人)",
+            "status_color": status_color
+        })
+    return rows
+
+@bp.route('/shelter-info')
+@login_required
+@page_cache.cached('shelters')
+@replica.read_only
+def shelter_info():
+    shelter_data = []
+    try:
+        shelter_data = page_cache.fragment('shelter_info', ('shelters',), shelter_status_rows)
+    except Exception as e:
+        current_app.logger.error(f"Error fetching shelter info: {e}")
+        flash('避難所情報の読み込み中にエラーが発生しました。', 'danger')
+    return render_template('shelter_info.html', title='避難場所情報', shelters=shelter_data) # title修正
+
+@bp.route('/realtime-info')
+@login_required
+def realtime_info():
+    return render_template('realtime_info.htm.html', title='リアルタイム情報') # ファイル名注意
+
+@bp.route('/hazard-map')
+@login_required
+@page_cache.cached()
+def hazard_map():
+    return render_template('hazard_map.html', title='ハザードマップ')
+
+@bp.route('/disaster-contacts')
+@login_required
+@page_cache.cached()
+def disaster_contacts():
+    contacts = [
+        {"name": "災害対策本部", "number": "090-XXXX-XXXX"},
+        {"name": "消防・救急", "number": "119"}
+    ]
+    return render_template('disaster_contacts.html', title='防災用連絡先', contacts=contacts)
+
+@bp.route('/map')
+@login_required
+def map():
+    api_key = os.environ.get('GOOGLE_MAPS_API_KEY')
+    if not api_key:
+        flash('Google Maps APIキーが設定されていません。地図機能が制限される可能性があります。', 'warning')
+    return render_template('map.html', title='マップ', api_key=api_key)
+
+@bp.route('/api/shelters/nearest')
+@login_required
+def api_nearest_shelters():
+    """ 現在地 (lat, lng) から近い順に、まだ受け入れ可能な避難所を返す """
+    lat = request.args.get('lat', type=float); lng = request.args.get('lng', type=float)
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify(error='lat と lng に有効な座標を指定してください'), 400
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+    try:
+        shelters = nearest_shelters(lat, lng, limit=limit)
+    except Exception as e:
+        current_app.logger.error(f"Nearest shelter lookup error: {e}")
+        return jsonify(error='避難所の検索中にエラーが発生しました'), 500
+    return jsonify(shelters=shelters)
+
+
+@bp.route('/qr')
+@login_required
+def qr_code():
+    return render_template('qr.html', title='QRコード')
+
+@bp.route('/shelters/checkin', methods=['POST'])
+@login_required
+def shelter_checkin():
+    """ 避難所の QR コードを読み取って受付 (チェックイン/アウト) する。書き込みはグループコミット """
+    data = request.get_json(silent=True) or request.form
+    shelter_id = parse_checkin_code(str(data.get('code', '')))
+    log_type = data.get('type', 'check_in')
+    if shelter_id is None or log_type not in SHELTER_LOG_TYPES:
+        return jsonify(error='避難所の受付用QRコードではありません'), 400
+    name = db.session.execute(db.select(Shelter.name).where(Shelter.id == shelter_id)).scalar()
+    db.session.close()  # 確認待ちの間、接続を握らない
+    if name is None: return jsonify(error='避難所が見つかりません'), 404
+    try:
+        shelter_ingest.submit(shelter_item(shelter_id, current_user.id, log_type))
+    except IngestQueueFull:
+        return jsonify(error='受付が混み合っています。数秒後にもう一度お試しください'), 503
+    except IngestTimeout:
+        current_app.logger.warning("Shelter check-in ack timeout")
+        return jsonify(error='受付の確認に時間がかかっています。しばらくしてから再度お試しください'), 503
+    except Exception as e:
+        current_app.logger.error(f"Shelter check-in error: {e}")
+        return jsonify(error='受付中にエラーが発生しました'), 500
+    message = f'「{name}」に受付しました' if log_type == 'check_in' else f'「{name}」から退所しました'
+    return jsonify(shelter=name, type=log_type, message=message)
@@ -0,0 +1,22 @@
+"""
+Flask 拡張のインスタンス。create_app() で init_app する。
+db は models.py で定義している (モデルの定義に必要なため)。
+"""
+from flask_migrate import Migrate
+from flask_login import LoginManager
+from flask_wtf.csrf import CSRFProtect
+
+from identity import identity_cache
+
+migrate = Migrate()
+csrf = CSRFProtect()
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+login_manager.login_message = 'このページにアクセスするにはログインが必要です。'
+login_manager.login_message_category = 'info'
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    # キャッシュ済みの軽量な Identity を返す (キャッシュミス時のみ DB から id/username/is_admin を取得)
+    return identity_cache.load(int(user_id))
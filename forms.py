@@ -15,23 +15,29 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField('新規登録')
 
 
+# 支援要請のカテゴリ (管理画面の絞り込みでも使用)
+CATEGORY_CHOICES = [
+    ('food', '食料'),
+    ('water', '飲料水'),
+    ('medical', '医療/医薬品'),
+    ('shelter', '避難場所/毛布'),
+    ('other', 'その他')
+]
+
+# 支援要請の優先度 (管理画面の集計でも使用)
+PRIORITY_CHOICES = [
+    ('high', '高 (緊急)'),
+    ('medium', '中'),
+    ('low', '低')
+]
+
+
 class SupportRequestForm(FlaskForm):
     category = SelectField('要請カテゴリ (必須)',
-                           choices=[
-                               ('', '選択してください'),
-                               ('food', '食料'),
-                               ('water', '飲料水'),
-                               ('medical', '医療/医薬品'),
-                               ('shelter', '避難場所/毛布'),
-                               ('other', 'その他')
-                           ],
+                           choices=[('', '選択してください')] + CATEGORY_CHOICES,
                            validators=[DataRequired()])
     priority = RadioField('優先度 (必須)',
-                          choices=[
-                              ('high', '高 (緊急)'),
-                              ('medium', '中'),
-                              ('low', '低')
-                          ],
+                          choices=PRIORITY_CHOICES,
                           validators=[DataRequired()])
     details = TextAreaField('詳細な状況/数量',
                             validators=[Length(max=500)],
@@ -0,0 +1,82 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, User, Group, user_group_association
+
+# SQLite の IN 句に一度に渡す件数
+_CHUNK = 500
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), _CHUNK):
+        yield values[start:start + _CHUNK]
+
+
+def is_member(group_id, user_id):
+    """ 中間テーブルの主キーを使った EXISTS でメンバーかどうかを判定する """
+    stmt = db.select(db.exists().where(
+        user_group_association.c.user_id == user_id,
+        user_group_association.c.group_id == group_id,
+    ))
+    return db.session.execute(stmt).scalar()
+
+
+def groups_for_user(user_id):
+    """ グループ管理画面に表示する列だけを返す (メンバー一覧は読み込まない) """
+    stmt = db.select(Group.id, Group.name, Group.member_count, Group.message_count) \
+        .join(user_group_association, user_group_association.c.group_id == Group.id) \
+        .where(user_group_association.c.user_id == user_id) \
+        .order_by(Group.id)
+    return db.session.execute(stmt).all()
+
+
+def create_group(name, owner_id):
+    """ グループを作成し、作成者をメンバーに加える (コミットは呼び出し側) """
+    group = Group(name=name, member_count=1)
+    db.session.add(group)
+    db.session.flush()
+    db.session.execute(user_group_association.insert().values(user_id=owner_id, group_id=group.id))
+    return group
+
+
+def count_message(group_id):
+    """ グループのメッセージ数を 1 増やす (メッセージの INSERT と同じトランザクションで呼ぶ) """
+    db.session.execute(db.update(Group).where(Group.id == group_id).values(message_count=Group.message_count + 1))
+
+
+def add_members(group_id, user_ids):
+    """ 存在するユーザーのうち、まだメンバーでない人をまとめて追加する。追加した人数を返す """
+    ids = set(user_ids)
+    existing_users = set()
+    already = set()
+    for chunk in _chunks(ids):
+        existing_users.update(db.session.execute(db.select(User.id).where(User.id.in_(chunk))).scalars())
+        already.update(db.session.execute(
+            db.select(user_group_association.c.user_id).where(
+                user_group_association.c.group_id == group_id,
+                user_group_association.c.user_id.in_(chunk),
+            )
+        ).scalars())
+    new_ids = sorted(existing_users - already)
+    if new_ids:
+        stmt = sqlite_insert(user_group_association).on_conflict_do_nothing()
+        # 同時に同じ人を追加した場合に数えすぎないよう、実際に INSERT された行数で数える
+        added = db.session.execute(stmt, [{'user_id': uid, 'group_id': group_id} for uid in new_ids]).rowcount
+        if added:
+            db.session.execute(db.update(Group).where(Group.id == group_id).values(member_count=Group.member_count + added))
+        return added
+    return 0
+
+
+def remove_members(group_id, user_ids):
+    """ 指定したユーザーをまとめてメンバーから外す。外した人数を返す """
+    removed = 0
+    for chunk in _chunks(set(user_ids)):
+        result = db.session.execute(user_group_association.delete().where(
+            user_group_association.c.group_id == group_id,
+            user_group_association.c.user_id.in_(chunk),
+        ))
+        removed += result.rowcount
+    if removed:
+        db.session.execute(db.update(Group).where(Group.id == group_id).values(member_count=Group.member_count - removed))
+    return removed
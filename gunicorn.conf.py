@@ -0,0 +1,40 @@
+"""
+本番用の gunicorn 設定:  gunicorn -c gunicorn.conf.py
+
+  - preload_app: アプリの import・テンプレートの読み込みをマスターで1回だけ行い、ワーカーは fork で引き継ぐ
+  - workers: CPU コア数 (WEB_CONCURRENCY で上書き)。SQLite の書き込みは1本に直列化されるため、
+    コア数より増やしても書き込みは速くならない
+  - threads: 1ワーカーあたりのスレッド数 (GUNICORN_THREADS)。SSE の接続は配信中ずっと1スレッドを使うため、
+    同時に接続する人数 ÷ ワーカー数 より多くする
+
+再起動:
+  kill -HUP <master>   設定を読み直してワーカーを順に入れ替える (preload_app のためコードは読み直さない)
+  kill -USR2 <master>  新しいコードで新しいマスターを起動する。起動を確認したら古いマスターに
+                       kill -WINCH (ワーカー停止) → kill -QUIT で切り替える (接続を落とさない)
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# gthread ではリクエスト処理中もハートビートが続くため、長い SSE 接続でワーカーが強制終了されることはない
+timeout = 30
+# 終了・再起動時に処理中のリクエストを待つ秒数。SSE は切断され、クライアントが Last-Event-ID で再接続する
+graceful_timeout = 30
+keepalive = 5
+# 一定数のリクエストごとにワーカーを入れ替える (メモリの断片化対策)。全ワーカーが同時に入れ替わらないようにずらす
+max_requests = 20000
+max_requests_jitter = 2000
+
+# ハートビート用の一時ファイルをメモリ上に置く (ディスクが遅いとワーカーが止まったと誤判定される)
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # 例: '-' で標準出力
+errorlog = '-'
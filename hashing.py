@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """ ハッシュ計算の待ち行列が満杯。すぐに「混雑中」を返す """
+
+
+class PasswordHasher:
+    """
+    パスワードのハッシュ計算・照合を別プロセスのプールで行うサービス。
+    scrypt/pbkdf2 は CPU を大量に使うため、リクエスト処理スレッドで直接計算すると
+    ログインが集中した際に他のページまで応答しなくなる。
+    同時に受け付ける件数を max_pending に制限し、超えた分は HasherBusy で即座に断る。
+    workers=0 の場合はプールを使わず呼び出し元のスレッドで計算する (開発用)。
+    """
+
+    def __init__(self):
+        self.method = 'scrypt'
+        self.workers = 0
+        self.timeout = 10.0
+        self._slots = threading.BoundedSemaphore(8)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stored_method = None
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        max_pending = app.config['PASSWORD_HASH_MAX_PENDING'] or max(1, self.workers) * 4
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._stored_method = None
+
+    def hash(self, password):
+        """ 現在のコスト設定でハッシュを生成する """
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """ 保存済みハッシュのアルゴリズム・コストが現在の設定と異なるか """
+        if self._stored_method is None:
+            # 'scrypt' → 'scrypt:32768:8:1' のように werkzeug が補完する既定値込みで比較する
+            self._stored_method = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._stored_method
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        if self.workers <= 0:
+            try:
+                return func(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # タイムアウトで諦めた場合も、実際に計算が終わるまで枠を解放しない
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusy()
+
+    def _get_executor(self):
+        # fork した子プロセスでは親のプールを使えないため、プロセスごとに作成する
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # gthread ワーカーはスレッドを持つため fork しない (他のスレッドが持っていたロックが子に残り、止まることがある)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'))
+                self._pid = os.getpid()
+        return self._executor
+
+
+password_hasher = PasswordHasher()
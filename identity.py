@@ -0,0 +1,60 @@
+from flask_login import UserMixin
+
+from cache import TTLCache
+from models import db, User
+
+
+class Identity(UserMixin):
+    """
+    ログイン中のユーザーを表す軽量オブジェクト (current_user)。
+    ページ表示に必要な id / username / is_admin だけを持つ。
+    DB の User を変更する処理では db.session.get(User, current_user.id) で取り直すこと。
+    """
+
+    __slots__ = ('id', 'username', 'is_admin')
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+
+    def __repr__(self):
+        return f'<Identity {self.id} {self.username!r}>'
+
+
+class IdentityCache:
+    """
+    user_loader 用のキャッシュ。認証済みリクエストのたびに User を DB から読まないようにする。
+    別プロセスで行われた変更は ttl 秒以内に反映される。
+    """
+
+    def __init__(self):
+        self._cache = TTLCache()
+
+    def init_app(self, app):
+        self._cache.configure(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL'])
+
+    def load(self, user_id):
+        identity = self._cache.get(user_id)
+        if identity is None:
+            row = db.session.execute(
+                db.select(User.id, User.username, User.is_admin).where(User.id == user_id)
+            ).first()
+            if row is None:
+                return None
+            identity = Identity(row.id, row.username, row.is_admin)
+            self._cache.set(user_id, identity)
+        return identity
+
+    def remember(self, user):
+        """ ログイン直後など、手元にある User からキャッシュを作る """
+        identity = Identity(user.id, user.username, user.is_admin)
+        self._cache.set(user.id, identity)
+        return identity
+
+    def invalidate(self, user_id):
+        """ ユーザー名・パスワード・権限を変更したときに呼ぶ """
+        self._cache.pop(user_id)
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,197 @@
+import atexit
+import datetime
+import os
+import queue
+import threading
+import time
+
+from activity import record_activity_batch
+from models import db, write_gate, SOSSignal, Shelter, ShelterLog
+
+
+class IngestQueueFull(Exception):
+    """ 取り込みキューが満杯 (バックプレッシャー)。クライアントは少し待って再送する """
+
+
+class IngestTimeout(Exception):
+    """ 制限時間内に永続化の完了を確認できなかった """
+
+
+class _Pending:
+    __slots__ = ('item', 'done', 'error')
+
+    def __init__(self, item):
+        self.item = item
+        self.done = threading.Event()
+        self.error = None
+
+
+_STOP = object()
+
+
+class GroupCommitQueue:
+    """
+    書き込みをキューに溜め、専用スレッドが max_delay 秒ごと (または max_batch 件ごと) に
+    1トランザクションでまとめて INSERT する (グループコミット)。
+    submit() はコミット完了まで待ってから戻るため、受付済み = 永続化済みとなる。
+
+    write_batch(connection, items) はトランザクション内で呼ばれ、items をまとめて書き込む。
+    on_commit に登録した関数は、コミット後に items を引数に呼ばれる。
+    """
+
+    def __init__(self, name, write_batch):
+        self.name = name
+        self.write_batch = write_batch
+        self.on_commit = []
+        self.app = None
+        self.max_batch = 500
+        self.max_delay = 0.005
+        self.ack_timeout = 5.0
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._exit_hook_registered = False
+
+    def init_app(self, app):
+        self.app = app
+        self.max_batch = app.config['INGEST_MAX_BATCH']
+        self.max_delay = app.config['INGEST_MAX_DELAY_MS'] / 1000.0
+        self.ack_timeout = app.config['INGEST_ACK_TIMEOUT']
+        self._queue = queue.Queue(maxsize=app.config['INGEST_QUEUE_SIZE'])
+        # テスト等でアプリを何度作っても、終了時の処理は1回だけ登録する
+        if not self._exit_hook_registered:
+            atexit.register(self.shutdown)
+            self._exit_hook_registered = True
+
+    def submit(self, item, wait=True):
+        """ item を取り込む。キューが満杯なら IngestQueueFull、確認待ちが長すぎれば IngestTimeout """
+        self._ensure_started()
+        pending = _Pending(item)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            raise IngestQueueFull(self.name)
+        if not wait:
+            return
+        if not pending.done.wait(self.ack_timeout):
+            raise IngestTimeout(self.name)
+        if pending.error is not None:
+            raise pending.error
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def shutdown(self, timeout=10.0):
+        """ キューに残っている分を書き込んでからスレッドを止める """
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        # fork 後の子プロセスではスレッドが引き継がれないため、プロセスごとに起動する
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'ingest-{self.name}', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if pending is _STOP:
+                    stopping = True
+                    break
+                batch.append(pending)
+            self._flush(batch)
+        # 停止要求より後に入ったものも取りこぼさない
+        rest = []
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is not _STOP:
+                rest.append(pending)
+        for start in range(0, len(rest), self.max_batch):
+            self._flush(rest[start:start + self.max_batch])
+
+    def _flush(self, batch):
+        items = [p.item for p in batch]
+        try:
+            with self.app.app_context():
+                with write_gate.hold(), db.engine.begin() as connection:
+                    self.write_batch(connection, items)
+                for callback in self.on_commit:
+                    try:
+                        callback(items)
+                    except Exception as e:
+                        self.app.logger.error(f"Ingest callback error ({self.name}): {e}")
+        except Exception as e:
+            self.app.logger.error(f"Ingest batch error ({self.name}): {e}")
+            for p in batch:
+                p.error = e
+        finally:
+            for p in batch:
+                p.done.set()
+
+
+# --- SOS 信号 ---
+def write_sos_batch(connection, items):
+    """ SOS 信号をまとめて INSERT し、ユーザーごとの活動集計も同じトランザクションで更新する """
+    connection.execute(db.insert(SOSSignal), items)
+    record_activity_batch(connection, 'sos', items)
+
+
+def sos_item(user_id):
+    """ ボタンが押された時刻で SOS 信号を作る (書き込み時刻ではなく受付時刻を記録) """
+    return {'user_id': user_id, 'timestamp': datetime.datetime.now()}
+
+
+sos_ingest = GroupCommitQueue('sos', write_sos_batch)
+
+
+# --- 避難所の受付 (チェックイン/アウト) ---
+def write_shelter_batch(connection, items):
+    """
+    受付ログをまとめて INSERT し、避難所ごとの増減を合計してから1避難所につき1回だけ UPDATE する。
+    同じ体育館に受付が集中しても、行の更新はバッチごとに1回で済む。
+    """
+    connection.execute(db.insert(ShelterLog), items)
+    deltas = {}
+    for item in items:
+        deltas[item['shelter_id']] = deltas.get(item['shelter_id'], 0) + (1 if item['type'] == 'check_in' else -1)
+    updates = [{'sid': shelter_id, 'delta': delta} for shelter_id, delta in deltas.items() if delta]
+    if updates:
+        # 記録漏れのチェックアウトで負にならないよう 0 で止める
+        connection.execute(
+            db.update(Shelter)
+            .where(Shelter.id == db.bindparam('sid'))
+            .values(current_occupancy=db.func.max(0, Shelter.current_occupancy + db.bindparam('delta'))),
+            updates,
+        )
+
+
+def shelter_item(shelter_id, user_id, log_type):
+    return {'shelter_id': shelter_id, 'user_id': user_id, 'type': log_type, 'timestamp': datetime.datetime.now()}
+
+
+shelter_ingest = GroupCommitQueue('shelter', write_shelter_batch)
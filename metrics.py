@@ -0,0 +1,211 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+# 秒単位のバケット (Prometheus の既定値に近いもの)
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 200)
+SLOW_LOG_MAX_STATEMENTS = 200  # 遅いリクエストの記録用に1リクエストで保持する SQL の最大数
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in zip(names, values))
+
+
+def _sample(name, names, values, value):
+    label_text = _label_text(names, values)
+    return f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}'
+
+
+class Counter:
+    """ ラベルごとの累積カウンタ (Prometheus の counter 型) """
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = dict(self._series)
+        lines.extend(_sample(self.name, self.label_names, labels, value) for labels, value in sorted(series.items()))
+        return lines
+
+
+class Gauge:
+    """ 出力時に collect() (labels -> 値 の dict を返す関数) で現在値を読むゲージ (Prometheus の gauge 型) """
+
+    def __init__(self, name, help_text, label_names, collect):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.collect = collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        lines.extend(_sample(self.name, self.label_names, labels, value)
+                     for labels, value in sorted(self.collect().items()))
+        return lines
+
+
+class Histogram:
+    """ ラベルごとの累積ヒストグラム (Prometheus の histogram 型) """
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = _label_text(self.label_names, labels)
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {values[-1]}')
+        return lines
+
+
+class Metrics:
+    """
+    リクエストごとの処理時間・SQL の実行回数と時間・テンプレートの描画時間を集計する。
+    SQL は SQLAlchemy のエンジンイベント、テンプレートは Flask のシグナルで計測する。
+    値はプロセスごとに持つため、複数ワーカーで動かす場合はワーカーごとの値になる。
+    """
+
+    def __init__(self):
+        self.request_seconds = Histogram('http_request_duration_seconds', 'リクエストの処理時間',
+                                         ('endpoint', 'method', 'status'), TIME_BUCKETS)
+        self.query_count = Histogram('db_queries_per_request', '1リクエストで実行した SQL の数',
+                                     ('endpoint',), COUNT_BUCKETS)
+        self.query_seconds = Histogram('db_query_duration_seconds_per_request', '1リクエストの SQL 実行時間の合計',
+                                       ('endpoint',), TIME_BUCKETS)
+        self.template_seconds = Histogram('template_render_duration_seconds', 'テンプレートの描画時間',
+                                          ('template',), TIME_BUCKETS)
+        self.histograms = [self.request_seconds, self.query_count, self.query_seconds, self.template_seconds]
+        self.collectors = []  # 他のモジュールが登録する Counter / Gauge (admission.py 等)
+        self.slow_request_seconds = 0
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_request_seconds = app.config['METRICS_SLOW_REQUEST_MS'] / 1000.0
+        with app.app_context():
+            from models import db
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+
+    # --- リクエスト ---
+    def _before_request(self):
+        g._metrics = {'started': time.perf_counter(), 'queries': 0, 'query_seconds': 0.0,
+                      'statements': [] if self.slow_request_seconds else None, 'templates': []}
+
+    def _after_request(self, response):
+        stats = g.pop('_metrics', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats['started']
+        endpoint = request.endpoint or 'unknown'
+        self.request_seconds.observe((endpoint, request.method, str(response.status_code)), elapsed)
+        self.query_count.observe((endpoint,), stats['queries'])
+        self.query_seconds.observe((endpoint,), stats['query_seconds'])
+        if self.slow_request_seconds and elapsed >= self.slow_request_seconds:
+            self._log_slow_request(endpoint, elapsed, stats)
+        return response
+
+    def _log_slow_request(self, endpoint, elapsed, stats):
+        slowest = sorted(stats['statements'], key=lambda s: s[0], reverse=True)[:5]
+        details = '\n'.join(f'  {seconds * 1000:8.1f}ms  {" ".join(statement.split())[:500]}'
+                            for seconds, statement in slowest)
+        self.app.logger.warning(
+            f"Slow request: {request.method} {request.path} ({endpoint}) {elapsed * 1000:.1f}ms, "
+            f"{stats['queries']} queries / {stats['query_seconds'] * 1000:.1f}ms" + ('\n' + details if details else '')
+        )
+
+    # --- SQL ---
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_started'].pop()
+        # グループコミット等のバックグラウンド処理はリクエストに含めない
+        if not has_request_context():
+            return
+        stats = g.get('_metrics')
+        if stats is None:
+            return
+        seconds = time.perf_counter() - started
+        stats['queries'] += 1
+        stats['query_seconds'] += seconds
+        if stats['statements'] is not None and len(stats['statements']) < SLOW_LOG_MAX_STATEMENTS:
+            stats['statements'].append((seconds, statement))
+
+    # --- テンプレート ---
+    @staticmethod
+    def _before_render(sender, template, context, **extra):
+        stats = g.get('_metrics')
+        if stats is not None:
+            stats['templates'].append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = g.get('_metrics')
+        if stats is None or not stats['templates']:
+            return
+        self.template_seconds.observe((template.name or 'unknown',), time.perf_counter() - stats['templates'].pop())
+
+    def register(self, collector):
+        """ render() で一緒に出力する Counter / Gauge を追加する """
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def render(self):
+        """ Prometheus のテキスト形式 """
+        lines = []
+        for collector in (*self.histograms, *self.collectors):
+            lines.extend(collector.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
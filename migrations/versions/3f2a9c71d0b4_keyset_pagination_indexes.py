@@ -0,0 +1,52 @@
+"""keyset pagination indexes
+
+Revision ID: 3f2a9c71d0b4
+Revises: 1ad50b420b56
+Create Date: 2026-10-18 09:12:40.118305
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c71d0b4'
+down_revision = '1ad50b420b56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # timestamp 単独インデックスを (timestamp, id) の複合インデックスに置き換える
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_timestamp')
+        batch_op.create_index('ix_chat_message_timestamp_id', ['timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('community_post', schema=None) as batch_op:
+        batch_op.drop_index('ix_community_post_timestamp')
+        batch_op.create_index('ix_community_post_timestamp_id', ['timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('support_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_support_request_timestamp')
+        batch_op.create_index('ix_support_request_timestamp_id', ['timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('group_chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_group_chat_message_timestamp')
+        batch_op.create_index('ix_group_chat_message_group_timestamp_id', ['group_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('group_chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_group_chat_message_group_timestamp_id')
+        batch_op.create_index('ix_group_chat_message_timestamp', ['timestamp'], unique=False)
+
+    with op.batch_alter_table('support_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_support_request_timestamp_id')
+        batch_op.create_index('ix_support_request_timestamp', ['timestamp'], unique=False)
+
+    with op.batch_alter_table('community_post', schema=None) as batch_op:
+        batch_op.drop_index('ix_community_post_timestamp_id')
+        batch_op.create_index('ix_community_post_timestamp', ['timestamp'], unique=False)
+
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_timestamp_id')
+        batch_op.create_index('ix_chat_message_timestamp', ['timestamp'], unique=False)
@@ -0,0 +1,64 @@
+"""sync_version counter for delta sync
+
+Revision ID: 6d2e81b4c9a0
+Revises: c58e0f2b7d64
+Create Date: 2026-10-18 19:12:40.207315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2e81b4c9a0'
+down_revision = 'c58e0f2b7d64'
+branch_labels = None
+depends_on = None
+
+TABLES = ('support_request', 'shelter')
+
+
+def next_version(table):
+    return (f"UPDATE sync_counter SET value = value + 1 WHERE name = '{table}'; "
+            f"UPDATE {table} SET sync_version = (SELECT value FROM sync_counter WHERE name = '{table}') "
+            f"WHERE id = new.id;")
+
+
+def upgrade():
+    # updated_at はアプリ側で書き込みロックの前に付くため、カーソルを DB 内で採番する番号に替える
+    # (列の追加とインデックスだけなので batch でもテーブルは作り直されず、既存のトリガーは残る)
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('sync_version', sa.Integer(), nullable=True))
+        # 既存の行は updated_at の順に番号を振る
+        op.execute(f"UPDATE {table} SET sync_version = (SELECT n FROM (SELECT id, ROW_NUMBER() OVER "
+                   f"(ORDER BY updated_at, id) AS n FROM {table}) AS ordered WHERE ordered.id = {table}.id)")
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(batch_op.f(f'ix_{table}_sync_version'), ['sync_version'], unique=True)
+
+    op.execute('CREATE TABLE IF NOT EXISTS sync_counter (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+    for table in TABLES:
+        op.execute(f"INSERT OR IGNORE INTO sync_counter (name, value) "
+                   f"SELECT '{table}', COALESCE(MAX(sync_version), 0) FROM {table}")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_sync_ai AFTER INSERT ON {table} "
+                   f"BEGIN {next_version(table)} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_sync_au AFTER UPDATE ON {table} "
+                   f"WHEN new.sync_version IS old.sync_version BEGIN {next_version(table)} END")
+
+    op.drop_index('ix_shelter_updated_at', table_name='shelter')
+    op.drop_index('ix_support_request_updated_at_id', table_name='support_request')
+
+
+def downgrade():
+    with op.batch_alter_table('support_request', schema=None) as batch_op:
+        batch_op.create_index('ix_support_request_updated_at_id', ['updated_at', 'id'], unique=False)
+    with op.batch_alter_table('shelter', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_shelter_updated_at'), ['updated_at'], unique=False)
+
+    for table in TABLES:
+        for suffix in ('ai', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {table}_sync_{suffix}')
+        op.drop_index(f'ix_{table}_sync_version', table_name=table)
+        # batch モードの DROP COLUMN はテーブルを作り直してトリガーが消えるため、直接 DROP COLUMN する
+        op.execute(f'ALTER TABLE {table} DROP COLUMN sync_version')
+    op.execute('DROP TABLE IF EXISTS sync_counter')
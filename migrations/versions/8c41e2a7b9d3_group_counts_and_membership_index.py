@@ -0,0 +1,41 @@
+"""group counts and membership index
+
+Revision ID: 8c41e2a7b9d3
+Revises: 3f2a9c71d0b4
+Create Date: 2026-10-18 11:03:52.640218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41e2a7b9d3'
+down_revision = '3f2a9c71d0b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('member_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('user_group_association', schema=None) as batch_op:
+        batch_op.create_index('ix_user_group_association_group_user', ['group_id', 'user_id'], unique=False)
+
+    # 既存データから件数を埋める
+    op.execute(
+        'UPDATE "group" SET '
+        'member_count = (SELECT COUNT(*) FROM user_group_association uga WHERE uga.group_id = "group".id), '
+        'message_count = (SELECT COUNT(*) FROM group_chat_message gcm WHERE gcm.group_id = "group".id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user_group_association', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_group_association_group_user')
+
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_column('message_count')
+        batch_op.drop_column('member_count')
@@ -0,0 +1,49 @@
+"""search index rowid ranges per kind
+
+Revision ID: 9b3f5a7e1c28
+Revises: 6d2e81b4c9a0
+Create Date: 2026-10-18 20:41:09.513862
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3f5a7e1c28'
+down_revision = '6d2e81b4c9a0'
+branch_labels = None
+depends_on = None
+
+# (テーブル, 列, code)
+SOURCES = [
+    ('community_post', 'text', 1),
+    ('chat_message', 'text', 2),
+    ('support_request', 'details', 3),
+]
+
+
+def rebuild(rowid):
+    """ rowid の式 (row を元の行の名前で置き換える) でトリガーと索引の中身を作り直す """
+    op.execute('DELETE FROM search_index')
+    for table, column, code in SOURCES:
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {table}_search_{suffix}')
+        new_rowid, old_rowid = rowid(code, 'new'), rowid(code, 'old')
+        insert_new = (f"INSERT INTO search_index(rowid, body) SELECT {new_rowid}, new.{column} "
+                      f"WHERE new.{column} IS NOT NULL AND new.{column} != '';")
+        delete_old = f"DELETE FROM search_index WHERE rowid = {old_rowid};"
+        op.execute(f"CREATE TRIGGER {table}_search_ai AFTER INSERT ON {table} BEGIN {insert_new} END")
+        op.execute(f"CREATE TRIGGER {table}_search_ad AFTER DELETE ON {table} BEGIN {delete_old} END")
+        op.execute(f"CREATE TRIGGER {table}_search_au AFTER UPDATE OF {column} ON {table} "
+                   f"BEGIN {delete_old} {insert_new} END")
+        op.execute(f"INSERT INTO search_index(rowid, body) SELECT {rowid(code, table)}, {column} "
+                   f"FROM {table} WHERE {column} IS NOT NULL AND {column} != ''")
+
+
+def upgrade():
+    # rowid = (code << 40) | id とし、種類ごとに rowid の範囲を分ける (種類での絞り込みを範囲検索にする)
+    rebuild(lambda code, row: f'({code} << 40) | {row}.id')
+
+
+def downgrade():
+    rebuild(lambda code, row: f'{row}.id * 4 + {code}')
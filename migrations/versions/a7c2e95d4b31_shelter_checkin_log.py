@@ -0,0 +1,46 @@
+"""shelter check-in log and occupancy counter
+
+Revision ID: a7c2e95d4b31
+Revises: f3b6d20a8c15
+Create Date: 2026-10-18 14:21:40.107362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e95d4b31'
+down_revision = 'f3b6d20a8c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('shelter_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('shelter_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('type', sa.String(length=20), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['shelter_id'], ['shelter.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('shelter_log', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_shelter_log_shelter_id'), ['shelter_id'], unique=False)
+        batch_op.create_index('ix_shelter_log_timestamp_id', ['timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('shelter', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('current_occupancy', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    # batch モードはテーブルを作り直して shelter_rtree 同期用のトリガーが消えるため、直接 DROP COLUMN する
+    op.execute('ALTER TABLE shelter DROP COLUMN current_occupancy')
+
+    with op.batch_alter_table('shelter_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_shelter_log_timestamp_id')
+        batch_op.drop_index(batch_op.f('ix_shelter_log_shelter_id'))
+
+    op.drop_table('shelter_log')
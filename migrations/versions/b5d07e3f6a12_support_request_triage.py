@@ -0,0 +1,41 @@
+"""support request triage rank and status
+
+Revision ID: b5d07e3f6a12
+Revises: 8c41e2a7b9d3
+Create Date: 2026-10-18 11:48:09.274551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d07e3f6a12'
+down_revision = '8c41e2a7b9d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('support_request', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('priority_rank', sa.Integer(), server_default='4', nullable=False))
+        batch_op.add_column(sa.Column('status', sa.String(length=20), server_default='open', nullable=False))
+
+    # 既存の要請の優先度を数値に変換して埋める
+    op.execute(
+        "UPDATE support_request SET priority_rank = CASE priority "
+        "WHEN 'high' THEN 1 WHEN 'medium' THEN 2 WHEN 'low' THEN 3 ELSE 4 END"
+    )
+
+    op.create_index('ix_support_request_triage', 'support_request',
+                    ['status', 'priority_rank', sa.text('timestamp DESC'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_support_request_rank', 'support_request',
+                    ['priority_rank', sa.text('timestamp DESC'), sa.text('id DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_support_request_rank', table_name='support_request')
+    op.drop_index('ix_support_request_triage', table_name='support_request')
+    with op.batch_alter_table('support_request', schema=None) as batch_op:
+        batch_op.drop_column('status')
+        batch_op.drop_column('priority_rank')
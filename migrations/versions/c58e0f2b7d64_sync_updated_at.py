@@ -0,0 +1,41 @@
+"""updated_at columns for delta sync
+
+Revision ID: c58e0f2b7d64
+Revises: a7c2e95d4b31
+Create Date: 2026-10-18 15:02:11.839204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c58e0f2b7d64'
+down_revision = 'a7c2e95d4b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 列の追加とインデックス作成だけなので batch でもテーブルは作り直されず、検索・R*Tree 用のトリガーは残る
+    with op.batch_alter_table('support_request', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    with op.batch_alter_table('shelter', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute('UPDATE support_request SET updated_at = timestamp')
+    # SQLAlchemy が書き込む形式 (マイクロ秒6桁) に揃え、カーソルの比較がずれないようにする
+    op.execute("UPDATE shelter SET updated_at = strftime('%Y-%m-%d %H:%M:%S.000000', 'now', 'localtime')")
+
+    with op.batch_alter_table('support_request', schema=None) as batch_op:
+        batch_op.create_index('ix_support_request_updated_at_id', ['updated_at', 'id'], unique=False)
+    with op.batch_alter_table('shelter', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_shelter_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shelter_updated_at', table_name='shelter')
+    op.drop_index('ix_support_request_updated_at_id', table_name='support_request')
+    # batch モードの DROP COLUMN はテーブルを作り直してトリガーが消えるため、直接 DROP COLUMN する
+    op.execute('ALTER TABLE shelter DROP COLUMN updated_at')
+    op.execute('ALTER TABLE support_request DROP COLUMN updated_at')
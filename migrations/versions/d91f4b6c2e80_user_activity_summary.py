@@ -0,0 +1,37 @@
+"""user activity summary
+
+Revision ID: d91f4b6c2e80
+Revises: b5d07e3f6a12
+Create Date: 2026-10-18 12:26:33.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f4b6c2e80'
+down_revision = 'b5d07e3f6a12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 既存データの集計は `flask rebuild-activity` で行う
+    op.create_table('user_activity',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_request_at', sa.DateTime(), nullable=True),
+    sa.Column('last_sos_at', sa.DateTime(), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=True),
+    sa.Column('last_post_at', sa.DateTime(), nullable=True),
+    sa.Column('request_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('sos_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('message_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('post_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_activity')
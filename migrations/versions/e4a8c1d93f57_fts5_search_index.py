@@ -0,0 +1,43 @@
+"""fts5 search index
+
+Revision ID: e4a8c1d93f57
+Revises: d91f4b6c2e80
+Create Date: 2026-10-18 13:05:17.418862
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a8c1d93f57'
+down_revision = 'd91f4b6c2e80'
+branch_labels = None
+depends_on = None
+
+# (テーブル, 列, rowid の code)。rowid = id * 4 + code
+SOURCES = [
+    ('community_post', 'text', 1),
+    ('chat_message', 'text', 2),
+    ('support_request', 'details', 3),
+]
+
+
+def upgrade():
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(body, tokenize='trigram')")
+    for table, column, code in SOURCES:
+        insert_new = (f"INSERT INTO search_index(rowid, body) SELECT new.id * 4 + {code}, new.{column} "
+                      f"WHERE new.{column} IS NOT NULL AND new.{column} != '';")
+        delete_old = f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code};"
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert_new} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete_old} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {column} ON {table} "
+                   f"BEGIN {delete_old} {insert_new} END")
+        op.execute(f"INSERT INTO search_index(rowid, body) SELECT id * 4 + {code}, {column} "
+                   f"FROM {table} WHERE {column} IS NOT NULL AND {column} != ''")
+
+
+def downgrade():
+    for table, column, code in SOURCES:
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_search_{suffix}")
+    op.execute('DROP TABLE IF EXISTS search_index')
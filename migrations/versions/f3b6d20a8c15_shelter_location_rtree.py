@@ -0,0 +1,43 @@
+"""shelter location and rtree index
+
+Revision ID: f3b6d20a8c15
+Revises: e4a8c1d93f57
+Create Date: 2026-10-18 13:48:02.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b6d20a8c15'
+down_revision = 'e4a8c1d93f57'
+branch_labels = None
+depends_on = None
+
+INSERT_NEW = ('INSERT INTO shelter_rtree(id, min_lat, max_lat, min_lng, max_lng) '
+              'SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude '
+              'WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;')
+DELETE_OLD = 'DELETE FROM shelter_rtree WHERE id = old.id;'
+
+
+def upgrade():
+    with op.batch_alter_table('shelter', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+    op.execute('CREATE VIRTUAL TABLE IF NOT EXISTS shelter_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)')
+    op.execute(f'CREATE TRIGGER IF NOT EXISTS shelter_rtree_ai AFTER INSERT ON shelter BEGIN {INSERT_NEW} END')
+    op.execute(f'CREATE TRIGGER IF NOT EXISTS shelter_rtree_ad AFTER DELETE ON shelter BEGIN {DELETE_OLD} END')
+    op.execute(f'CREATE TRIGGER IF NOT EXISTS shelter_rtree_au AFTER UPDATE OF latitude, longitude ON shelter '
+               f'BEGIN {DELETE_OLD} {INSERT_NEW} END')
+
+
+def downgrade():
+    for suffix in ('ai', 'ad', 'au'):
+        op.execute(f'DROP TRIGGER IF EXISTS shelter_rtree_{suffix}')
+    op.execute('DROP TABLE IF EXISTS shelter_rtree')
+
+    with op.batch_alter_table('shelter', schema=None) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -1,16 +1,120 @@
 # r4a1221021/flaskproject1-2/FlaskProject1-2-b35aea4865849d4948fb8a1e18280a969282046f/models.py
 
 import datetime
+import threading
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_login import UserMixin
+from sqlalchemy import event, Select, CompoundSelect, TextualSelect
+from sqlalchemy.orm import validates
+from sqlalchemy.exc import OperationalError
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+REPLICA_BIND = 'replica'
 
-# ユーザーとグループの中間テーブル (変更なし)
+
+class RoutingSession(Session):
+    """
+    読み取り専用のリクエスト (replica.py の read_only) では、primary 向けの SELECT を
+    'replica' の bind に送るセッション。次の場合は常に primary を使う:
+      - flush や INSERT / UPDATE / DELETE などの書き込み
+      - 同じセッションで一度書き込んだ後の読み込み (書いた内容を読めるように)
+      - SELECT 以外の文 (db.text() 等。書き込みかどうか判別できないため。
+        db.text().columns() で SELECT と明示したものは読み込みとして扱う)
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or engine is not self._db.engines.get(None):
+            return engine  # アーカイブ等の別 DB、または明示的な bind
+        if self._flushing or not isinstance(clause, (Select, CompoundSelect, TextualSelect)):
+            self.info['wrote'] = True
+            return engine
+        if self.info.get('use_replica') and not self.info.get('wrote'):
+            return self._db.engines.get(REPLICA_BIND, engine)
+        return engine
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+# --- SQLite 設定 ---
+def configure_sqlite(engine, pragmas):
+    """ SQLite の新しい接続ごとに PRAGMA を実行する connect イベントを登録する """
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+class WriteGate:
+    """
+    プロセス内の書き込みトランザクションを1本に直列化するロック。
+    SQLite は同時に1つしか書き込めないため、ロック競合でエラーにするのではなく
+    ここで順番待ちさせる (他プロセスとの競合は busy_timeout で待つ)。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timeout = 30
+        self.enabled = False
+
+    @contextmanager
+    def hold(self):
+        """ セッションを使わない書き込み (Core の接続等) 用。install() 前は何もしない """
+        if not self.enabled:
+            yield
+            return
+        self.acquire()
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    def acquire(self):
+        if not self._lock.acquire(timeout=self.timeout):
+            raise OperationalError('write gate', None, TimeoutError('書き込み待ちがタイムアウトしました'))
+
+    def install(self, session, timeout=30):
+        """ 最初の書き込み (flush / DML 実行) でロックを取り、トランザクション終了 (commit/rollback) で解放する """
+        self.timeout = timeout
+        self.enabled = True
+
+        def acquire_for(sess):
+            if not sess.info.get('write_gate_held'):
+                self.acquire()
+                sess.info['write_gate_held'] = True
+
+        @event.listens_for(session, 'before_flush')
+        def acquire_on_flush(sess, flush_context, instances):
+            acquire_for(sess)
+
+        @event.listens_for(session, 'do_orm_execute')
+        def acquire_on_dml(orm_execute_state):
+            # session.execute(insert/update/delete) は flush を経由しないためここで取る
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                acquire_for(orm_execute_state.session)
+
+        @event.listens_for(session, 'after_transaction_end')
+        def release_on_end(sess, transaction):
+            if transaction.parent is None and sess.info.pop('write_gate_held', False):
+                self._lock.release()
+
+
+write_gate = WriteGate()
+
+# ユーザーとグループの中間テーブル
+# 主キー (user_id, group_id) はユーザー起点の検索用、追加のインデックスはグループ起点の検索用
 user_group_association = db.Table('user_group_association',
                                   db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-                                  db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True)
+                                  db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True),
+                                  db.Index('ix_user_group_association_group_user', 'group_id', 'user_id')
                                   )
 
 
@@ -25,10 +129,11 @@ class User(UserMixin, db.Model):
     sos_signals = db.relationship('SOSSignal', backref='author', lazy=True)
     chat_messages = db.relationship('ChatMessage', backref='author', lazy=True)
     community_posts = db.relationship('CommunityPost', backref='author', lazy=True)
-    groups = db.relationship('Group', secondary=user_group_association, lazy='subquery',
+    # 所属グループは必要な画面でのみ読み込む (selectinload 等で明示的に指定)
+    groups = db.relationship('Group', secondary=user_group_association, lazy='select',
                              backref=db.backref('members', lazy=True))
     group_chat_messages = db.relationship('GroupChatMessage', backref='author', lazy=True)
-    # shelter_logs relationship removed
+    shelter_logs = db.relationship('ShelterLog', backref='author', lazy=True)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -37,51 +142,145 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 # --- その他のモデル (変更なし) ---
+# 優先度の並び順 (小さいほど緊急)。インデックスで並べ替えられるよう数値で保存する
+PRIORITY_RANKS = {'high': 1, 'medium': 2, 'low': 3}
+UNKNOWN_PRIORITY_RANK = 4
+REQUEST_STATUSES = ('open', 'handled')
+
+
 class SupportRequest(db.Model):
+    # キーセットページネーション用の複合インデックス (timestamp, id)
+    __table_args__ = (db.Index('ix_support_request_timestamp_id', 'timestamp', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     category = db.Column(db.String(100), nullable=False)
     priority = db.Column(db.String(50), nullable=False)
+    priority_rank = db.Column(db.Integer, nullable=False, default=UNKNOWN_PRIORITY_RANK, server_default=str(UNKNOWN_PRIORITY_RANK))
+    status = db.Column(db.String(20), nullable=False, default='open', server_default='open')  # open / handled
     details = db.Column(db.Text, nullable=True)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.now)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.now)
+    # 差分同期 API 用。作成時と status 等の更新時に記録する
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+    # 差分同期のカーソル。書き込みのたびに DB のトリガーが採番する (sync.py)
+    sync_version = db.Column(db.Integer, nullable=True, unique=True, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    @validates('priority')
+    def _set_priority_rank(self, key, value):
+        self.priority_rank = PRIORITY_RANKS.get(value, UNKNOWN_PRIORITY_RANK)
+        return value
+
+
+# トリアージ用: 優先度順 → 新しい順。status で絞る場合と絞らない場合の2本
+db.Index('ix_support_request_triage', SupportRequest.status, SupportRequest.priority_rank,
+         SupportRequest.timestamp.desc(), SupportRequest.id.desc())
+db.Index('ix_support_request_rank', SupportRequest.priority_rank,
+         SupportRequest.timestamp.desc(), SupportRequest.id.desc())
+
 class SOSSignal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.now)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
 class ChatMessage(db.Model):
+    __table_args__ = (db.Index('ix_chat_message_timestamp_id', 'timestamp', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(500), nullable=False)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.now)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.now)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
 class CommunityPost(db.Model):
+    __table_args__ = (db.Index('ix_community_post_timestamp_id', 'timestamp', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.now)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.now)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.now)
+    # メンバー数・メッセージ数は書き込み時に増減させる (コレクションを読み込んで数えない)
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     chat_messages = db.relationship('GroupChatMessage', backref='group', lazy=True)
 
 class GroupChatMessage(db.Model):
+    # グループ単位のキーセットページネーション用 (group_id, timestamp, id)
+    __table_args__ = (db.Index('ix_group_chat_message_group_timestamp_id', 'group_id', 'timestamp', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(500), nullable=False)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.now)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.now)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
 
 
+class ArchiveSegment(db.Model):
+    """
+    古いチャット・投稿をまとめて圧縮したもの (archive.py)。アーカイブ用の別 DB (bind 'archive') に置く。
+    payload は (timestamp, id) 順の [id, user_id, timestamp, text] の配列を JSON にして zlib で圧縮したもの。
+    """
+    __bind_key__ = 'archive'
+    __table_args__ = (
+        # 履歴を遡るときに「カーソルより古い最新のセグメント」から順に読む
+        db.Index('ix_archive_segment_kind_group_newest', 'kind', 'group_id', 'newest_timestamp', 'newest_id'),
+        db.Index('ix_archive_segment_kind_ids', 'kind', 'min_id', 'max_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)          # 'chat' / 'group_chat' / 'posts'
+    group_id = db.Column(db.Integer, nullable=False, default=0)  # グループチャット以外は 0
+    row_count = db.Column(db.Integer, nullable=False)
+    min_id = db.Column(db.Integer, nullable=False)
+    max_id = db.Column(db.Integer, nullable=False)
+    oldest_timestamp = db.Column(db.DateTime, nullable=False)
+    oldest_id = db.Column(db.Integer, nullable=False)
+    newest_timestamp = db.Column(db.DateTime, nullable=False)
+    newest_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now)
+
+
+class UserActivity(db.Model):
+    """ ユーザーごとの最終活動日時と件数 (書き込み時に更新する集計テーブル) """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_request_at = db.Column(db.DateTime, nullable=True)   # 最終支援要請 (安否報告)
+    last_sos_at = db.Column(db.DateTime, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)   # チャット・グループチャット
+    last_post_at = db.Column(db.DateTime, nullable=True)      # コミュニティ投稿
+    request_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    sos_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
 # --- 修正: 避難所モデル (シンプル版) ---
 class Shelter(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
     capacity = db.Column(db.Integer, nullable=False) # 収容可能人数
-    # current_occupancy, latitude, longitude, logs relationship removed
+    # 位置 (WGS84 の度)。近い順の検索は R*Tree の shelter_rtree を使う (shelters.py)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    # 現在の避難者数。受付ログからグループコミットでまとめて加算する (ingest.py の shelter_ingest)
+    current_occupancy = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+    sync_version = db.Column(db.Integer, nullable=True, unique=True, index=True)  # 差分同期のカーソル (sync.py)
+    logs = db.relationship('ShelterLog', backref='shelter', lazy=True)
+
 
-# --- 削除: ShelterLog モデル ---
-# class ShelterLog(db.Model): ... は削除
\ No newline at end of file
+SHELTER_LOG_TYPES = ('check_in', 'check_out')
+
+
+class ShelterLog(db.Model):
+    """ 避難所の受付ログ (追記のみ) """
+    __table_args__ = (db.Index('ix_shelter_log_timestamp_id', 'timestamp', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    shelter_id = db.Column(db.Integer, db.ForeignKey('shelter.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # 'check_in' / 'check_out'
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.now)
\ No newline at end of file
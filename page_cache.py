@@ -0,0 +1,98 @@
+import datetime
+import hashlib
+import threading
+from functools import wraps
+
+from flask import request, session, make_response
+from flask_login import current_user
+
+from cache import TTLCache
+
+
+class PageCache:
+    """
+    描画済みページ (レスポンス本文) と、ページの部品となるデータ (フラグメント) のキャッシュ。
+
+    キャッシュはタグ ('shelters' など) に結び付け、データを変更した処理が bump(tag) を呼ぶと
+    そのタグのバージョンが上がって古いエントリは使われなくなる。
+    レスポンスには ETag / Last-Modified を付けるため、内容が変わっていなければ 304 で済む。
+    bump() はプロセス内にしか届かないため、別プロセスでの変更は ttl 秒以内に反映される。
+    """
+
+    def __init__(self):
+        self._cache = TTLCache()
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._started = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self.enabled = True
+
+    def init_app(self, app):
+        self._cache.configure(app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_TTL'])
+        self.enabled = app.config['PAGE_CACHE_ENABLED']
+
+    def bump(self, *tags):
+        """ タグに結び付いたキャッシュを無効にする (データを変更してコミットした後に呼ぶ) """
+        now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        with self._lock:
+            for tag in tags:
+                version, _ = self._versions.get(tag, (0, self._started))
+                self._versions[tag] = (version + 1, now)
+
+    def _state(self, tags):
+        """ タグのバージョンの組と、最後に変更された時刻 """
+        with self._lock:
+            entries = [self._versions.get(tag, (0, self._started)) for tag in tags]
+        versions = tuple(version for version, _ in entries)
+        last_modified = max((modified for _, modified in entries), default=self._started)
+        return versions, last_modified
+
+    def fragment(self, key, tags, build):
+        """ build() の結果をタグのバージョンごとにキャッシュする。例外の場合はキャッシュしない """
+        if not self.enabled:
+            return build()
+        versions, _ = self._state(tags)
+        cache_key = ('fragment', key, versions)
+        value = self._cache.get(cache_key)
+        if value is None:
+            value = build()
+            self._cache.set(cache_key, value)
+        return value
+
+    def cached(self, *tags, vary_user=False):
+        """
+        ビューのレスポンスをキャッシュするデコレータ。
+        レイアウトが管理者かどうかで変わるため is_admin ごとに分け、
+        ユーザー名などを表示するページは vary_user=True でユーザーごとに分ける。
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method != 'GET':
+                    return view(*args, **kwargs)
+                versions, last_modified = self._state(tags)
+                # ユーザー名の変更後に古い表示が残らないよう、名前もキーに含める
+                user_key = (current_user.get_id(), getattr(current_user, 'username', None)) if vary_user else None
+                cache_key = ('page', request.full_path, versions, bool(getattr(current_user, 'is_admin', False)), user_key)
+                entry = self._cache.get(cache_key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    # エラー時のメッセージを出したページや、通常以外の応答はキャッシュしない
+                    if response.status_code != 200 or session.get('_flashes'):
+                        return response
+                    body = response.get_data()
+                    entry = (body, response.mimetype, hashlib.sha1(body).hexdigest())
+                    self._cache.set(cache_key, entry)
+                body, mimetype, etag = entry
+                response = make_response(body)
+                response.mimetype = mimetype
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                # ログインユーザー向けのページなので共有キャッシュには置かせず、毎回検証させる
+                response.headers['Cache-Control'] = 'private, no-cache'
+                response.vary.add('Cookie')
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+
+page_cache = PageCache()
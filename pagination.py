@@ -0,0 +1,65 @@
+import base64
+import binascii
+import datetime
+
+from models import db
+
+# 1ページあたりの既定件数 (app.config['FEED_PAGE_SIZE'] で上書き可能)
+DEFAULT_PAGE_SIZE = 50
+
+
+def encode_cursor(timestamp, row_id):
+    """ (timestamp, id) を URL に載せられる不透明なカーソル文字列に変換する """
+    raw = f"{timestamp.isoformat()}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """ カーソル文字列を (timestamp, id) に戻す。不正な値の場合は None """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        ts_text, id_text = raw.split('|', 1)
+        return datetime.datetime.fromisoformat(ts_text), int(id_text)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+
+
+class KeysetPage:
+    """ キーセットページネーションの結果 (1ページ分) """
+
+    def __init__(self, items, older_cursor, is_latest):
+        self.items = items
+        self.older_cursor = older_cursor  # さらに古いページがある場合のみ値を持つ
+        self.is_latest = is_latest        # 最新ページかどうか
+
+    @property
+    def has_older(self):
+        return self.older_cursor is not None
+
+
+def keyset_page(query, model, cursor=None, limit=DEFAULT_PAGE_SIZE, oldest_first=False, older=None):
+    """
+    (timestamp, id) の降順で「最新 N 件」または「カーソルより古い N 件」を取得する。
+    OFFSET を使わないため、テーブルが大きくなってもページの取得コストは一定。
+    oldest_first=True の場合はチャット表示用に古い順へ並べ替えて返す。
+    older は older(position, n) で position より古い行を新しい順に最大 n 件返す関数 (アーカイブの読み出し)。
+    query の結果が足りない場合に続きをそこから読む。
+    """
+    position = decode_cursor(cursor) if isinstance(cursor, str) else cursor
+    if position is not None:
+        query = query.filter(db.tuple_(model.timestamp, model.id) < position)
+    rows = query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1).all()
+    if older is not None and len(rows) <= limit:
+        last = (rows[-1].timestamp, rows[-1].id) if rows else position
+        rows += older(last, limit + 1 - len(rows))
+
+    older_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        older_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    if oldest_first:
+        rows.reverse()
+    return KeysetPage(rows, older_cursor, is_latest=position is None)
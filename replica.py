@@ -0,0 +1,49 @@
+import time
+from functools import wraps
+
+from flask import request, session
+
+from models import db, REPLICA_BIND
+
+# 書き込みのあと、この Flask セッションの読み込みを primary に固定しておく時間を入れるキー
+PRIMARY_UNTIL_KEY = '_primary_until'
+
+
+class ReplicaRouter:
+    """
+    読み込みが中心の画面の SELECT を読み取り用の DB ('replica' の bind) に振り分ける。
+    書き込みは常に primary。REPLICA_DATABASE_URL が未設定なら何もしない (すべて primary)。
+
+    複製の遅れで「書き込んだ直後の画面に自分の書き込みが出ない」ことを防ぐため、
+    書き込んだユーザーの読み込みは REPLICA_STICKY_SECONDS の間 primary で行う。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sticky_seconds = 0
+
+    def init_app(self, app):
+        with app.app_context():
+            self.enabled = REPLICA_BIND in db.engines
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        if self.enabled and self.sticky_seconds:
+            app.after_request(self._remember_write)
+
+    def read_only(self, view):
+        """ GET / HEAD のときに読み取り用の DB を使うビューにつけるデコレータ """
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if self.enabled and request.method in ('GET', 'HEAD') \
+                    and session.get(PRIMARY_UNTIL_KEY, 0) < time.time():
+                db.session.info['use_replica'] = True
+            return view(*args, **kwargs)
+        return decorated
+
+    def _remember_write(self, response):
+        # グループコミット等、セッションを通らない書き込みもあるため、成功した POST 等はすべて書き込みとみなす
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            session[PRIMARY_UNTIL_KEY] = time.time() + self.sticky_seconds
+        return response
+
+
+replica = ReplicaRouter()
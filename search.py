@@ -0,0 +1,204 @@
+import re
+
+from markupsafe import Markup, escape
+
+from models import db, User, ChatMessage, CommunityPost, SupportRequest
+
+# 検索対象。rowid = (code << 40) | 元の行の id として1つの FTS5 テーブルにまとめる
+# (rowid から元の行が分かり、削除・更新もトリガーから rowid 指定で行える。
+#  種類ごとに rowid の範囲が分かれるので、種類での絞り込みは rowid の範囲検索になる)
+SEARCH_SOURCES = {
+    'post': {'code': 1, 'table': 'community_post', 'column': 'text', 'model': CommunityPost, 'label': 'コミュニティ'},
+    'chat': {'code': 2, 'table': 'chat_message', 'column': 'text', 'model': ChatMessage, 'label': 'チャット'},
+    'request': {'code': 3, 'table': 'support_request', 'column': 'details', 'model': SupportRequest, 'label': '支援要請'},
+}
+_KIND_BY_CODE = {source['code']: kind for kind, source in SEARCH_SOURCES.items()}
+_ROWID_SHIFT = 40
+_ID_MASK = (1 << _ROWID_SHIFT) - 1
+
+# trigram トークナイザは日本語のように空白で区切らない言語でも部分一致で検索できる。
+# 外部コンテンツテーブル (content=) ではなく本文の複製を持つ通常の FTS5 テーブルにしている。
+# 3つの表を1つの索引にまとめているため content= では元の行を引けず、結果の抜粋も索引の本文から作る
+SEARCH_INDEX_DDL = "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(body, tokenize='trigram')"
+MIN_MATCH_LENGTH = 3  # trigram で索引検索できる最短の語の長さ
+SHORT_TERM_SCAN_ROWS = 5000  # 2文字以下の語だけの検索で、種類ごとに LIKE で調べる新しい行の数
+
+
+def _trigger_ddl(kind):
+    source = SEARCH_SOURCES[kind]
+    table, column, code = source['table'], source['column'], source['code']
+    rowid = f'({code} << {_ROWID_SHIFT}) | {{row}}.id'
+    has_text = f"{{row}}.{column} IS NOT NULL AND {{row}}.{column} != ''"
+    insert_new = (f"INSERT INTO search_index(rowid, body) SELECT {rowid.format(row='new')}, new.{column} "
+                  f"WHERE {has_text.format(row='new')};")
+    delete_old = f"DELETE FROM search_index WHERE rowid = {rowid.format(row='old')};"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {column} ON {table} "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def search_index_ddl():
+    """ 検索用の FTS5 テーブルと同期用トリガーの DDL (何度実行してもよい) """
+    statements = [SEARCH_INDEX_DDL]
+    for kind in SEARCH_SOURCES:
+        statements.extend(_trigger_ddl(kind))
+    return statements
+
+
+def populate_statements():
+    """ 既存データを検索インデックスに入れ直す SQL """
+    statements = ['DELETE FROM search_index']
+    for source in SEARCH_SOURCES.values():
+        column = source['column']
+        statements.append(
+            f"INSERT INTO search_index(rowid, body) SELECT ({source['code']} << {_ROWID_SHIFT}) | id, {column} "
+            f"FROM {source['table']} WHERE {column} IS NOT NULL AND {column} != ''"
+        )
+    return statements
+
+
+def ensure_search_index():
+    for statement in search_index_ddl():
+        db.session.execute(db.text(statement))
+    db.session.commit()
+
+
+def rebuild_search_index():
+    """ インデックスを作り直す。戻り値は登録件数 """
+    ensure_search_index()
+    for statement in populate_statements():
+        db.session.execute(db.text(statement))
+    db.session.commit()
+    return db.session.execute(db.text('SELECT COUNT(*) FROM search_index')).scalar()
+
+
+def _split_terms(query):
+    return [term for term in re.split(r'\s+', query.strip()) if term][:8]
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def highlight(text, terms, width=80):
+    """ 最初に一致した箇所の前後を切り出し、一致部分を <mark> で囲んだ HTML を返す """
+    pattern = re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - width // 2) if first else 0
+    end = min(len(text), start + width)
+    excerpt = text[start:end]
+    parts = []
+    last = 0
+    for match in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[last:match.start()]))
+        parts.append(Markup('<mark>') + escape(match.group(0)) + Markup('</mark>'))
+        last = match.end()
+    parts.append(escape(excerpt[last:]))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return Markup(prefix) + Markup('').join(parts) + Markup(suffix)
+
+
+class SearchResult:
+    def __init__(self, kind, ref_id, body):
+        self.kind = kind
+        self.ref_id = ref_id
+        self.body = body
+        self.label = SEARCH_SOURCES[kind]['label']
+        self.username = None
+        self.timestamp = None
+        self.snippet = None
+
+
+def is_recent_only(query):
+    """ 索引を使えない短い語だけの検索か (新しい行の中からしか探さない) """
+    terms = _split_terms(query)
+    return bool(terms) and all(len(t) < MIN_MATCH_LENGTH for t in terms)
+
+
+def _rowid_range(kind):
+    """ 種類の rowid の範囲 (両端を含む) """
+    low = SEARCH_SOURCES[kind]['code'] << _ROWID_SHIFT
+    return low, low | _ID_MASK
+
+
+def _recent_rowid_ranges(kinds, scan_rows):
+    """ 種類ごとに、新しい scan_rows 件に当たる rowid の範囲を返す (元の表の id の最大値から求める) """
+    ranges = {}
+    for kind in kinds:
+        model = SEARCH_SOURCES[kind]['model']
+        max_id = db.session.execute(db.select(db.func.max(model.id))).scalar()
+        if max_id is not None:
+            low, high = _rowid_range(kind)
+            ranges[kind] = (low | max(max_id - scan_rows + 1, 0), high)
+    return ranges
+
+
+def search(query, kind=None, page=1, per_page=20, short_term_scan_rows=SHORT_TERM_SCAN_ROWS):
+    """
+    検索語 (空白区切りで AND) に一致する投稿を返す。戻り値は (results, has_next)。
+    3文字以上の語は FTS5 の索引で検索して bm25 順に並べ、2文字以下の語は LIKE で絞り込む。
+
+    2文字以下の語 (日本語ではよくある) は trigram の索引を使えず、全件に LIKE をかけると
+    投稿が増えるほど遅くなる。そのため3文字以上の語を含まない検索は、種類ごとに新しい
+    short_term_scan_rows 件の中からだけ探す (古い投稿は3文字以上の語を加えないと見つからない)。
+    """
+    terms = _split_terms(query)
+    if not terms:
+        return [], False
+    match_terms = [t for t in terms if len(t) >= MIN_MATCH_LENGTH]
+    like_terms = [t for t in terms if len(t) < MIN_MATCH_LENGTH]
+
+    where, params = [], {}
+    if match_terms:
+        where.append('search_index MATCH :match')
+        params['match'] = ' '.join('"' + t.replace('"', '""') + '"' for t in match_terms)
+    for i, term in enumerate(like_terms):
+        where.append(f"body LIKE :like{i} ESCAPE '\\'")
+        params[f'like{i}'] = f'%{_escape_like(term)}%'
+    kinds = [kind] if kind in SEARCH_SOURCES else list(SEARCH_SOURCES)
+    params['limit'] = per_page + 1
+    params['offset'] = (page - 1) * per_page
+    if match_terms:
+        if kind in SEARCH_SOURCES:
+            where.append('rowid BETWEEN :low AND :high')
+            params['low'], params['high'] = _rowid_range(kind)
+        sql = f"SELECT rowid, body FROM search_index WHERE {' AND '.join(where)} ORDER BY rank LIMIT :limit OFFSET :offset"
+    else:
+        # rowid の範囲指定は FTS5 が索引で絞り込めるため、種類ごとの範囲だけを読んで UNION ALL する
+        parts = []
+        for k, (low, high) in _recent_rowid_ranges(kinds, short_term_scan_rows).items():
+            params[f'low_{k}'], params[f'high_{k}'] = low, high
+            parts.append(f"SELECT rowid, body FROM search_index WHERE rowid BETWEEN :low_{k} AND :high_{k} "
+                         f"AND {' AND '.join(where)}")
+        if not parts:
+            return [], False
+        sql = (f"SELECT rowid, body FROM ({' UNION ALL '.join(parts)}) "
+               f"ORDER BY rowid & {_ID_MASK} DESC LIMIT :limit OFFSET :offset")
+    # columns() で SELECT と明示し、read_only のビューでは読み取り用の DB で実行させる
+    statement = db.text(sql).columns(db.column('rowid', db.Integer), db.column('body', db.Text))
+    rows = db.session.execute(statement, params).all()
+
+    has_next = len(rows) > per_page
+    results = [SearchResult(_KIND_BY_CODE[rowid >> _ROWID_SHIFT], rowid & _ID_MASK, body)
+               for rowid, body in rows[:per_page]]
+
+    # 投稿者と日時は種類ごとに IN でまとめて取得する
+    for result_kind, source in SEARCH_SOURCES.items():
+        ids = [r.ref_id for r in results if r.kind == result_kind]
+        if not ids:
+            continue
+        model = source['model']
+        meta = {row.id: row for row in db.session.execute(
+            db.select(model.id, model.timestamp, User.username).join(User, model.user_id == User.id).where(model.id.in_(ids))
+        )}
+        for r in results:
+            if r.kind == result_kind and r.ref_id in meta:
+                r.username = meta[r.ref_id].username
+                r.timestamp = meta[r.ref_id].timestamp
+    for r in results:
+        r.snippet = highlight(r.body, terms)
+    return results, has_next
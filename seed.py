@@ -0,0 +1,237 @@
+import bisect
+import datetime
+import random
+import time
+
+from activity import rebuild_activity
+from models import (
+    db, PRIORITY_RANKS, User, Group, user_group_association, ChatMessage, GroupChatMessage,
+    CommunityPost, SupportRequest, SOSSignal, Shelter
+)
+from search import ensure_search_index
+from shelters import ensure_shelter_index
+from sync import ensure_sync_versions
+
+# 既定の件数 (flask seed-db のオプションで変更する)
+DEFAULT_COUNTS = {
+    'users': 10000,
+    'groups': 500,
+    'members_per_group': 20,
+    'messages': 200000,
+    'group_messages': 100000,
+    'posts': 50000,
+    'requests': 50000,
+    'sos': 100000,
+    'shelters': 2000,
+}
+
+# 乱数以外の入力を固定して、同じ seed なら同じデータになるようにする
+BASE_TIME = datetime.datetime(2026, 1, 1, 9, 0, 0)   # 地震の発生時刻
+PERIOD_DAYS = 14                                     # データを分布させる期間
+SURGE_SHARE = 0.7                                    # 発生直後の集中に含まれる割合
+SURGE_HOURS = 12.0                                   # 集中の減衰の時定数 (指数分布の平均)
+BATCH_SIZE = 10000                                   # 1回の executemany で入れる行数
+CENTER = (35.681236, 139.767125)                     # 避難所を配置する地域の中心
+
+SEED_PASSWORD = 'password'
+USERNAME_FORMAT = 'user{:06d}'   # benchmarks/loadtest.py の既定と合わせる
+
+PLACES = ['駅前', '中央公園', '市役所', '第一小学校', '北中学校', '市民体育館', '病院', '商店街', '河川敷', '団地']
+CHAT_TEXTS = [
+    '{place}付近は停電しています', '{place}で給水が始まりました', '{place}の道路が通行止めです',
+    '家族と連絡が取れました', '{place}に避難しています', 'スマホの充電ができる場所はありますか',
+    '{place}で炊き出しがあるそうです', '余震に注意してください', '{place}の橋は渡れます',
+]
+POST_TEXTS = [
+    '{place}で毛布を配布しています ({n}枚)', '{place}の仮設トイレが使えます', '{place}に医療チームが到着しました',
+    '{place}周辺でガス漏れの通報があります', '{place}でペット同伴の避難を受け付けています',
+]
+REQUEST_TEXTS = {
+    'food': '{place}で{n}人分の食料が不足しています',
+    'water': '{place}に飲料水が必要です ({n}リットル)',
+    'medical': '{place}にインスリンと常備薬が必要な方がいます',
+    'shelter': '{place}で毛布が{n}枚足りません',
+    'other': '{place}で高齢者の移動の手助けが必要です',
+}
+PRIORITY_WEIGHTS = [('high', 0.2), ('medium', 0.5), ('low', 0.3)]
+
+
+def sorted_timestamps(rnd, count):
+    """
+    発生直後に集中して徐々に減る (指数分布) 書き込みと、期間全体に広がる書き込みを混ぜた時刻を昇順で返す。
+    id は時刻順に振られるため、実際の運用と同じく id の順 = 時刻の順になる。
+    """
+    period = PERIOD_DAYS * 86400.0
+    offsets = []
+    for _ in range(count):
+        if rnd.random() < SURGE_SHARE:
+            offsets.append(min(rnd.expovariate(1.0 / (SURGE_HOURS * 3600.0)), period))
+        else:
+            offsets.append(rnd.uniform(0.0, period))
+    offsets.sort()
+    return [BASE_TIME + datetime.timedelta(seconds=round(o, 3)) for o in offsets]
+
+
+def _text(rnd, templates):
+    return rnd.choice(templates).format(place=rnd.choice(PLACES), n=rnd.randint(2, 200))
+
+
+def _insert(connection, model_or_table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.execute(db.insert(model_or_table), rows[start:start + BATCH_SIZE])
+
+
+def _insert_stream(connection, model, rows):
+    """ 行のジェネレータを BATCH_SIZE ごとに INSERT する (全件をメモリに持たない) """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            connection.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        connection.execute(db.insert(model), batch)
+
+
+def seed_database(counts, seed, password_hash, log=print):
+    """
+    ベンチマーク用の合成データを投入する (空の DB を前提とする)。
+    件数は counts、乱数は seed で決まり、同じ引数なら常に同じデータになる。
+    テーブルごとに1トランザクションで、BATCH_SIZE 行ずつ executemany で INSERT する。
+    """
+    rnd = random.Random(seed)
+    n_users = counts['users']
+    # 発生直後に同じ人が何度も書き込む偏りを再現するため、ユーザーの選ばれやすさに差をつける
+    cumulative, total = [], 0.0
+    for i in range(n_users):
+        total += 1.0 / (i + 1) ** 0.8
+        cumulative.append(total)
+
+    def pick_user():
+        # ユーザー ID 1 は admin、一般ユーザーは 2 以降
+        return bisect.bisect_left(cumulative, rnd.random() * total) + 2
+
+    def step(name, func):
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            count = func(connection)
+        log(f'{name}: {count}件 ({time.perf_counter() - started:.1f}秒)')
+
+    def users(connection):
+        _insert(connection, User, [{'username': 'admin', 'password_hash': password_hash, 'is_admin': True}])
+        _insert_stream(connection, User, ({'username': USERNAME_FORMAT.format(i), 'password_hash': password_hash,
+                                           'is_admin': False} for i in range(1, n_users + 1)))
+        return n_users + 1
+
+    group_members = {}
+
+    def groups(connection):
+        per_group = min(counts['members_per_group'], n_users)
+        rows, memberships = [], []
+        times = sorted_timestamps(rnd, counts['groups'])
+        for group_id, ts in enumerate(times, start=1):
+            members = set()
+            for _ in range(per_group * 10):
+                if len(members) >= per_group:
+                    break
+                members.add(pick_user())
+            members = sorted(members)
+            group_members[group_id] = members
+            rows.append({'id': group_id, 'name': f'{rnd.choice(PLACES)}の{rnd.choice(["家族", "自治会", "班", "ボランティア"])}{group_id}',
+                         'timestamp': ts, 'member_count': len(members), 'message_count': 0})
+            memberships.extend({'user_id': u, 'group_id': group_id} for u in members)
+        _insert(connection, Group, rows)
+        _insert(connection, user_group_association, memberships)
+        return len(rows)
+
+    def chat(connection):
+        _insert_stream(connection, ChatMessage, ({'text': _text(rnd, CHAT_TEXTS), 'timestamp': ts, 'user_id': pick_user()}
+                                                 for ts in sorted_timestamps(rnd, counts['messages'])))
+        return counts['messages']
+
+    def group_chat(connection):
+        # メンバーのいないグループ (--members-per-group 0) にはメッセージを入れない
+        group_ids = [group_id for group_id, members in group_members.items() if members]
+        if not group_ids:
+            return 0
+        message_counts = dict.fromkeys(group_ids, 0)
+
+        def rows():
+            for ts in sorted_timestamps(rnd, counts['group_messages']):
+                group_id = rnd.choice(group_ids)
+                message_counts[group_id] += 1
+                yield {'text': _text(rnd, CHAT_TEXTS), 'timestamp': ts,
+                       'user_id': rnd.choice(group_members[group_id]), 'group_id': group_id}
+        _insert_stream(connection, GroupChatMessage, rows())
+        connection.execute(
+            db.update(Group).where(Group.id == db.bindparam('gid')).values(message_count=db.bindparam('n')),
+            [{'gid': g, 'n': n} for g, n in message_counts.items() if n],
+        )
+        return counts['group_messages']
+
+    def posts(connection):
+        _insert_stream(connection, CommunityPost, ({'text': _text(rnd, POST_TEXTS), 'timestamp': ts, 'user_id': pick_user()}
+                                                   for ts in sorted_timestamps(rnd, counts['posts'])))
+        return counts['posts']
+
+    def requests(connection):
+        priorities = [p for p, _ in PRIORITY_WEIGHTS]
+        weights = [w for _, w in PRIORITY_WEIGHTS]
+        handled_before = BASE_TIME + datetime.timedelta(days=PERIOD_DAYS / 2)
+
+        def rows():
+            for ts in sorted_timestamps(rnd, counts['requests']):
+                category = rnd.choice(list(REQUEST_TEXTS))
+                priority = rnd.choices(priorities, weights)[0]
+                # 前半の要請は大半が対応済み
+                handled = ts < handled_before and rnd.random() < 0.8
+                yield {'category': category, 'priority': priority, 'priority_rank': PRIORITY_RANKS[priority],
+                       'status': 'handled' if handled else 'open',
+                       'details': REQUEST_TEXTS[category].format(place=rnd.choice(PLACES), n=rnd.randint(2, 200)),
+                       'timestamp': ts,
+                       'updated_at': ts + datetime.timedelta(hours=rnd.uniform(0.5, 48)) if handled else ts,
+                       'user_id': pick_user()}
+        _insert_stream(connection, SupportRequest, rows())
+        return counts['requests']
+
+    def sos(connection):
+        _insert_stream(connection, SOSSignal, ({'timestamp': ts, 'user_id': pick_user()}
+                                               for ts in sorted_timestamps(rnd, counts['sos'])))
+        return counts['sos']
+
+    def shelters(connection):
+        rows = []
+        for i in range(1, counts['shelters'] + 1):
+            capacity = rnd.choice([50, 100, 200, 300, 500, 1000])
+            rows.append({'name': f'{rnd.choice(PLACES)}避難所{i:05d}', 'capacity': capacity,
+                         'current_occupancy': int(capacity * rnd.betavariate(2, 2)),
+                         'latitude': round(CENTER[0] + rnd.gauss(0, 0.15), 6),
+                         'longitude': round(CENTER[1] + rnd.gauss(0, 0.18), 6),
+                         'updated_at': BASE_TIME + datetime.timedelta(hours=rnd.uniform(0, PERIOD_DAYS * 24))})
+        _insert(connection, Shelter, rows)
+        return len(rows)
+
+    step('ユーザー', users)
+    step('グループ', groups)
+    step('チャット', chat)
+    step('グループチャット', group_chat)
+    step('コミュニティ投稿', posts)
+    step('支援要請', requests)
+    step('SOS信号', sos)
+    step('避難所', shelters)
+    started = time.perf_counter()
+    count = rebuild_activity()
+    log(f'活動集計: {count}人 ({time.perf_counter() - started:.1f}秒)')
+
+
+def reset_database():
+    """ すべてのテーブルを作り直す (検索・位置のインデックスと同期用の採番を含む) """
+    for statement in ('DROP TABLE IF EXISTS search_index', 'DROP TABLE IF EXISTS shelter_rtree',
+                      'DROP TABLE IF EXISTS sync_counter'):
+        db.session.execute(db.text(statement))
+    db.session.commit()
+    db.drop_all()
+    db.create_all()
+    ensure_search_index()
+    ensure_shelter_index()
+    ensure_sync_versions()
@@ -0,0 +1,317 @@
+"""
+避難所の一括取り込み・一括出力 (自治体が公開している避難所一覧の CSV / JSON)。
+
+  - ファイルは1行 (1件) ずつ読みながら検証し、正しい行だけを一時テーブルに入れていく
+  - 最後に一時テーブルから1回の INSERT ... ON CONFLICT(name) DO UPDATE で避難所名をキーに登録・更新する
+    (1つのトランザクション。内容が変わらない避難所は更新しないため、差分同期 API にも出てこない)
+  - 不正な行は行番号と理由を記録して飛ばす (他の行は取り込む)
+  - 出力は取り込みと同じ列の CSV / JSON Lines で、そのまま取り込み直せる
+
+CSV の文字コードは UTF-8 (BOM 可) と Shift_JIS (cp932) を自動で判別する。
+JSON は JSON Lines・オブジェクトの配列・GeoJSON の FeatureCollection のいずれか。
+"""
+import csv
+import datetime
+import io
+import json
+
+from models import db, write_gate, Shelter
+
+# 列名の別名 (自治体のデータセットで使われる見出し)。比較は前後の空白を除き、英字は小文字にして行う
+COLUMN_ALIASES = {
+    'name': ('name', '名称', '施設名', '避難所名', '避難所_名称', '施設・場所名'),
+    'capacity': ('capacity', '収容人数', '想定収容人数', '収容可能人数', '受入人数'),
+    'latitude': ('latitude', 'lat', '緯度'),
+    'longitude': ('longitude', 'lng', 'lon', '経度'),
+}
+EXPORT_COLUMNS = ('name', 'capacity', 'latitude', 'longitude', 'current_occupancy')
+
+NAME_MAX_LENGTH = Shelter.__table__.c.name.type.length
+CAPACITY_MAX = 1_000_000    # 収容人数の上限 (桁違いの値や SQLite の INTEGER に入らない値を弾く)
+STAGING_BATCH_SIZE = 1000   # 一時テーブルに一度に INSERT する行数
+MAX_REPORTED_ERRORS = 1000  # 保持する不正な行の最大数 (件数はすべて数える)
+JSON_READ_SIZE = 65536
+
+_STAGING_DDL = ('CREATE TEMP TABLE shelter_import ('
+                'line INTEGER NOT NULL, name TEXT NOT NULL, capacity INTEGER NOT NULL, latitude REAL, longitude REAL)')
+_COUNT_CHANGES = (
+    'SELECT COUNT(*), COALESCE(SUM(s.capacity IS NOT i.capacity OR s.latitude IS NOT i.latitude '
+    'OR s.longitude IS NOT i.longitude), 0) '
+    'FROM temp.shelter_import AS i JOIN shelter AS s ON s.name = i.name'
+)
+# SELECT からの UPSERT は構文の曖昧さを避けるため WHERE true が必要
+_UPSERT = (
+    'INSERT INTO shelter (name, capacity, latitude, longitude, current_occupancy, updated_at) '
+    'SELECT name, capacity, latitude, longitude, 0, :now FROM temp.shelter_import WHERE true ORDER BY line '
+    'ON CONFLICT(name) DO UPDATE SET capacity = excluded.capacity, latitude = excluded.latitude, '
+    'longitude = excluded.longitude, updated_at = excluded.updated_at '
+    'WHERE capacity IS NOT excluded.capacity OR latitude IS NOT excluded.latitude OR longitude IS NOT excluded.longitude'
+)
+
+
+class ShelterImportError(Exception):
+    """ ファイル全体が読めない (形式・文字コード・必須の列が無い等)。行単位の誤りはレポートに記録する """
+
+
+class ImportReport:
+    """ 取り込み結果。errors は (行番号, 避難所名, 理由) のリスト (先頭 MAX_REPORTED_ERRORS 件) """
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+        self.dry_run = False
+
+    def add_error(self, line, name, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, name, message))
+
+    @property
+    def summary(self):
+        prefix = '(確認のみ) ' if self.dry_run else ''
+        return (f'{prefix}{self.rows}行を読み込みました: 新規 {self.inserted}件 / 更新 {self.updated}件 / '
+                f'変更なし {self.unchanged}件 / エラー {self.error_count}件')
+
+
+# --- 読み込み ---
+def _text_stream(stream, encoding):
+    """ バイト列のファイルを文字列として読む。encoding='auto' は先頭を見て UTF-8 か cp932 かを決める """
+    if encoding == 'auto':
+        head = stream.read(JSON_READ_SIZE)
+        stream.seek(0)
+        try:
+            head.decode('utf-8')
+            encoding = 'utf-8-sig'
+        except UnicodeDecodeError as e:
+            # 読み込んだ範囲の末尾で文字が途切れただけなら UTF-8
+            encoding = 'utf-8-sig' if e.start >= len(head) - 3 and e.reason == 'unexpected end of data' else 'cp932'
+    return io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+
+def _column_map(keys):
+    """ 見出し (キー) の一覧から {項目: 見出し} を作る。避難所名・収容人数が無ければ None """
+    normalized = {str(key).strip().lower(): key for key in keys}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias.lower() in normalized:
+                mapping[field] = normalized[alias.lower()]
+                break
+    return mapping if 'name' in mapping and 'capacity' in mapping else None
+
+
+def iter_csv(text):
+    """ CSV を (行番号, {見出し: 値}) として1行ずつ返す """
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        raise ShelterImportError('ファイルが空です')
+    if _column_map(header) is None:
+        raise ShelterImportError('避難所名と収容人数の列が見つかりません (例: name, capacity / 名称, 想定収容人数)')
+    for values in reader:
+        if any(v.strip() for v in values):
+            yield reader.line_num, dict(zip(header, values))
+
+
+def _geojson_record(feature):
+    """ GeoJSON の Feature を properties + 座標 の dict にする """
+    record = dict(feature.get('properties') or {})
+    geometry = feature.get('geometry') or {}
+    if geometry.get('type') == 'Point' and len(geometry.get('coordinates') or ()) >= 2:
+        record.setdefault('longitude', geometry['coordinates'][0])
+        record.setdefault('latitude', geometry['coordinates'][1])
+    return record
+
+
+def iter_json(text):
+    """
+    JSON を (件数, dict) として1件ずつ返す。ファイル全体は読み込まず、JSON_READ_SIZE ずつ読みながら
+    オブジェクトを1つずつ取り出す (JSON Lines・配列・GeoJSON の "features" 配列に対応)
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof, count = '', 0, False, 0
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = text.read(JSON_READ_SIZE)
+        buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+
+    def skip(chars):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    skip(' \t\r\n\ufeff')
+    in_array = False
+    if buffer.startswith('[', position):
+        in_array = True
+        position += 1
+    else:
+        # GeoJSON の FeatureCollection: "features" の配列の中身を1つずつ読む。
+        # JSON Lines を最後まで探さないよう、"features" より前のキー (type, name, crs 等) は先頭の範囲にある前提
+        start = buffer.find('"features"', position)
+        opening = buffer.find('[', start)
+        if 0 <= start and 0 <= opening and '"FeatureCollection"' in buffer[position:start]:
+            in_array = True
+            position = opening + 1
+    while True:
+        skip(' \t\r\n,')
+        if position >= len(buffer):
+            if in_array:
+                raise ShelterImportError(f'JSON が途中で終わっています ({count}件目まで読み込みました)')
+            return
+        if buffer[position] in ']}':
+            return
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ShelterImportError(f'JSON の形式が正しくありません ({count + 1}件目付近: {e.msg})')
+                fill()
+        position = end
+        if isinstance(value, dict) and value.get('type') == 'FeatureCollection':
+            # "features" が先頭の範囲に無かった (キーの順序が違う等) ため、まとめて読んだものを1件ずつ返す
+            for feature in value.get('features') or ():
+                count += 1
+                yield count, _geojson_record(feature)
+            continue
+        count += 1
+        if not isinstance(value, dict):
+            raise ShelterImportError(f'JSON の{count}件目がオブジェクトではありません')
+        yield count, _geojson_record(value) if value.get('type') == 'Feature' else value
+
+
+def _number(value, convert):
+    """ '1,200' や '35.68' を数値にする。空なら None、不正なら ValueError """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return convert(value)
+    text = str(value).strip().replace(',', '').replace('人', '')
+    return convert(float(text)) if text else None
+
+
+def validate(record, mapping):
+    """ 1件を (name, capacity, latitude, longitude) にする。不正なら ValueError (理由) """
+    name = str(record.get(mapping['name']) or '').strip()
+    if not name:
+        raise ValueError('避難所名が空です')
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValueError(f'避難所名が長すぎます ({NAME_MAX_LENGTH}文字まで)')
+    try:
+        capacity = _number(record.get(mapping['capacity']), int)
+    except (ValueError, OverflowError):
+        raise ValueError('収容人数が数値ではありません')
+    if not capacity or capacity <= 0:
+        raise ValueError('収容人数は1以上の数値が必要です')
+    if capacity > CAPACITY_MAX:
+        raise ValueError(f'収容人数が大きすぎます ({CAPACITY_MAX:,}人まで)')
+    try:
+        latitude = _number(record.get(mapping['latitude']), float) if 'latitude' in mapping else None
+        longitude = _number(record.get(mapping['longitude']), float) if 'longitude' in mapping else None
+    except ValueError:
+        raise ValueError('緯度・経度が数値ではありません')
+    if (latitude is None) != (longitude is None):
+        raise ValueError('緯度と経度は両方とも必要です')
+    if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('緯度・経度の範囲が正しくありません')
+    return name, capacity, latitude, longitude
+
+
+def import_shelters(stream, file_format, encoding='auto', dry_run=False):
+    """
+    バイト列のファイル (seek できるもの) から避難所を取り込み、ImportReport を返す。
+    file_format は 'csv' または 'json'。dry_run の場合は検証と件数の集計だけ行い、書き込まない。
+    ファイル全体が読めない場合は ShelterImportError。
+    """
+    report = ImportReport()
+    report.dry_run = dry_run
+    text = _text_stream(stream, encoding)
+    records = iter_csv(text) if file_format == 'csv' else iter_json(text)
+    seen, mappings, batch = set(), {}, []
+    with db.engine.connect() as connection:
+        connection.execute(db.text('DROP TABLE IF EXISTS temp.shelter_import'))
+        connection.execute(db.text(_STAGING_DDL))
+        try:
+            # 一時テーブルへの書き込みは本体の DB をロックしないため、読み込み中は他の書き込みを止めない
+            try:
+                for line, record in records:
+                    report.rows += 1
+                    # JSON は1件ごとにキーが違うことがあるため、キーの組み合わせごとに対応を作る
+                    keys = tuple(record)
+                    if keys not in mappings:
+                        mappings[keys] = _column_map(keys)
+                    mapping = mappings[keys]
+                    if mapping is None:
+                        report.add_error(line, '', '避難所名または収容人数の項目がありません')
+                        continue
+                    try:
+                        name, capacity, latitude, longitude = validate(record, mapping)
+                    except ValueError as e:
+                        report.add_error(line, str(record.get(mapping['name']) or ''), str(e))
+                        continue
+                    if name in seen:
+                        report.add_error(line, name, 'ファイル内で避難所名が重複しています')
+                        continue
+                    seen.add(name)
+                    batch.append({'line': line, 'name': name, 'capacity': capacity,
+                                  'latitude': latitude, 'longitude': longitude})
+                    if len(batch) >= STAGING_BATCH_SIZE:
+                        connection.execute(db.text('INSERT INTO temp.shelter_import VALUES '
+                                                   '(:line, :name, :capacity, :latitude, :longitude)'), batch)
+                        batch = []
+            except UnicodeDecodeError:
+                raise ShelterImportError('文字コードを判別できませんでした (UTF-8 か Shift_JIS で保存してください)')
+            except csv.Error as e:
+                raise ShelterImportError(f'CSV の形式が正しくありません: {e}')
+            if batch:
+                connection.execute(db.text('INSERT INTO temp.shelter_import VALUES '
+                                           '(:line, :name, :capacity, :latitude, :longitude)'), batch)
+            connection.commit()  # 一時テーブルへの書き込みを確定する (本体の DB はロックしていない)
+
+            def count_changes():
+                existing, changed = connection.execute(db.text(_COUNT_CHANGES)).one()
+                report.inserted = len(seen) - existing
+                report.updated = changed
+                report.unchanged = existing - changed
+
+            if dry_run:
+                count_changes()
+            else:
+                with write_gate.hold():
+                    # 読み込みから始めたトランザクションは、その間に別のプロセスが書き込むと書き込みに移れず
+                    # SQLITE_BUSY_SNAPSHOT になる (busy_timeout でも待たない)。最初に書き込みのロックを取る
+                    connection.exec_driver_sql('BEGIN IMMEDIATE')
+                    count_changes()
+                    connection.execute(db.text(_UPSERT), {'now': datetime.datetime.now()})
+                    connection.commit()
+        finally:
+            connection.rollback()
+            connection.execute(db.text('DROP TABLE IF EXISTS temp.shelter_import'))
+            connection.commit()
+    return report
+
+
+# --- 出力 ---
+def export_rows(batch_size):
+    """ 取り込みと同じ列 (EXPORT_COLUMNS) の行を batch_size 件ずつのリストで返す (全件をメモリに載せない) """
+    stmt = db.select(*(getattr(Shelter, column) for column in EXPORT_COLUMNS)).order_by(Shelter.id) \
+        .execution_options(yield_per=batch_size)
+    for partition in db.session.execute(stmt).partitions():
+        yield [list(row) for row in partition]
+
+
+def json_lines(batches):
+    """ export_rows() のバッチを JSON Lines のテキストとしてバッチ単位で返す """
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows)
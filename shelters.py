@@ -0,0 +1,139 @@
+import math
+
+from models import db, Shelter
+
+# 避難所の位置を入れる R*Tree。点なので min = max として登録する
+SHELTER_RTREE_DDL = 'CREATE VIRTUAL TABLE IF NOT EXISTS shelter_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)'
+
+_INSERT_NEW = ('INSERT INTO shelter_rtree(id, min_lat, max_lat, min_lng, max_lng) '
+               'SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude '
+               'WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;')
+_DELETE_OLD = 'DELETE FROM shelter_rtree WHERE id = old.id;'
+
+SHELTER_RTREE_TRIGGERS = [
+    f'CREATE TRIGGER IF NOT EXISTS shelter_rtree_ai AFTER INSERT ON shelter BEGIN {_INSERT_NEW} END',
+    f'CREATE TRIGGER IF NOT EXISTS shelter_rtree_ad AFTER DELETE ON shelter BEGIN {_DELETE_OLD} END',
+    f'CREATE TRIGGER IF NOT EXISTS shelter_rtree_au AFTER UPDATE OF latitude, longitude ON shelter '
+    f'BEGIN {_DELETE_OLD} {_INSERT_NEW} END',
+]
+
+EARTH_RADIUS_KM = 6371.0088  # haversine_km と外接矩形の計算で同じ値を使う
+INITIAL_RADIUS_KM = 2.0     # 最初に探す範囲。見つからなければ倍々に広げる
+MAX_RADIUS_KM = 200.0
+
+
+def ensure_shelter_index():
+    """ R*Tree と同期用トリガーを作成する (何度実行してもよい) """
+    for statement in [SHELTER_RTREE_DDL] + SHELTER_RTREE_TRIGGERS:
+        db.session.execute(db.text(statement))
+    db.session.commit()
+
+
+def rebuild_shelter_index():
+    """ shelter テーブルから R*Tree を作り直す。戻り値は登録件数 """
+    ensure_shelter_index()
+    db.session.execute(db.text('DELETE FROM shelter_rtree'))
+    db.session.execute(db.text(
+        'INSERT INTO shelter_rtree(id, min_lat, max_lat, min_lng, max_lng) '
+        'SELECT id, latitude, latitude, longitude, longitude FROM shelter '
+        'WHERE latitude IS NOT NULL AND longitude IS NOT NULL'
+    ))
+    db.session.commit()
+    return db.session.execute(db.text('SELECT COUNT(*) FROM shelter_rtree')).scalar()
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """ 2点間の大円距離 (km) """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def remaining_capacity():
+    """ 残りの受け入れ可能人数 (SQL 式) """
+    return Shelter.capacity - Shelter.current_occupancy
+
+
+CHECKIN_CODE_PREFIX = 'shelter:'
+
+
+def checkin_code(shelter_id):
+    """ 避難所の入口に掲示する受付用 QR コードの文字列 """
+    return f'{CHECKIN_CODE_PREFIX}{shelter_id}'
+
+
+def parse_checkin_code(text):
+    """ QR コードの文字列 ('shelter:12' または '12') から避難所 ID を取り出す。不正なら None """
+    text = (text or '').strip()
+    if text.startswith(CHECKIN_CODE_PREFIX):
+        text = text[len(CHECKIN_CODE_PREFIX):]
+    return int(text) if text.isdigit() else None
+
+
+def _bounding_boxes(lat, lng, radius_km):
+    """
+    中心から radius_km 以内 (大円距離) を含む矩形の一覧 [(min_lat, max_lat, min_lng, max_lng)]。
+    経度の範囲が ±180 度をまたぐ場合は2つに分ける。
+    """
+    angle = radius_km / EARTH_RADIUS_KM  # 中心角 (ラジアン)
+    dlat = math.degrees(angle)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    # 円の東西の端までの経度差は asin(sin(角度) / cos(緯度))。円が極を含む場合は経度方向を全域とする
+    cos_lat = math.cos(math.radians(lat))
+    if max_lat >= 90 or min_lat <= -90 or math.sin(angle) >= cos_lat:
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+    dlng = math.degrees(math.asin(math.sin(angle) / cos_lat)) + 1e-9  # 浮動小数点の誤差の分だけ広げる
+    min_lng, max_lng = lng - dlng, lng + dlng
+    if min_lng < -180:
+        return [(min_lat, max_lat, min_lng + 360, 180.0), (min_lat, max_lat, -180.0, max_lng)]
+    if max_lng > 180:
+        return [(min_lat, max_lat, min_lng, 180.0), (min_lat, max_lat, -180.0, max_lng - 360)]
+    return [(min_lat, max_lat, min_lng, max_lng)]
+
+
+def _candidates(lat, lng, radius_km, min_remaining):
+    rtree = db.table('shelter_rtree', db.column('id'), db.column('min_lat'), db.column('max_lat'),
+                     db.column('min_lng'), db.column('max_lng'))
+    remaining = remaining_capacity()
+    rows = []
+    # OR でまとめると R*Tree の索引を使えないため、矩形ごとに検索する (矩形は重ならない)
+    for min_lat, max_lat, min_lng, max_lng in _bounding_boxes(lat, lng, radius_km):
+        rows += db.session.execute(
+            db.select(Shelter.id, Shelter.name, Shelter.capacity, Shelter.latitude, Shelter.longitude,
+                      remaining.label('remaining'))
+            .join(rtree, rtree.c.id == Shelter.id)
+            .where(rtree.c.max_lat >= min_lat, rtree.c.min_lat <= max_lat,
+                   rtree.c.max_lng >= min_lng, rtree.c.min_lng <= max_lng,
+                   remaining >= min_remaining)
+        ).all()
+    return rows
+
+
+def nearest_shelters(lat, lng, limit=5, min_remaining=1, max_radius_km=MAX_RADIUS_KM):
+    """
+    (lat, lng) から近い順に、残りの受け入れ人数が min_remaining 以上の避難所を最大 limit 件返す。
+    R*Tree で半径 r の外接矩形内だけを取り出して距離を計算し、r 以内に limit 件揃うまで r を倍にする。
+    矩形は距離の計算と同じ地球半径で求めた円を含む (±180 度をまたぐ場合は2つの矩形) ため、r 以内の件数が揃った時点でそれより近い避難所の取りこぼしはない。
+    """
+    radius = INITIAL_RADIUS_KM
+    while True:
+        radius = min(radius, max_radius_km)
+        within = []
+        for row in _candidates(lat, lng, radius, min_remaining):
+            distance = haversine_km(lat, lng, row.latitude, row.longitude)
+            if distance <= radius:
+                within.append({
+                    'id': row.id,
+                    'name': row.name,
+                    'capacity': row.capacity,
+                    'remaining': row.remaining,
+                    'latitude': row.latitude,
+                    'longitude': row.longitude,
+                    'distance_km': round(distance, 3),
+                })
+        if len(within) >= limit or radius >= max_radius_km:
+            within.sort(key=lambda s: s['distance_km'])
+            return within[:limit]
+        radius *= 2
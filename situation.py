@@ -0,0 +1,218 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from broker import broker
+from models import db, SupportRequest, SOSSignal
+
+# 集計が変わったときに最新の集計を流すチャンネル
+CHANNEL = 'situation'
+
+
+def _minute(timestamp):
+    return int(timestamp.timestamp() // 60)
+
+
+class SituationBoard:
+    """
+    管理者ダッシュボード用の集計をメモリ上に持つ。
+      - 支援要請: 直近 request_window 分のカテゴリ × 優先度ごとの件数
+      - SOS 信号: 直近 sos_window 分の1分ごとの件数と、sos_rollups 分ごとの合計
+
+    プロセスで最初に使われたときに、期間内の行を1回だけ読んで集計を作る。以降は GROUP BY で数え直さず、
+    前回読んだ id より新しい行だけを読んで足し、期間を過ぎた分は1分単位のバケットごと引く
+    (SQLite は書き込みが1本のため、id の小さい行が後からコミットされることはない)。
+    このプロセスでのコミット (支援要請の送信・SOS のグループコミット) は notify() ですぐに読みに行き、
+    他のワーカーでの書き込みは画面を開いている人がいる間だけ poll_seconds ごとに確認する。
+    変化があれば broker の 'situation' チャンネルに集計全体を流す。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.request_window = 24 * 60
+        self.sos_window = 60
+        self.sos_rollups = (5, 15, 60)
+        self.poll_seconds = 2.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+        self._reset()
+
+    def init_app(self, app):
+        self.app = app
+        self.request_window = app.config['SITUATION_REQUEST_WINDOW_MINUTES']
+        self.sos_window = app.config['SITUATION_SOS_WINDOW_MINUTES']
+        self.sos_rollups = tuple(app.config['SITUATION_SOS_ROLLUPS'])
+        self.poll_seconds = app.config['SITUATION_POLL_SECONDS']
+
+    def _reset(self):
+        self._request_buckets = {}  # 分 -> Counter((category, priority))
+        self._request_totals = Counter()
+        self._sos_buckets = {}      # 分 -> 件数
+        self._last_request_id = 0
+        self._last_sos_id = 0
+        self._current_minute = None
+        self._snapshot = None
+        self.version = 0
+
+    # --- 集計 ---
+    def _add_request(self, category, priority, timestamp, oldest):
+        minute = _minute(timestamp)
+        if minute < oldest:
+            return
+        self._request_buckets.setdefault(minute, Counter())[(category, priority)] += 1
+        self._request_totals[(category, priority)] += 1
+
+    def _add_sos(self, timestamp, oldest):
+        minute = _minute(timestamp)
+        if minute >= oldest:
+            self._sos_buckets[minute] = self._sos_buckets.get(minute, 0) + 1
+
+    def _expire(self, now_minute):
+        """ 期間を過ぎたバケットを捨てる。分が変わったら True """
+        oldest = now_minute - self.request_window + 1
+        for minute in [m for m in self._request_buckets if m < oldest]:
+            self._request_totals.subtract(self._request_buckets.pop(minute))
+        self._request_totals = +self._request_totals  # 0 件になったものを消す
+        oldest = now_minute - self.sos_window + 1
+        for minute in [m for m in self._sos_buckets if m < oldest]:
+            del self._sos_buckets[minute]
+        changed = now_minute != self._current_minute
+        self._current_minute = now_minute
+        return changed
+
+    def _bootstrap(self, now_minute):
+        """ 期間内の行を1回ずつ読んで集計を作る """
+        self._last_request_id = db.session.execute(db.select(db.func.max(SupportRequest.id))).scalar() or 0
+        self._last_sos_id = db.session.execute(db.select(db.func.max(SOSSignal.id))).scalar() or 0
+        oldest = now_minute - self.request_window + 1
+        rows = db.session.execute(
+            db.select(SupportRequest.category, SupportRequest.priority, SupportRequest.timestamp)
+            .where(SupportRequest.timestamp >= datetime.datetime.fromtimestamp(oldest * 60),
+                   SupportRequest.id <= self._last_request_id)
+        )
+        for category, priority, timestamp in rows:
+            self._add_request(category, priority, timestamp, oldest)
+        oldest = now_minute - self.sos_window + 1
+        rows = db.session.execute(
+            db.select(SOSSignal.timestamp)
+            .where(SOSSignal.timestamp >= datetime.datetime.fromtimestamp(oldest * 60),
+                   SOSSignal.id <= self._last_sos_id)
+        )
+        for (timestamp,) in rows:
+            self._add_sos(timestamp, oldest)
+
+    def _tail(self, now_minute):
+        """ 前回より新しい行だけを読んで足す。新しい行があれば True """
+        rows = db.session.execute(
+            db.select(SupportRequest.id, SupportRequest.category, SupportRequest.priority, SupportRequest.timestamp)
+            .where(SupportRequest.id > self._last_request_id).order_by(SupportRequest.id)
+        ).all()
+        oldest = now_minute - self.request_window + 1
+        for row_id, category, priority, timestamp in rows:
+            self._add_request(category, priority, timestamp, oldest)
+            self._last_request_id = row_id
+        sos_rows = db.session.execute(
+            db.select(SOSSignal.id, SOSSignal.timestamp)
+            .where(SOSSignal.id > self._last_sos_id).order_by(SOSSignal.id)
+        ).all()
+        oldest = now_minute - self.sos_window + 1
+        for row_id, timestamp in sos_rows:
+            self._add_sos(timestamp, oldest)
+            self._last_sos_id = row_id
+        return bool(rows or sos_rows)
+
+    def refresh(self):
+        """ 新しい行・期間の経過を反映する。変化があれば True (集計を流す) """
+        with self._lock:
+            now_minute = _minute(datetime.datetime.now())
+            if self._pid != os.getpid():
+                # fork 後の子プロセスでは、親の集計 (とスレッド) を引き継がずに作り直す
+                self._reset()
+                self._pid = os.getpid()
+                self._bootstrap(now_minute)
+                changed = True
+            else:
+                changed = self._tail(now_minute)
+            changed = self._expire(now_minute) or changed
+            if changed or self._snapshot is None:
+                self.version += 1
+                self._snapshot = self._build_snapshot(now_minute)
+            snapshot = self._snapshot
+        if changed:
+            broker.publish(CHANNEL, snapshot['version'], snapshot)
+        return changed
+
+    def _build_snapshot(self, now_minute):
+        requests = {}
+        for (category, priority), count in self._request_totals.items():
+            requests.setdefault(category, {})[priority] = count
+        per_minute = [self._sos_buckets.get(minute, 0) for minute in range(now_minute - self.sos_window + 1, now_minute + 1)]
+        return {
+            'version': self.version,
+            'generated_at': datetime.datetime.now().strftime('%H:%M:%S'),
+            'request_window_minutes': self.request_window,
+            'request_total': sum(self._request_totals.values()),
+            'requests': requests,
+            'sos_per_minute': per_minute,  # 古い順。最後が現在の分
+            'sos_totals': {str(n): sum(per_minute[-n:]) for n in self.sos_rollups},
+        }
+
+    # --- 公開用 ---
+    def snapshot(self):
+        """ 最新の集計 (dict)。初回はここで集計を作り、更新用のスレッドを起動する """
+        self.refresh()
+        self._ensure_started()
+        return self._snapshot
+
+    def notify(self):
+        """ 支援要請・SOS をコミットしたあとに呼ぶ。集計を使っていないプロセスでは何もしない """
+        if self._pid == os.getpid():
+            self._wake.set()
+
+    def stream(self, keepalive, max_seconds):
+        """ 集計を SSE で流すジェネレータ (接続時に現在の集計、以降は変化するたびに集計全体) """
+        deadline = time.monotonic() + max_seconds
+        subscription = broker.subscribe(CHANNEL)
+
+        def format_event(payload):
+            return f"id: {payload['version']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        with subscription:
+            current = self.snapshot()
+            db.session.close()  # 配信中は DB コネクションを握らない
+            yield 'retry: 3000\n\n'
+            yield format_event(current)
+            while time.monotonic() < deadline and not subscription.overflowed:
+                item = subscription.get(timeout=keepalive)
+                if item is None:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(item[1])
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='situation', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            woken = self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            if not woken and not broker.subscriber_count(CHANNEL):
+                continue  # 誰も見ていない間は DB を確認しない (次に開かれたときにまとめて読む)
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception as e:
+                self.app.logger.error(f"Situation board refresh error: {e}")
+
+
+situation = SituationBoard()
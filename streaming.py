@@ -0,0 +1,34 @@
+import csv
+import io
+import zlib
+
+
+def csv_chunks(header, batches):
+    """
+    ヘッダ行と行のバッチ (iterable of iterable) を受け取り、CSV テキストをバッチ単位で yield する。
+    1バッチ分のバッファしか持たないため、行数に関係なくメモリ使用量は一定。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return value
+
+    writer.writerow(header)
+    yield drain()
+    for rows in batches:
+        writer.writerows(rows)
+        yield drain()
+
+
+def gzip_chunks(chunks, level=6):
+    """ テキストのチャンク列を gzip 形式のバイト列として逐次圧縮する """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip ヘッダ付き
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
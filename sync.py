@@ -0,0 +1,199 @@
+"""
+モバイル向けの差分同期 API (/api/v1/...) で返すデータを作る。
+
+各フィードは「前回の続き」を表す since を受け取り、それ以降の変更だけを返す。
+  - 追記のみのフィード (chat / posts / groups): since は最後に受け取った id
+  - 更新されるフィード (requests / shelters): since は最後に受け取った sync_version
+行は dict ではなく fields の順に並べた配列で返し、投稿者名は users にまとめて1回だけ載せる。
+
+sync_version は行を作成・更新するたびにトリガーが sync_counter から採番する。
+採番は書き込みのトランザクションの中 (SQLite の書き込みロックを持った状態) で行われるため、
+番号の順にコミットされ、読み手から小さい番号の行が後から現れることはない。
+(アプリ側で付ける updated_at は書き込みロックを取る前の時刻なので、カーソルには使えない)
+"""
+import base64
+import binascii
+import json
+
+from models import db, User, ChatMessage, CommunityPost, GroupChatMessage, SupportRequest, Shelter, user_group_association
+from pagination import decode_cursor
+
+APPEND_FEEDS = ('chat', 'posts', 'groups')
+UPDATE_FEEDS = ('requests', 'shelters')
+FEEDS = APPEND_FEEDS + UPDATE_FEEDS
+
+# sync_version を採番するテーブル
+VERSIONED_TABLES = ('support_request', 'shelter')
+SYNC_COUNTER_DDL = 'CREATE TABLE IF NOT EXISTS sync_counter (name TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+
+
+def _next_version(table):
+    return (f"UPDATE sync_counter SET value = value + 1 WHERE name = '{table}'; "
+            f"UPDATE {table} SET sync_version = (SELECT value FROM sync_counter WHERE name = '{table}') "
+            f"WHERE id = new.id;")
+
+
+def sync_version_ddl():
+    """ 採番用のテーブルとトリガーの DDL (何度実行してもよい) """
+    statements = [SYNC_COUNTER_DDL]
+    for table in VERSIONED_TABLES:
+        # 既存の行の最大値から始める (番号を使い回さない)
+        statements.append(f"INSERT OR IGNORE INTO sync_counter (name, value) "
+                          f"SELECT '{table}', COALESCE(MAX(sync_version), 0) FROM {table}")
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS {table}_sync_ai AFTER INSERT ON {table} "
+                          f"BEGIN {_next_version(table)} END")
+        # トリガー自身の UPDATE では sync_version が変わるので、WHEN で再度の採番を防ぐ
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS {table}_sync_au AFTER UPDATE ON {table} "
+                          f"WHEN new.sync_version IS old.sync_version BEGIN {_next_version(table)} END")
+    return statements
+
+
+def ensure_sync_versions():
+    for statement in sync_version_ddl():
+        db.session.execute(db.text(statement))
+    db.session.commit()
+
+
+class InvalidCursor(ValueError):
+    """ since / cursor の値が不正 """
+
+
+def _epoch(value):
+    return int(value.timestamp()) if value else None
+
+
+def _append_feed(model, fields, row, since, limit, where=()):
+    """ id が since より大きい行を id 順に返す。since が無ければ最新 limit 件 """
+    query = db.select(model).where(*where)
+    if since is None:
+        rows = db.session.execute(query.order_by(model.id.desc()).limit(limit)).scalars().all()
+        rows.reverse()
+        more = False
+    else:
+        rows = db.session.execute(query.where(model.id > since).order_by(model.id.asc()).limit(limit + 1)).scalars().all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+    cursor = rows[-1].id if rows else since
+    return {'fields': fields, 'rows': [row(r) for r in rows], 'cursor': cursor, 'more': more}, rows
+
+
+def _update_feed(model, fields, row, since, limit):
+    """ sync_version が since より大きい行を更新順に返す。新規作成も更新として扱う """
+    since = _parse_version(since)
+    query = db.select(model)
+    if since is not None:
+        query = query.where(model.sync_version > since)
+    rows = db.session.execute(query.order_by(model.sync_version.asc()).limit(limit + 1)).scalars().all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1].sync_version if rows else since
+    return {'fields': fields, 'rows': [row(r) for r in rows], 'cursor': cursor, 'more': more}, rows
+
+
+def _parse_version(value):
+    """
+    更新フィードの since を sync_version に戻す。
+    以前の (updated_at, id) のカーソル文字列は None (最初から同期し直す) とする
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        if decode_cursor(value) is not None:
+            return None
+    raise InvalidCursor(value)
+
+
+def chat_feed(since, limit):
+    return _append_feed(ChatMessage, ['id', 'user_id', 'text', 'ts'],
+                        lambda m: [m.id, m.user_id, m.text, _epoch(m.timestamp)], since, limit)
+
+
+def post_feed(since, limit):
+    return _append_feed(CommunityPost, ['id', 'user_id', 'text', 'ts'],
+                        lambda p: [p.id, p.user_id, p.text, _epoch(p.timestamp)], since, limit)
+
+
+def group_feed(user_id, since, limit, group_id=None):
+    """ 所属しているグループのメッセージ (group_id 指定時はそのグループのみ) """
+    member_of = db.select(user_group_association.c.group_id).where(user_group_association.c.user_id == user_id)
+    where = [GroupChatMessage.group_id.in_(member_of)]
+    if group_id is not None:
+        where.append(GroupChatMessage.group_id == group_id)
+    return _append_feed(GroupChatMessage, ['id', 'group_id', 'user_id', 'text', 'ts'],
+                        lambda m: [m.id, m.group_id, m.user_id, m.text, _epoch(m.timestamp)], since, limit, where)
+
+
+def request_feed(since, limit):
+    return _update_feed(SupportRequest, ['id', 'user_id', 'category', 'priority', 'status', 'details', 'ts', 'updated'],
+                        lambda r: [r.id, r.user_id, r.category, r.priority, r.status, r.details,
+                                   _epoch(r.timestamp), _epoch(r.updated_at)], since, limit)
+
+
+def shelter_feed(since, limit):
+    return _update_feed(Shelter, ['id', 'name', 'capacity', 'occupancy', 'lat', 'lng', 'updated'],
+                        lambda s: [s.id, s.name, s.capacity, s.current_occupancy, s.latitude, s.longitude,
+                                   _epoch(s.updated_at)], since, limit)
+
+
+def usernames(rows):
+    """ 行に含まれる投稿者の {id: username} (JSON のキーは文字列になる) """
+    ids = {r.user_id for r in rows if getattr(r, 'user_id', None) is not None}
+    if not ids:
+        return {}
+    return {str(uid): name for uid, name in db.session.execute(db.select(User.id, User.username).where(User.id.in_(ids)))}
+
+
+def feed_payload(name, build):
+    """ 1つのフィードだけを返すエンドポイント用 """
+    feed, rows = build()
+    return {name: feed, 'users': usernames(rows)}
+
+
+def sync_payload(user_id, cursor, limit):
+    """ すべてのフィードの差分を1回で返す。cursor は前回の応答の cursor """
+    since = decode_sync_cursor(cursor)
+    builders = {
+        'chat': lambda s: chat_feed(s, limit),
+        'posts': lambda s: post_feed(s, limit),
+        'groups': lambda s: group_feed(user_id, s, limit),
+        'requests': lambda s: request_feed(s, limit),
+        'shelters': lambda s: shelter_feed(s, limit),
+    }
+    payload, all_rows, next_since = {}, [], {}
+    for name in FEEDS:
+        feed, rows = builders[name](since.get(name))
+        payload[name] = {'fields': feed['fields'], 'rows': feed['rows'], 'more': feed['more']}
+        next_since[name] = feed['cursor']
+        all_rows.extend(rows)
+    payload['users'] = usernames(all_rows)
+    payload['cursor'] = encode_sync_cursor(next_since)
+    return payload
+
+
+def encode_sync_cursor(since):
+    raw = json.dumps({k: v for k, v in since.items() if v is not None}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_sync_cursor(token):
+    """ 同期カーソルを {feed: since} に戻す。空なら初回同期 """
+    if not token:
+        return {}
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        since = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError, binascii.Error):
+        raise InvalidCursor(token)
+    if not isinstance(since, dict):
+        raise InvalidCursor(token)
+    for name in APPEND_FEEDS:
+        if name in since and not isinstance(since[name], int):
+            raise InvalidCursor(token)
+    for name in UPDATE_FEEDS:
+        if name in since:
+            since[name] = _parse_version(since[name])
+    return since
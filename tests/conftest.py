@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# config.py は import 時に環境変数を読むため、アプリを import する前に一時ディレクトリの DB を指定する
+_TMP = tempfile.mkdtemp(prefix='flaskproject-tests-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(_TMP, 'test.db'),
+    'ARCHIVE_DATABASE_URL': 'sqlite:///' + os.path.join(_TMP, 'archive.db'),
+    'JINJA_BYTECODE_CACHE_DIR': '',
+    'ADMISSION_ENABLED': '0',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, User  # noqa: E402
+from search import ensure_search_index  # noqa: E402
+from shelters import ensure_shelter_index  # noqa: E402
+from sync import ensure_sync_versions  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    app = create_app('development')
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        # DDL を直接実行して作るテーブルは drop_all で消えないため、先に消しておく
+        for table in ('search_index', 'shelter_rtree', 'sync_counter'):
+            db.session.execute(db.text(f'DROP TABLE IF EXISTS {table}'))
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        ensure_search_index()
+        ensure_shelter_index()
+        ensure_sync_versions()
+        db.session.add(User(username='admin', password_hash=generate_password_hash('pw'), is_admin=True))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    """ 管理者でログイン済みのクライアント """
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'pw', 'submit': 'ログイン'})
+    return client
@@ -0,0 +1,15 @@
+import datetime
+
+import communication
+from archive import ArchivedMessage
+from pagination import KeysetPage
+
+
+def test_archived_message_of_deleted_user_renders(client, monkeypatch):
+    """ 退会したユーザーのアーカイブ済みメッセージ (author が None) も表示できる """
+    message = ArchivedMessage(1, 999, None, datetime.datetime(2026, 1, 1), '古いメッセージ')
+    monkeypatch.setattr(communication, 'keyset_page', lambda *args, **kwargs: KeysetPage([message], None, False))
+    for path in ('/chat', '/community'):
+        body = client.get(path).get_data(as_text=True)
+        assert '古いメッセージ' in body
+        assert '退会済み' in body
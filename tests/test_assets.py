@@ -0,0 +1,19 @@
+import pytest
+from flask import Flask
+
+from assets import AssetManifest
+
+
+def test_pages_do_not_load_cdn_by_default(client):
+    body = client.get('/qr').get_data(as_text=True)
+    assert 'cdn.tailwindcss.com' not in body
+    assert 'unpkg.com' not in body
+
+
+def test_missing_build_fails_when_assets_are_required(monkeypatch):
+    app = Flask(__name__)
+    app.config.update(ASSET_CDN_FALLBACK=False, ASSETS_REQUIRED=True)
+    manifest = AssetManifest()
+    monkeypatch.setattr(manifest, 'load', lambda: None)
+    with pytest.raises(RuntimeError, match='flask build-assets'):
+        manifest.init_app(app)
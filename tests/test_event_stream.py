@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+
+from sqlalchemy import event
+
+import communication
+import groups as group_service
+from broker import broker
+from models import db, ChatMessage, GroupChatMessage
+
+
+def _add_message(text):
+    message = ChatMessage(text=text, user_id=1)
+    db.session.add(message)
+    db.session.commit()
+    return message.id
+
+
+def _add_group_message(group_id, text):
+    message = GroupChatMessage(text=text, user_id=1, group_id=group_id)
+    db.session.add(message)
+    db.session.commit()
+    return message.id
+
+
+def _event_ids(chunks, count):
+    ids = []
+    for chunk in chunks:
+        for line in chunk.decode('utf-8').splitlines():
+            if line.startswith('data: '):
+                ids.append(json.loads(line[len('data: '):])['id'])
+        if len(ids) >= count:
+            break
+    return ids
+
+
+def test_lower_id_from_other_worker_is_not_skipped(app, client):
+    """ 別ワーカーが書いた行 (DB のみ) より大きい id がブローカーに届いても、その行を飛ばさない """
+    # 取りこぼした場合もテストが止まらないよう、接続は短時間で終わらせる
+    app.config.update(SSE_KEEPALIVE_SECONDS=1.5, SSE_MAX_STREAM_SECONDS=3)
+    with app.app_context():
+        first = _add_message('1')
+
+    response = client.get(f'/chat/stream?after={first}', buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+
+    def write_later():
+        time.sleep(0.3)  # 配信側が最初の DB 確認を終えて待機に入ってから書き込む
+        with app.app_context():
+            _add_message('2')  # 別ワーカーの書き込み: このプロセスのブローカーには届かない
+            third = _add_message('3')
+        broker.publish('chat', third, {'id': third, 'text': '3', 'user_id': 1, 'username': 'admin'})
+
+    writer = threading.Thread(target=write_later)
+    writer.start()
+    try:
+        assert sorted(_event_ids(chunks, 2)) == [first + 1, first + 2]
+    finally:
+        writer.join()
+        response.close()
+
+
+def test_catch_up_reads_every_batch(app, client, monkeypatch):
+    """ 接続時の差分が1回の読み込み件数を超えても、続けて読んですべて送る """
+    monkeypatch.setattr(communication, 'SSE_CATCH_UP_BATCH', 2)
+    app.config.update(SSE_KEEPALIVE_SECONDS=1, SSE_MAX_STREAM_SECONDS=0)  # 最初の読み込みだけで終わる
+    with app.app_context():
+        ids = [_add_message(str(i)) for i in range(6)]
+
+    response = client.get(f'/chat/stream?after={ids[0]}')
+    assert _event_ids(response.response, 5) == ids[1:]
+
+
+def test_group_event_after_other_group_message_is_sent_without_db(app, client):
+    """ 他のグループのメッセージで id が飛んでいても、ブローカーのイベントは DB を読まずにそのまま送る """
+    app.config.update(SSE_KEEPALIVE_SECONDS=1.5, SSE_MAX_STREAM_SECONDS=3)
+    with app.app_context():
+        group_id = group_service.create_group('A', 1).id
+        other_id = group_service.create_group('B', 1).id
+        db.session.commit()
+        first = _add_group_message(group_id, '1')
+
+    response = client.get(f'/group/{group_id}/chat/stream?after={first}', buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+
+    queries = []
+
+    def record(conn, cursor, statement, *args):
+        if 'FROM group_chat_message' in statement:
+            queries.append(statement)
+
+    def write_later():
+        time.sleep(0.3)  # 配信側が最初の DB 確認を終えて待機に入ってから書き込む
+        with app.app_context():
+            _add_group_message(other_id, 'other')
+            mine = _add_group_message(group_id, '2')
+            event.listen(db.engine, 'before_cursor_execute', record)
+        broker.publish(f'group:{group_id}', mine, {'id': mine, 'text': '2', 'user_id': 1, 'username': 'admin'})
+
+    writer = threading.Thread(target=write_later)
+    writer.start()
+    try:
+        assert _event_ids(chunks, 1) == [first + 2]
+        assert queries == []
+    finally:
+        writer.join()
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', record)
+        response.close()
@@ -0,0 +1,12 @@
+import atexit
+
+from ingest import GroupCommitQueue
+
+
+def test_exit_hook_is_registered_once(app, monkeypatch):
+    registered = []
+    monkeypatch.setattr(atexit, 'register', registered.append)
+    ingest_queue = GroupCommitQueue('test', lambda connection, items: None)
+    ingest_queue.init_app(app)
+    ingest_queue.init_app(app)
+    assert registered == [ingest_queue.shutdown]
@@ -0,0 +1,42 @@
+from models import db, ChatMessage, CommunityPost
+from search import search
+
+
+def _add_posts(texts):
+    for text in texts:
+        db.session.add(CommunityPost(text=text, user_id=1))
+    db.session.commit()
+
+
+def test_short_terms_only_scan_recent_rows(app):
+    """ 2文字以下の語だけの検索は新しい行の中からだけ探し、3文字以上の語があれば全件から探す """
+    with app.app_context():
+        _add_posts(['古い給水の案内'] + [f'投稿{i}' for i in range(5)] + ['新しい給水の案内'])
+
+        results, has_next = search('給水', short_term_scan_rows=3)
+        assert [r.body for r in results] == ['新しい給水の案内']
+        assert not has_next
+
+        results, _ = search('給水の案内', short_term_scan_rows=3)
+        assert sorted(r.body for r in results) == ['古い給水の案内', '新しい給水の案内']
+
+        results, _ = search('給水', kind='chat', short_term_scan_rows=3)
+        assert results == []
+
+
+def test_kinds_have_separate_rowid_ranges(app):
+    """ 種類ごとの新しい行は、ほかの種類の行数に関係なくその種類の範囲から探す """
+    with app.app_context():
+        db.session.add(ChatMessage(text='給水車の到着', user_id=1))
+        _add_posts([f'投稿{i}' for i in range(5)] + ['給水の案内'])
+
+        results, _ = search('給水', short_term_scan_rows=3)
+        assert sorted((r.kind, r.ref_id) for r in results) == [('chat', 1), ('post', 6)]
+        results, _ = search('給水車', kind='chat')
+        assert [(r.kind, r.ref_id, r.username) for r in results] == [('chat', 1, 'admin')]
+        assert search('給水車', kind='post')[0] == []
+
+
+def test_search_page_notes_recent_only_scope(client):
+    assert '新しい5000件の中から探します' in client.get('/search?q=給水').get_data(as_text=True)
+    assert '新しい5000件の中から探します' not in client.get('/search?q=給水の案内').get_data(as_text=True)
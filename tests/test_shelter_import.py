@@ -0,0 +1,59 @@
+import io
+import sqlite3
+
+from sqlalchemy import event
+
+from models import db, Shelter
+from shelter_data import import_shelters
+
+
+def test_oversized_upload_is_rejected_before_form_parsing(app, client):
+    """ 最大サイズを超えるファイルは、CSRF の確認でフォームを読む時点で 413 にする """
+    app.config.update(SHELTER_IMPORT_MAX_BYTES=1024, WTF_CSRF_ENABLED=True)
+    body = ('name,capacity\n' + '第一小学校,100\n' * 200).encode('utf-8')
+    response = client.post('/admin/shelters/import', data={'file': (io.BytesIO(body), 'shelters.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+
+
+def test_out_of_range_capacity_is_reported_per_line(app):
+    with app.app_context():
+        body = '避難所名,収容人数\n第一小学校,100\n中央公民館,1e30\n市民体育館,1e400\n'.encode('utf-8')
+        report = import_shelters(io.BytesIO(body), 'csv')
+        assert report.inserted == 1
+        assert [line for line, *_ in report.errors] == [3, 4]
+        assert db.session.execute(db.select(Shelter.name)).scalars().all() == ['第一小学校']
+
+
+def test_import_holds_write_lock_while_counting(app):
+    """ 件数の確認から UPSERT までの間に他のプロセスが書き込んでも、取り込みが失敗しない """
+    with app.app_context():
+        db.session.add(Shelter(name='既存', capacity=10))
+        db.session.commit()
+        path = db.engine.url.database
+        engine = db.engine
+    other = sqlite3.connect(path, timeout=0)
+    other.execute('PRAGMA journal_mode=WAL')
+    outcomes = []
+
+    def write_from_other_process(conn, cursor, statement, *args):
+        if 'FROM temp.shelter_import' in statement and 'COUNT(*)' in statement:
+            try:
+                other.execute("UPDATE shelter SET capacity = capacity + 1 WHERE name = '既存'")
+                other.commit()
+                outcomes.append('written')
+            except sqlite3.OperationalError:
+                other.rollback()
+                outcomes.append('locked')
+
+    event.listen(engine, 'after_cursor_execute', write_from_other_process)
+    try:
+        with app.app_context():
+            report = import_shelters(io.BytesIO('name,capacity\n第一小学校,100\n'.encode('utf-8')), 'csv')
+    finally:
+        event.remove(engine, 'after_cursor_execute', write_from_other_process)
+        engine.dispose()
+        other.execute('PRAGMA journal_mode=DELETE')
+        other.close()
+    assert outcomes == ['locked']
+    assert report.inserted == 1
@@ -0,0 +1,29 @@
+import math
+
+from models import db, Shelter
+from shelters import EARTH_RADIUS_KM, haversine_km, nearest_shelters
+
+
+def _add_shelter(name, lat, lng):
+    db.session.add(Shelter(name=name, capacity=100, latitude=lat, longitude=lng))
+    db.session.commit()
+
+
+def test_shelter_near_edge_of_radius_is_found(app):
+    """ 半径ぎりぎりの避難所も R*Tree の矩形で落とさない """
+    with app.app_context():
+        lat = 35.0 + math.degrees(1.999 / EARTH_RADIUS_KM)  # 真北に 1.999 km
+        _add_shelter('北の避難所', lat, 139.0)
+        assert haversine_km(35.0, 139.0, lat, 139.0) < 2.0
+        found = nearest_shelters(35.0, 139.0, limit=1, max_radius_km=2.0)
+        assert [s['name'] for s in found] == ['北の避難所']
+
+
+def test_search_crosses_antimeridian(app):
+    with app.app_context():
+        _add_shelter('東側', -17.0, 179.99)
+        _add_shelter('西側', -17.0, -179.99)
+        found = nearest_shelters(-17.0, 179.995, limit=2, max_radius_km=5.0)
+        assert sorted(s['name'] for s in found) == ['東側', '西側']
+        found = nearest_shelters(-17.0, -179.995, limit=2, max_radius_km=5.0)
+        assert sorted(s['name'] for s in found) == ['東側', '西側']
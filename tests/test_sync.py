@@ -0,0 +1,36 @@
+import datetime
+
+import pytest
+
+import sync
+from models import db, Shelter
+
+
+def test_update_with_earlier_timestamp_is_not_skipped(app):
+    """ 書き込みロックを取る前の時刻で更新された行も、前回のカーソルより後として返す """
+    with app.app_context():
+        first = Shelter(name='第一小学校', capacity=100)
+        db.session.add_all([first, Shelter(name='中央公民館', capacity=50)])
+        db.session.commit()
+        feed, _ = sync.shelter_feed(None, 10)
+        assert [row[1] for row in feed['rows']] == ['第一小学校', '中央公民館']
+
+        # 別のワーカーが先に時刻を取り、あとからコミットした更新
+        first.current_occupancy = 10
+        first.updated_at = datetime.datetime(2000, 1, 1)
+        db.session.commit()
+        feed, _ = sync.shelter_feed(feed['cursor'], 10)
+        assert [row[1] for row in feed['rows']] == ['第一小学校']
+        assert feed['rows'][0][3] == 10
+
+        assert sync.shelter_feed(feed['cursor'], 10)[0]['rows'] == []
+
+
+def test_legacy_cursor_restarts_sync(app):
+    with app.app_context():
+        db.session.add(Shelter(name='第一小学校', capacity=100))
+        db.session.commit()
+        legacy = 'MjAyNi0xMC0xOFQxMjowMDowMHwx'  # 以前の (updated_at, id) 形式
+        assert len(sync.shelter_feed(legacy, 10)[0]['rows']) == 1
+        with pytest.raises(sync.InvalidCursor):
+            sync.shelter_feed('not-a-cursor', 10)
@@ -0,0 +1,57 @@
+import base64
+import binascii
+import datetime
+
+from models import db, SupportRequest, PRIORITY_RANKS
+
+DEFAULT_TRIAGE_PAGE_SIZE = 50
+
+
+def encode_triage_cursor(report):
+    raw = f"{report.priority_rank}|{report.timestamp.isoformat()}|{report.id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_triage_cursor(token):
+    """ カーソル文字列を (priority_rank, timestamp, id) に戻す。不正な値の場合は None """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        rank, ts_text, id_text = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|', 2)
+        return int(rank), datetime.datetime.fromisoformat(ts_text), int(id_text)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+
+
+def triage_page(status=None, category=None, priority=None, cursor=None, limit=DEFAULT_TRIAGE_PAGE_SIZE):
+    """
+    支援要請を 優先度 (priority_rank 昇順) → 新しい順 に並べたキューから 1 ページ分を返す。
+    (status, priority_rank, timestamp DESC, id DESC) のインデックス順に読むだけなので、
+    未対応の要請が何件溜まっていても先頭ページはすぐに返る。
+    戻り値は (reports, next_cursor)。
+    """
+    query = SupportRequest.query.options(db.joinedload(SupportRequest.author))
+    if status:
+        query = query.filter(SupportRequest.status == status)
+    if category:
+        query = query.filter(SupportRequest.category == category)
+    if priority:
+        query = query.filter(SupportRequest.priority_rank == PRIORITY_RANKS[priority])
+
+    position = decode_triage_cursor(cursor)
+    if position is not None:
+        rank, ts, row_id = position
+        query = query.filter(db.or_(
+            SupportRequest.priority_rank > rank,
+            db.and_(SupportRequest.priority_rank == rank,
+                    db.tuple_(SupportRequest.timestamp, SupportRequest.id) < (ts, row_id)),
+        ))
+
+    reports = query.order_by(SupportRequest.priority_rank.asc(), SupportRequest.timestamp.desc(),
+                             SupportRequest.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(reports) > limit:
+        reports = reports[:limit]
+        next_cursor = encode_triage_cursor(reports[-1])
+    return reports, next_cursor
@@ -0,0 +1,15 @@
+"""
+本番用のエントリポイント (gunicorn -c gunicorn.conf.py)。APP_CONFIG の既定は production。
+"""
+import os
+
+from app import create_app
+from models import db
+
+app = create_app(os.environ.get('APP_CONFIG', 'production'))
+
+# preload_app でワーカーを fork する前に、起動処理で開いた DB 接続を閉じておく
+# (SQLite の接続を親子のプロセスで共有しない。各ワーカーは最初のリクエストで接続を開く)
+with app.app_context():
+    for engine in db.engines.values():
+        engine.dispose()